@@ -0,0 +1,5 @@
+"""
+Synthetic data and micro-benchmarks for the parser, the selection logic and data storage.
+
+Run with: python -m benchmarks.run --help
+"""
@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from sustituciones_app import data_manager
+from sustituciones_app.pdf_processor import parse_schedule_pdf
+from sustituciones_app.substitution_logic import (build_availability_index, find_available_teachers,
+                                                  select_teacher_for_substitution)
+
+from .synthetic import DAYS, TIME_SLOTS, generate_schedules, write_schedule_pdf
+
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_SEED = 0
+
+MIN_MEASUREMENT_SECONDS = 0.02 # Fast calls are repeated until a measurement lasts at least this long
+
+def _measure(function, repeat, number=None):
+    """
+    Times a function.
+
+    Args:
+        function (callable): Called with no arguments.
+        repeat (int): Number of measurements.
+        number (int, optional): Calls per measurement. By default it is calibrated, as timeit
+            does, so that a measurement lasts at least MIN_MEASUREMENT_SECONDS.
+
+    Returns:
+        dict: Best and median seconds per call, plus the repeat and number used.
+    """
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            if time.perf_counter() - start >= MIN_MEASUREMENT_SECONDS:
+                break
+            number *= 2
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        runs.append((time.perf_counter() - start) / number)
+    return {'best': min(runs), 'median': statistics.median(runs), 'repeat': repeat, 'number': number}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_parse_schedule_pdf(schedules_data, work_dir, repeat, workers):
+    """Parses a synthetic PDF with one page per teacher, without the page cache."""
+    pdf_path = os.path.join(work_dir, "horarios.pdf")
+    write_schedule_pdf(schedules_data, pdf_path)
+    results = {'serial': _measure(lambda: parse_schedule_pdf(pdf_path, workers=1), repeat, number=1)}
+    results['serial_learned_layout'] = _measure(lambda: parse_schedule_pdf(pdf_path, workers=1, learn_layout=True),
+                                                repeat, number=1)
+    if workers > 1:
+        results['parallel'] = _measure(lambda: parse_schedule_pdf(pdf_path, workers=workers), repeat, number=1)
+        results['parallel']['workers'] = workers
+    return results
+
+def bench_find_available_teachers(schedules_data, repeat):
+    """Looks up every (day, slot) of the week, with a full scan and with the availability index."""
+    slots = [(day, time_slot) for day in DAYS for time_slot in TIME_SLOTS]
+    index = build_availability_index(schedules_data)
+
+    def scan():
+        for day, time_slot in slots:
+            find_available_teachers(schedules_data, day, time_slot)
+
+    def lookup():
+        for day, time_slot in slots:
+            find_available_teachers(schedules_data, day, time_slot, availability_index=index)
+
+    return {
+        'scan_week': _measure(scan, repeat),
+        'indexed_week': _measure(lookup, repeat),
+        'build_index': _measure(lambda: build_availability_index(schedules_data), repeat),
+    }
+
+def bench_select_teacher(schedules_data, repeat):
+    """Selects a substitute among every teacher, with counts for all of them."""
+    names = [teacher_info['teacher_name'] for teacher_info in schedules_data]
+    counts = {name: number % 7 for number, name in enumerate(names)}
+    return {'all_teachers': _measure(lambda: select_teacher_for_substitution(names, counts), repeat)}
+
+def bench_data_manager(schedules_data, work_dir, repeat):
+    """Saves and loads schedules and counts through data_manager, in a scratch data directory."""
+    names = [teacher_info['teacher_name'] for teacher_info in schedules_data]
+    counts = {name: number % 7 for number, name in enumerate(names)}
+    previous_data_dir = data_manager.DATA_DIR
+    data_manager.DATA_DIR = work_dir
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # Silence the "saved to" messages
+            def cold_load():
+                data_manager.clear_cache()
+                data_manager.load_schedules()
+
+            results = {
+                'save_schedules': _measure(lambda: data_manager.save_schedules(schedules_data), repeat),
+                'load_schedules_cold': _measure(cold_load, repeat),
+                'load_schedules_cached': _measure(data_manager.load_schedules, repeat),
+                'save_counts': _measure(lambda: data_manager.save_substitution_counts(counts), repeat),
+                'increment_counts': _measure(lambda: data_manager.increment_substitution_counts({names[0]: 1}),
+                                             repeat),
+            }
+        results['schedules_bytes'] = os.path.getsize(os.path.join(work_dir, "horarios.json"))
+    finally:
+        data_manager.clear_cache()
+        data_manager.DATA_DIR = previous_data_dir
+    return results
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=5, pdf_repeat=1, workers=None, seed=DEFAULT_SEED,
+                   include_pdf=True):
+    """
+    Runs every benchmark on synthetic timetables of each size.
+
+    Args:
+        sizes (tuple, optional): Teacher counts. Defaults to (10, 100, 1000).
+        repeat (int, optional): Measurements of each in-memory benchmark. Defaults to 5.
+        pdf_repeat (int, optional): Measurements of each PDF parse. Defaults to 1.
+        workers (int, optional): Worker processes for the parallel parse. Defaults to the CPU count.
+        seed (int, optional): Seed of the synthetic data. Defaults to 0.
+        include_pdf (bool, optional): Whether to generate and parse PDFs. Defaults to True.
+
+    Returns:
+        dict: Environment details and results by teacher count.
+    """
+    workers = workers or os.cpu_count() or 1
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'results': {},
+    }
+    for teacher_count in sizes:
+        print(f"Benchmarking {teacher_count} teachers...")
+        schedules_data = generate_schedules(teacher_count, seed)
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = {
+                'find_available_teachers': bench_find_available_teachers(schedules_data, repeat),
+                'select_teacher_for_substitution': bench_select_teacher(schedules_data, repeat),
+                'data_manager': bench_data_manager(schedules_data, work_dir, repeat),
+            }
+            if include_pdf:
+                results['parse_schedule_pdf'] = bench_parse_schedule_pdf(schedules_data, work_dir, pdf_repeat,
+                                                                         workers)
+        report['results'][str(teacher_count)] = results
+    return report
+
+def _flatten(results, prefix=""):
+    """Yields (name, best seconds) for every timing in a results tree."""
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and 'best' in value:
+            yield name, value['best']
+        elif isinstance(value, dict):
+            yield from _flatten(value, f"{name}.")
+
+def compare_reports(baseline, current, threshold=1.2):
+    """
+    Compares the best times of two reports.
+
+    Args:
+        baseline (dict): An earlier report.
+        current (dict): The new report.
+        threshold (float, optional): Ratio above which a timing counts as a regression. Defaults to 1.2.
+
+    Returns:
+        list: (name, baseline seconds, current seconds, ratio, is_regression) for timings in both.
+    """
+    baseline_times = dict(_flatten(baseline.get('results', {})))
+    comparison = []
+    for name, seconds in _flatten(current.get('results', {})):
+        if name in baseline_times and baseline_times[name] > 0:
+            ratio = seconds / baseline_times[name]
+            comparison.append((name, baseline_times[name], seconds, ratio, ratio > threshold))
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the parser, selection and storage benchmarks.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Teacher counts.")
+    parser.add_argument('--repeat', type=int, default=5, help="Measurements of each in-memory benchmark.")
+    parser.add_argument('--pdf-repeat', type=int, default=1, help="Measurements of each PDF parse.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for the parallel parse.")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--no-pdf', action='store_true', help="Skip PDF generation and parsing.")
+    parser.add_argument('--output', default=None, help="JSON file for the results (default: benchmark_<time>.json).")
+    parser.add_argument('--baseline', default=None, help="Earlier results to compare against.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.repeat, args.pdf_repeat, args.workers, args.seed, not args.no_pdf)
+    output = args.output or f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, before, after, ratio, is_regression in compare_reports(baseline, report):
+            marker = "  REGRESSION" if is_regression else ""
+            print(f"{name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({ratio:.2f}x){marker}")
+            regressions += is_regression
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
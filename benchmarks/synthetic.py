@@ -0,0 +1,124 @@
+import json
+import random
+
+import fitz  # PyMuPDF
+
+DAYS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+TIME_SLOTS = ["08:00-09:00", "09:00-10:00", "10:00-11:00", "11:00-12:00", "12:00-13:00", "13:00-14:00"]
+SUBJECTS = ["Matemáticas", "Lengua", "Historia", "Inglés", "Ciencias", "Música"]
+
+# Share of the cells of a timetable that are classes, refuerzo/guardia, or empty
+CLASS_RATE = 0.6
+AVAILABLE_RATE = 0.2
+
+def generate_schedules(teacher_count, seed=0):
+    """
+    Generates random teacher schedules in the format produced by parse_schedule_pdf.
+
+    The same teacher_count and seed always give the same schedules.
+
+    Args:
+        teacher_count (int): Number of teachers.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list: Teacher schedule dictionaries.
+    """
+    rng = random.Random(seed)
+    schedules_data = []
+    for teacher_number in range(teacher_count):
+        schedule = {day: [] for day in DAYS}
+        for day in DAYS:
+            for time_slot in TIME_SLOTS:
+                roll = rng.random()
+                if roll < CLASS_RATE:
+                    schedule[day].append({'time': time_slot, 'subject': rng.choice(SUBJECTS), 'type': 'clase'})
+                elif roll < CLASS_RATE + AVAILABLE_RATE:
+                    subject = rng.choice(["GUARDIA", "REFUERZO"])
+                    schedule[day].append({'time': time_slot, 'subject': subject, 'type': 'refuerzo'})
+        schedules_data.append({'teacher_name': f"Profesor {teacher_number:04d}", 'schedule': schedule})
+    return schedules_data
+
+def write_schedules_json(schedules_data, json_path):
+    """Writes schedules as a horarios.json-style file."""
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(schedules_data, f, ensure_ascii=False, indent=4)
+
+def write_schedule_pdf(schedules_data, pdf_path):
+    """
+    Writes one timetable page per teacher, in the layout process_teacher_schedule_from_page expects.
+
+    Each page has a "Profesor: <name>" line above a ruled table whose header row is
+    "Hora" followed by the weekdays, with one row per time slot.
+
+    Args:
+        schedules_data (list): Teacher schedule dictionaries (e.g. from generate_schedules).
+        pdf_path (str): Path of the PDF to write.
+    """
+    x0, y0, column_width, row_height = 40, 80, 90, 30
+    doc = fitz.open()
+    for teacher_info in schedules_data:
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Profesor: {teacher_info['teacher_name']}", fontsize=12)
+        cells = {(day, activity['time']): activity['subject']
+                 for day, day_schedule in teacher_info['schedule'].items() for activity in day_schedule}
+        rows = [["Hora"] + DAYS] + [[time_slot] + [cells.get((day, time_slot), "") for day in DAYS]
+                                     for time_slot in TIME_SLOTS]
+        for row_number, row in enumerate(rows):
+            for column_number, text in enumerate(row):
+                rect = fitz.Rect(x0 + column_number * column_width, y0 + row_number * row_height,
+                                 x0 + (column_number + 1) * column_width, y0 + (row_number + 1) * row_height)
+                page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+                if text:
+                    page.insert_textbox(rect + (3, 3, -3, -3), text, fontsize=9)
+    doc.save(pdf_path)
+    doc.close()
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    from sustituciones_app import pdf_processor
+    from sustituciones_app.pdf_processor import iter_schedule_pdf, parse_schedule_pdf
+
+    if len(sys.argv) == 3:
+        # python -m benchmarks.synthetic <teachers> <output_dir>
+        teacher_count, output_dir = int(sys.argv[1]), sys.argv[2]
+        os.makedirs(output_dir, exist_ok=True)
+        schedules = generate_schedules(teacher_count)
+        write_schedule_pdf(schedules, os.path.join(output_dir, "horarios.pdf"))
+        write_schedules_json(schedules, os.path.join(output_dir, "horarios.json"))
+        print(f"Wrote {teacher_count} synthetic timetables to {output_dir}/horarios.pdf and horarios.json")
+        sys.exit(0)
+
+    print("Testing synthetic.py...")
+    schedules = generate_schedules(3, seed=1)
+    assert schedules == generate_schedules(3, seed=1), "Generation is not repeatable"
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "horarios.pdf")
+        write_schedule_pdf(schedules, pdf_path)
+        parsed = parse_schedule_pdf(pdf_path, workers=1)
+        report = {}
+        parsed_with_layout = parse_schedule_pdf(pdf_path, workers=1, report=report, learn_layout=True)
+        streamed = list(iter_schedule_pdf(pdf_path, learn_layout=True))
+
+        # A page that fails is skipped and reported; the stream goes on with the next ones
+        process_page = pdf_processor.process_teacher_schedule_from_page
+        def failing_second_page(page_text, page_tables):
+            if schedules[1]['teacher_name'] in page_text:
+                raise ValueError("Tabla ilegible")
+            return process_page(page_text, page_tables)
+        pdf_processor.process_teacher_schedule_from_page = failing_second_page
+        stream_report = {}
+        try:
+            streamed_with_failure = list(iter_schedule_pdf(pdf_path, report=stream_report))
+        finally:
+            pdf_processor.process_teacher_schedule_from_page = process_page
+    # The parser reads back exactly the generated schedules, also through a learned table layout
+    assert parsed == schedules, (parsed, schedules)
+    assert parsed_with_layout == schedules and report['layout']['layout_pages'] == 2, report
+    assert streamed == schedules
+    assert streamed_with_failure == [schedules[0], schedules[2]]
+    assert stream_report['failed_pages'] == [{'page': 2, 'error': "Tabla ilegible"}], stream_report
+    print("\nSynthetic data tests completed.")
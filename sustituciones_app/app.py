@@ -1,84 +1,373 @@
 import os
+import json
+import uuid
 import datetime # Added import
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import functools
+import hashlib
+import time
+from flask import (Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, session,
+                   jsonify, abort, make_response, get_flashed_messages, stream_with_context)
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
 
-from .pdf_processor import parse_schedule_pdf
-from .data_manager import save_schedules, load_schedules, load_substitution_counts
-from .substitution_logic import find_available_teachers, select_teacher_for_substitution, record_substitution
-
-app = Flask(__name__)
-app.secret_key = 'os_is_usually_good_enough_for_dev_but_change_this_for_prod' # Replace in production
-UPLOAD_FOLDER = 'sustituciones_app/uploads'
-ALLOWED_EXTENSIONS = {'pdf'}
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Ensure the upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+from . import live_feed, metrics
+from .ingestion_jobs import (submit_ingestion_job, submit_batch_ingestion_job, get_job_status,
+                             configure_ingestion_workers, apply_ingestion_job, discard_ingestion_job,
+                             IngestionBusyError, IngestionReviewError, MAX_BATCH_FILES)
+from .data_manager import (load_schedules, load_substitution_counts, load_teacher_names, get_available_teachers,
+                           load_teacher_weights, configure_storage, DEFAULT_DATA_DIR, configure_data_dir,
+                           configure_cache, prewarm_caches, select_schedule_set, get_schedule_set,
+                           schedule_set_exists, list_schedule_sets, create_schedule_set, get_data_versions)
+from .fragment_cache import DEFAULT_MAX_ENTRIES as DEFAULT_FRAGMENT_CACHE_ENTRIES, configure_fragment_cache, get_fragment_cache
+from .event_log import append_substitution_event, query_events
+from .batch_planner import (find_absence_slots, plan_absence, validate_absence_plan, commit_absence_plan,
+                            WEEKDAY_NAMES)
+from .substitution_logic import select_teacher_for_substitution, answer_availability_queries
+from .fairness import suggest_substitute, window_days_for
+from .time_slots import FRANJAS_HORARIAS, canonical_time
+
+ALLOWED_EXTENSIONS = {'pdf', 'zip'} # ZIP archives of PDFs are uploaded as a batch
+DEFAULT_UPLOAD_FOLDER = 'sustituciones_app/uploads'
+
+# Views and request hooks of the application, registered on each app built by create_app
+bp = Blueprint('sustituciones', __name__)
+
+def _default_config():
+    """Returns the settings of the app, read from environment variables where they can be set."""
+    return {
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'os_is_usually_good_enough_for_dev_but_change_this_for_prod'), # Replace in production
+        # Where the data (schedules, counts, schedule sets) and the uploaded PDFs being processed are stored
+        'DATA_DIR': os.environ.get('DATA_DIR', DEFAULT_DATA_DIR),
+        'UPLOAD_FOLDER': os.environ.get('UPLOAD_FOLDER', DEFAULT_UPLOAD_FOLDER),
+        # 'json' (default) or 'sqlite'; migrate existing JSON data with: python -m sustituciones_app.sqlite_store migrate
+        'STORAGE_BACKEND': os.environ.get('STORAGE_BACKEND', 'json'),
+        # Worker processes used to parse large schedule PDFs in parallel (1 = always serial)
+        'PDF_PARSE_WORKERS': int(os.environ.get('PDF_PARSE_WORKERS', os.cpu_count() or 1)),
+        # Reuse the table position and grid learned from one page on the next ones instead of detecting it on each page
+        'PDF_LEARN_LAYOUT': os.environ.get('PDF_LEARN_LAYOUT', '1') != '0',
+        # Parse results of individual PDF pages, reused when the same timetable page is uploaded again.
+        # None: a 'page_cache' directory inside DATA_DIR.
+        'PAGE_CACHE_DIR': os.environ.get('PAGE_CACHE_DIR') or None,
+        'PAGE_CACHE_MAX_BYTES': 50 * 1024 * 1024,
+        # Background threads that process uploaded PDFs (uploads themselves are handled one at a time)
+        'INGESTION_WORKERS': 1,
+        # Period the suggested substitute is balanced over: unset (lifetime counts), 'week', 'month' or 'term'.
+        # Per-teacher weights, if any, are read from pesos_profesores.json in the data directory of each schedule set.
+        'FAIRNESS_WINDOW': os.environ.get('FAIRNESS_WINDOW') or None,
+        # Request latency, PDF parsing stage and JSON I/O metrics, served on /metrics in Prometheus format.
+        # When disabled nothing is measured and /metrics doesn't exist.
+        'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        # Approximate memory of parsed schedules and counts kept in memory across all schedule sets
+        # (school/term); the least recently used sets are dropped first and re-read from disk when used again.
+        'DATA_CACHE_MAX_BYTES': int(os.environ.get('DATA_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+        # Rendered page fragments (teacher and slot selectors, counts table) kept per process; 0 disables them
+        'FRAGMENT_CACHE_MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', DEFAULT_FRAGMENT_CACHE_ENTRIES)),
+        # How Ver Sustituciones gets new substitutions without reloading: 'poll' (default) asks
+        # /eventos/cambios every LIVE_POLL_SECONDS and works with any worker; 'stream' keeps an SSE
+        # connection (/eventos) open, which holds a worker thread per open page, so only use it with
+        # an asynchronous worker (gunicorn -k gevent); 'off' disables both.
+        'LIVE_UPDATES': os.environ.get('LIVE_UPDATES', 'poll'),
+        'LIVE_POLL_SECONDS': float(os.environ.get('LIVE_POLL_SECONDS', 5)),
+        # Load the schedules and counts of every schedule set into memory before serving requests
+        'PREWARM_CACHES': os.environ.get('PREWARM_CACHES', '').lower() in ('1', 'true', 'yes'),
+    }
+
+def _lap(timings, step, started):
+    """Records the time elapsed since started under an initialization step and returns the current time."""
+    now = time.perf_counter()
+    timings[step] = now - started
+    return now
+
+def create_app(config=None):
+    """
+    Builds the application. 'flask run' finds it through FLASK_APP=sustituciones_app.app, and
+    WSGI servers call it once per worker, e.g. gunicorn "sustituciones_app.app:create_app()".
+
+    Importing this module loads only what pages need: PyMuPDF is imported on the first
+    upload and numpy on the first coverage page. Data settings (directory, storage backend,
+    cache budget) are process-wide, so a process serves one app.
+
+    Args:
+        config (dict, optional): Settings overriding the defaults and environment variables
+            (see _default_config), e.g. {'DATA_DIR': '/srv/sustituciones', 'PREWARM_CACHES': True}.
+
+    Returns:
+        flask.Flask: The application. app.config['STARTUP_SECONDS'] holds the seconds spent in
+            each initialization step.
+    """
+    timings = {}
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config.update(_default_config())
+    app.config.update(config or {})
+    if app.config['PAGE_CACHE_DIR'] is None:
+        app.config['PAGE_CACHE_DIR'] = os.path.join(app.config['DATA_DIR'], 'page_cache')
+    started = _lap(timings, 'config', started)
+
+    configure_data_dir(app.config['DATA_DIR'])
+    configure_storage(app.config['STORAGE_BACKEND'])
+    configure_cache(app.config['DATA_CACHE_MAX_BYTES'])
+    configure_fragment_cache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+    configure_ingestion_workers(app.config['INGESTION_WORKERS'])
+    window_days_for(app.config['FAIRNESS_WINDOW']) # Fail at startup on an unknown window name
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    started = _lap(timings, 'configure', started)
+
+    if app.config['METRICS_ENABLED']:
+        metrics.enable_metrics()
+        metrics.instrument_app(app)
+    app.register_blueprint(bp)
+    started = _lap(timings, 'routes', started)
+
+    if app.config['PREWARM_CACHES']:
+        prewarm_caches()
+        started = _lap(timings, 'prewarm', started)
+    app.config['STARTUP_SECONDS'] = timings
+    return app
 
 DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
-FRANJAS_HORARIAS = ["08:00-09:00", "09:00-10:00", "10:00-11:00", "11:00-12:00", "12:00-13:00", "13:00-14:00", "14:00-15:00"] # Extended example
+MAX_DIAS_PLANIFICACION = 31 # Longest absence that can be planned in one go
+MAX_CONSULTAS_DISPONIBILIDAD = 5000 # Queries accepted by one /api/disponibilidad request
+
+# Templates and code a page is rendered with: a deploy changes the ETags even if the data didn't.
+# The same in every worker process started from the same files.
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RENDER_STAMP = max(os.stat(os.path.join(directory, name)).st_mtime_ns
+                   for directory in (_APP_DIR, os.path.join(_APP_DIR, 'templates'))
+                   for name in os.listdir(directory) if name.endswith(('.py', '.html')))
+
+def conditional_page(*kinds):
+    """
+    Decorator for GET pages built only from the given kinds of data ('schedules', 'counts').
+
+    The page gets a strong ETag and a Last-Modified header derived from the version stamps
+    of that data, and a request whose validators still match gets a 304 before the view
+    runs, so neither the data nor the template are touched. Pages carrying flashed
+    messages are never validated, as the messages are shown only once.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+            epoch, versions = get_data_versions()
+            if epoch is None: # Nothing saved yet in this schedule set
+                return view(*args, **kwargs)
+            token = "|".join([epoch, get_schedule_set() or "", str(RENDER_STAMP), str(datetime.date.today().year),
+                              request.full_path] + [str(versions[kind][0]) for kind in kinds])
+            etag = hashlib.sha1(token.encode('utf-8')).hexdigest()
+            last_modified = datetime.datetime.fromtimestamp(max(versions[kind][1] for kind in kinds) / 1e9,
+                                                            tz=datetime.timezone.utc).replace(microsecond=0)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or get_flashed_messages():
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True # Always revalidate
+            return response
+        return wrapper
+    return decorator
+
+def render_fragment(name, template_name, kinds, load_context, **params):
+    """
+    Renders a partial template through the process-wide fragment cache, ready to insert in a page.
+
+    Fragments are cached per schedule set, per version of the given kinds of data and per
+    params, so a template must be rendered only from the data load_context returns and from
+    the params. load_context is only called on a miss, when the fragment is rendered.
+
+    Args:
+        name (str): Fragment name, for the hit rate statistics.
+        template_name (str): The partial template.
+        kinds (tuple): Kinds of data the fragment is built from ('schedules', 'counts'); empty for constants.
+        load_context (callable): Returns the template variables loaded from that data.
+        **params: Other template variables (hashable), e.g. the selected option.
+
+    Returns:
+        Markup: The rendered fragment, stripped (empty if it renders only whitespace).
+    """
+    def render():
+        return render_template(template_name, **load_context(), **params).strip()
+
+    key = (str(RENDER_STAMP),) + tuple(sorted(params.items()))
+    if kinds:
+        epoch, versions = get_data_versions()
+        if epoch is None: # Nothing saved yet in this schedule set: no versions to key on
+            return Markup(render())
+        key += (epoch, get_schedule_set() or "") + tuple(versions[kind][0] for kind in kinds)
+    return Markup(get_fragment_cache().get_or_render(name, key, render))
+
+def teacher_options(selected=None):
+    """Returns the cached <option> list of the teachers of the selected schedule set (empty if there are none)."""
+    return render_fragment('profesores', 'fragmentos/opciones.html', ('schedules',),
+                           lambda: {'opciones': load_teacher_names()}, seleccionado=selected)
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+@bp.before_app_request
+def select_request_schedule_set():
+    # Every request works on the schedule set chosen in /conjuntos (the default data if none)
+    name = session.get('conjunto')
+    if not schedule_set_exists(name):
+        session.pop('conjunto', None)
+        name = None
+    select_schedule_set(name)
+
+@bp.teardown_app_request
+def reset_request_schedule_set(exception=None):
+    select_schedule_set(None) # Worker threads are reused across requests
+
+@bp.route('/')
 def index_route():
     return render_template('index.html')
 
-@app.route('/cargar_horarios', methods=['GET', 'POST'])
+@bp.route('/cargar_horarios', methods=['GET', 'POST'])
 def cargar_horarios_route():
     if request.method == 'POST':
         if 'schedule_pdf' not in request.files:
             flash('No se encontró el campo del archivo en la solicitud.', 'error')
             return redirect(request.url)
 
-        file = request.files['schedule_pdf']
+        # Several PDFs (one per department) or ZIP archives of them are parsed together as a batch
+        files = [file for file in request.files.getlist('schedule_pdf') if file.filename]
 
-        if file.filename == '':
+        if not files:
             flash('Ningún archivo seleccionado.', 'error')
             return redirect(request.url)
-
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-            try:
-                file.save(pdf_path)
-                flash(f"Archivo '{filename}' subido correctamente. Procesando...", 'success')
-
-                schedules_data = parse_schedule_pdf(pdf_path)
-
-                if not schedules_data:
-                    flash(f"No se pudo extraer ningún horario del PDF '{filename}'. Verifique el formato del archivo o que no esté vacío/corrupto.", 'error')
-                    return redirect(request.url)
-
-                save_schedules(schedules_data)
-                flash(f"Horarios procesados y guardados correctamente desde '{filename}'. Se encontraron {len(schedules_data)} horarios.", 'success')
-
-                return redirect(url_for('cargar_horarios_route'))
-
-            except Exception as e:
-                flash(f"Ocurrió un error al procesar el archivo '{filename}': {e}", 'error')
-                return redirect(request.url)
-        else:
-            flash('Tipo de archivo no permitido. Por favor, sube un archivo PDF.', 'error')
+        if not all(allowed_file(file.filename) for file in files):
+            flash('Tipo de archivo no permitido. Por favor, sube archivos PDF o un archivo ZIP con PDFs.', 'error')
+            return redirect(request.url)
+        if len(files) > MAX_BATCH_FILES:
+            flash(f"Se pueden subir como máximo {MAX_BATCH_FILES} archivos a la vez.", 'error')
             return redirect(request.url)
 
-    return render_template('cargar_horarios.html')
-
-@app.route('/solicitar_sustitucion', methods=['GET', 'POST'])
+        uploads = []
+        job_id = None
+        try:
+            for file in files:
+                extension = file.filename.rsplit('.', 1)[1].lower()
+                filename = secure_filename(file.filename)
+                if not filename.lower().endswith(f".{extension}"): # The batch tells PDFs and ZIPs apart by it
+                    filename = f"{filename or 'archivo'}.{extension}"
+                # Unique name so a new upload never overwrites a file that is still being parsed
+                upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+                file.save(upload_path)
+                uploads.append((upload_path, filename))
+            parse_options = {
+                'workers': current_app.config['PDF_PARSE_WORKERS'],
+                'cache_dir': current_app.config['PAGE_CACHE_DIR'],
+                'cache_max_bytes': current_app.config['PAGE_CACHE_MAX_BYTES'],
+                'learn_layout': current_app.config['PDF_LEARN_LAYOUT'],
+            }
+            if len(uploads) == 1 and filename.lower().endswith('.pdf'):
+                job_id = submit_ingestion_job(upload_path, filename, parse_options)
+            else:
+                job_id = submit_batch_ingestion_job(uploads, parse_options)
+        except IngestionBusyError:
+            flash("Ya se está procesando otro archivo de horarios. Espera a que termine e inténtalo de nuevo.", 'error')
+            return redirect(request.url)
+        except Exception as e:
+            flash(f"Ocurrió un error al procesar el archivo '{filename}': {e}", 'error')
+            return redirect(request.url)
+        finally:
+            if job_id is None: # Not handed to an ingestion job, which removes them once processed
+                for upload_path, _ in uploads:
+                    try:
+                        os.remove(upload_path)
+                    except OSError:
+                        pass
+
+        if len(uploads) == 1:
+            flash(f"Archivo '{filename}' subido correctamente. Procesando en segundo plano...", 'success')
+        else:
+            flash(f"{len(uploads)} archivos subidos correctamente. Procesando en segundo plano...", 'success')
+        return redirect(url_for('.cargar_horarios_route', job=job_id))
+
+    job = get_job_status(request.args.get('job')) if request.args.get('job') else None
+    return render_template('cargar_horarios.html', job=job, job_id=job['job_id'] if job else None)
+
+@bp.route('/cargar_horarios/aplicar/<job_id>', methods=['POST'])
+def aplicar_carga_route(job_id):
+    job = get_job_status(job_id)
+    if job is None:
+        abort(404)
+    # Checked suggestions, by their position in the diff
+    suggested = (job.get('diff') or {}).get('renamed', [])
+    renames = {suggested[int(i)]['old_name']: suggested[int(i)]['new_name']
+               for i in request.form.getlist('renombrar') if i.isdigit() and int(i) < len(suggested)}
+    try:
+        job = apply_ingestion_job(job_id, renames)
+    except IngestionReviewError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.cargar_horarios_route', job=job_id))
+    if job['status'] == 'succeeded':
+        applied = job['applied']
+        flash(f"Horarios actualizados: {applied['added']} profesores nuevos, {applied['changed']} modificados, "
+              f"{applied['removed']} eliminados y {applied['renamed']} renombrados.", 'success')
+    else:
+        flash(f"No se pudieron aplicar los horarios: {job['error']}", 'error')
+    return redirect(url_for('.cargar_horarios_route', job=job_id))
+
+@bp.route('/cargar_horarios/descartar/<job_id>', methods=['POST'])
+def descartar_carga_route(job_id):
+    if get_job_status(job_id) is None:
+        abort(404)
+    try:
+        discard_ingestion_job(job_id)
+        flash("Carga descartada. Los horarios guardados no han cambiado.", 'success')
+    except IngestionReviewError as e:
+        flash(str(e), 'error')
+    return redirect(url_for('.cargar_horarios_route'))
+
+@bp.route('/cargar_horarios/estado/<job_id>', methods=['GET'])
+def estado_carga_route(job_id):
+    job = get_job_status(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+def slot_date(fecha, dia_semana):
+    """
+    Parses the date of a substitution requested for a day of the week.
+
+    Args:
+        fecha (str): The date sent by the form, as YYYY-MM-DD.
+        dia_semana (str): The day of the week of the slot (e.g. "Lunes").
+
+    Returns:
+        datetime.date: The date, or None if it's not a valid date falling on dia_semana.
+    """
+    try:
+        date = datetime.date.fromisoformat(fecha or '')
+    except ValueError:
+        return None
+    if date.weekday() >= len(WEEKDAY_NAMES) or WEEKDAY_NAMES[date.weekday()] != dia_semana:
+        return None
+    return date
+
+MENSAJE_FECHA_INVALIDA = "La fecha debe tener el formato AAAA-MM-DD y caer en el día de la semana elegido."
+
+@bp.route('/solicitar_sustitucion', methods=['GET', 'POST'])
+@conditional_page('schedules')
 def solicitar_sustitucion_route():
     if request.method == 'POST':
         profesor_ausente = request.form.get('profesor_ausente')
         dia_semana = request.form.get('dia_semana')
         franja_horaria = request.form.get('franja_horaria')
+        fecha = request.form.get('fecha')
 
-        if not all([profesor_ausente, dia_semana, franja_horaria]):
+        if not all([profesor_ausente, dia_semana, franja_horaria, fecha]):
             flash('Todos los campos son requeridos.', 'error')
-            return redirect(url_for('solicitar_sustitucion_route'))
+            return redirect(url_for('.solicitar_sustitucion_route'))
+        if slot_date(fecha, dia_semana) is None:
+            flash(MENSAJE_FECHA_INVALIDA, 'error')
+            return redirect(url_for('.solicitar_sustitucion_route'))
 
         # Store in session for more robustness if many parameters or sensitive data
         # session['substitution_request'] = {
@@ -86,106 +375,325 @@ def solicitar_sustitucion_route():
         #     'dia_semana': dia_semana,
         #     'franja_horaria': franja_horaria
         # }
-        # return redirect(url_for('confirmar_sustitucion_route'))
+        # return redirect(url_for('.confirmar_sustitucion_route'))
 
         # Using query parameters for simplicity as requested
-        return redirect(url_for('confirmar_sustitucion_route',
+        return redirect(url_for('.confirmar_sustitucion_route',
                                 profesor_ausente=profesor_ausente,
                                 dia_semana=dia_semana,
-                                franja_horaria=franja_horaria))
+                                franja_horaria=franja_horaria,
+                                fecha=fecha))
 
     # GET request
-    schedules = load_schedules()
-    if not schedules:
+    profesores = teacher_options()
+    if not profesores:
         flash("No hay horarios cargados. Por favor, carga primero un archivo de horarios.", "warning")
-        # return redirect(url_for('cargar_horarios_route')) # Or render with a message
-
-    teacher_names = sorted(list(set(s.get('teacher_name', 'Nombre Desconocido') for s in schedules if s.get('teacher_name'))))
+        # return redirect(url_for('.cargar_horarios_route')) # Or render with a message
 
     return render_template('solicitar_sustitucion.html',
-                           profesores=teacher_names,
-                           dias_semana=DIAS_SEMANA,
-                           franjas_horarias=FRANJAS_HORARIAS)
-
-from .data_manager import save_schedules, load_schedules, load_substitution_counts, save_substitution_counts
+                           profesores=profesores,
+                           dias_semana=render_fragment('dias', 'fragmentos/opciones.html', (),
+                                                       lambda: {'opciones': DIAS_SEMANA}),
+                           franjas_horarias=render_fragment('franjas', 'fragmentos/opciones.html', (),
+                                                            lambda: {'opciones': FRANJAS_HORARIAS}))
 
-@app.route('/confirmar_sustitucion', methods=['GET', 'POST'])
+@bp.route('/confirmar_sustitucion', methods=['GET', 'POST'])
 def confirmar_sustitucion_route():
     if request.method == 'POST':
         profesor_ausente_original = request.form.get('profesor_ausente_original')
         dia_original = request.form.get('dia_original')
         hora_original = request.form.get('hora_original')
+        fecha_original = request.form.get('fecha_original')
         profesor_seleccionado = request.form.get('profesor_seleccionado')
 
         if not profesor_seleccionado:
             flash("Debes seleccionar un profesor para realizar la sustitución.", "error")
             # Need to repopulate GET context if redirecting back to confirm page
-            return redirect(url_for('confirmar_sustitucion_route',
+            return redirect(url_for('.confirmar_sustitucion_route',
                                     profesor_ausente=profesor_ausente_original,
                                     dia_semana=dia_original,
-                                    franja_horaria=hora_original))
+                                    franja_horaria=hora_original,
+                                    fecha=fecha_original))
 
-        current_counts = load_substitution_counts()
-        updated_counts = record_substitution(profesor_seleccionado, current_counts)
-        save_substitution_counts(updated_counts)
+        # The event is dated on the covered slot, not on the day it's confirmed, for the period counts
+        fecha = slot_date(fecha_original, dia_original)
+        if fecha is None:
+            flash(MENSAJE_FECHA_INVALIDA, "error")
+            return redirect(url_for('.solicitar_sustitucion_route'))
+        append_substitution_event(profesor_ausente_original, profesor_seleccionado, dia_original, hora_original,
+                                  date=fecha)
 
-        flash(f"Sustitución asignada a '{profesor_seleccionado}' para el {dia_original} de {hora_original} (ausencia de {profesor_ausente_original}).", "success")
-        return redirect(url_for('solicitar_sustitucion_route')) # Or a new page like 'ver_sustituciones'
+        flash(f"Sustitución asignada a '{profesor_seleccionado}' para el {dia_original} {fecha.strftime('%d/%m/%Y')} de {hora_original} (ausencia de {profesor_ausente_original}).", "success")
+        return redirect(url_for('.solicitar_sustitucion_route')) # Or a new page like 'ver_sustituciones'
 
     # GET request
     profesor_ausente = request.args.get('profesor_ausente')
     dia_semana = request.args.get('dia_semana')
-    franja_horaria = request.args.get('franja_horaria')
+    franja_horaria = canonical_time(request.args.get('franja_horaria'))
+    fecha = request.args.get('fecha')
 
-    if not all([profesor_ausente, dia_semana, franja_horaria]):
-        flash("Faltan datos para confirmar la sustitución (profesor ausente, día o franja). Por favor, inténtalo de nuevo desde 'Solicitar Sustitución'.", "error")
-        return redirect(url_for('solicitar_sustitucion_route'))
+    if not all([profesor_ausente, dia_semana, franja_horaria, fecha]):
+        flash("Faltan datos para confirmar la sustitución (profesor ausente, día, fecha o franja). Por favor, inténtalo de nuevo desde 'Solicitar Sustitución'.", "error")
+        return redirect(url_for('.solicitar_sustitucion_route'))
+    if slot_date(fecha, dia_semana) is None:
+        flash(MENSAJE_FECHA_INVALIDA, "error")
+        return redirect(url_for('.solicitar_sustitucion_route'))
 
-    schedules_data = load_schedules()
-    if not schedules_data:
+    if not load_teacher_names():
         flash("No hay datos de horarios cargados. No se puede determinar disponibilidad.", "error")
-        return redirect(url_for('solicitar_sustitucion_route'))
-
-    substitution_counts = load_substitution_counts()
-
-    all_available_teachers = find_available_teachers(schedules_data, dia_semana, franja_horaria)
+        return redirect(url_for('.solicitar_sustitucion_route'))
 
+    all_available_teachers = get_available_teachers(dia_semana, franja_horaria)
     # Exclude the absent teacher from the list of available teachers
-    # Also, create a list of dicts with name and current count for the template
-    truly_available_teachers_with_counts = []
-    for teacher_name in all_available_teachers:
-        if teacher_name != profesor_ausente:
-            truly_available_teachers_with_counts.append({
-                "name": teacher_name,
-                "count": substitution_counts.get(teacher_name, 0)
-            })
+    names_of_truly_available = [name for name in all_available_teachers if name != profesor_ausente]
 
     # Get a suggested teacher to pre-select in the form
-    # Need to pass only names to select_teacher_for_substitution
-    names_of_truly_available = [t['name'] for t in truly_available_teachers_with_counts]
-    suggested_teacher = select_teacher_for_substitution(names_of_truly_available, substitution_counts)
+    fairness_weights = load_teacher_weights()
+    if current_app.config['FAIRNESS_WINDOW'] or fairness_weights:
+        # Counts shown are then the ones the suggestion is based on (e.g. this month's)
+        suggested_teacher, substitution_counts = suggest_substitute(
+            names_of_truly_available, current_app.config['FAIRNESS_WINDOW'], fairness_weights)
+    else:
+        substitution_counts = load_substitution_counts()
+        suggested_teacher = select_teacher_for_substitution(names_of_truly_available, substitution_counts)
+
+    # Create a list of dicts with name and current count for the template
+    truly_available_teachers_with_counts = [
+        {"name": teacher_name, "count": substitution_counts.get(teacher_name, 0)}
+        for teacher_name in names_of_truly_available
+    ]
 
     return render_template('confirmar_sustitucion.html',
                            profesor_ausente=profesor_ausente,
                            dia_semana=dia_semana,
+                           fecha=fecha,
                            franja_horaria=franja_horaria,
                            available_teachers_with_counts=truly_available_teachers_with_counts,
                            suggested_teacher=suggested_teacher,
                            substitution_counts=substitution_counts # Pass all counts for display if needed
                            )
 
-@app.route('/ver_sustituciones', methods=['GET'])
+@bp.route('/planificar_ausencia', methods=['GET', 'POST'])
+def planificar_ausencia_route():
+    if request.method == 'GET':
+        profesores = teacher_options()
+        if not profesores:
+            flash("No hay horarios cargados. Por favor, carga primero un archivo de horarios.", "warning")
+        return render_template('planificar_ausencia.html', profesores=profesores, plan=None)
+
+    profesor_ausente = request.form.get('profesor_ausente')
+    desde = request.form.get('desde')
+    hasta = request.form.get('hasta')
+    try:
+        fecha_desde = datetime.date.fromisoformat(desde)
+        fecha_hasta = datetime.date.fromisoformat(hasta)
+    except (TypeError, ValueError):
+        flash("Indica un profesor y unas fechas válidas para la ausencia.", "error")
+        return redirect(url_for('.planificar_ausencia_route'))
+    if not profesor_ausente or fecha_hasta < fecha_desde or (fecha_hasta - fecha_desde).days >= MAX_DIAS_PLANIFICACION:
+        flash(f"Indica un profesor y un periodo de como máximo {MAX_DIAS_PLANIFICACION} días.", "error")
+        return redirect(url_for('.planificar_ausencia_route'))
+
+    absence_slots = find_absence_slots(load_schedules(), profesor_ausente, fecha_desde, fecha_hasta)
+    if not absence_slots:
+        flash(f"{profesor_ausente} no tiene clases entre el {desde} y el {hasta}.", "warning")
+        return redirect(url_for('.planificar_ausencia_route'))
+    plan = plan_absence(absence_slots, get_available_teachers, load_substitution_counts(), profesor_ausente)
+    # Identifies the reviewed rows, so a confirmation only applies to the plan it was made for
+    plan_franjas = ';'.join(f"{entry['date']} {entry['time']}" for entry in plan)
+
+    if request.form.get('accion') == 'confirmar':
+        # The slots are rebuilt from the stored schedules: only the substitute chosen for each row comes from the form
+        if request.form.get('plan_franjas') != plan_franjas:
+            flash("Los horarios han cambiado desde que se preparó la propuesta. Revisa la nueva antes de confirmar.", "error")
+        else:
+            for i, entry in enumerate(plan):
+                entry['substitute'] = request.form.get(f'sustituto_{i}') or None
+            errors = validate_absence_plan(plan, get_available_teachers, profesor_ausente)
+            for error in errors:
+                flash(error, "error")
+            if not errors:
+                recorded = commit_absence_plan(plan, profesor_ausente)
+                flash(f"Se asignaron {recorded} sustituciones para la ausencia de {profesor_ausente} del {desde} al {hasta}.", "success")
+                return redirect(url_for('.ver_sustituciones_route', desde=desde, hasta=hasta))
+
+    return render_template('planificar_ausencia.html', profesores=teacher_options(profesor_ausente), plan=plan,
+                           profesor_ausente=profesor_ausente, desde=desde, hasta=hasta, plan_franjas=plan_franjas)
+
+@bp.route('/ver_sustituciones', methods=['GET'])
+@conditional_page('counts')
 def ver_sustituciones_route():
-    substitution_counts = load_substitution_counts()
-    # Sort by count descending, then by name ascending for tie-breaking
-    sorted_counts = sorted(substitution_counts.items(), key=lambda item: (-item[1], item[0]))
-    return render_template('ver_sustituciones.html', counts=sorted_counts)
+    # Optional period filter (YYYY-MM-DD), answered from the substitution event log
+    desde = request.args.get('desde') or None
+    hasta = request.args.get('hasta') or None
+    try:
+        for fecha in (desde, hasta):
+            if fecha:
+                datetime.date.fromisoformat(fecha)
+    except ValueError:
+        flash("Las fechas del periodo deben tener el formato AAAA-MM-DD.", "error")
+        return redirect(url_for('.ver_sustituciones_route'))
+
+    def load_period_counts():
+        events = None
+        if desde or hasta:
+            events = query_events(desde, hasta)
+            substitution_counts = {}
+            for event in events:
+                substitution_counts[event['substitute']] = substitution_counts.get(event['substitute'], 0) + 1
+        else:
+            substitution_counts = load_substitution_counts()
+        # Sort by count descending, then by name ascending for tie-breaking
+        sorted_counts = sorted(substitution_counts.items(), key=lambda item: (-item[1], item[0]))
+        return {'counts': sorted_counts, 'events': events}
+
+    recuento = render_fragment('recuento', 'fragmentos/recuento.html', ('counts',), load_period_counts,
+                               desde=desde, hasta=hasta)
+    return render_template('ver_sustituciones.html', recuento=recuento, desde=desde, hasta=hasta)
+
+@bp.route('/eventos', methods=['GET'])
+def eventos_route():
+    # Server-Sent Events: confirmed substitutions and schedule reloads of the current schedule set,
+    # recorded by any worker process (see live_feed.DataWatcher). Each open stream holds a server
+    # thread (or greenlet) while idle, so it only exists with LIVE_UPDATES = 'stream' (async workers).
+    if current_app.config['LIVE_UPDATES'] != 'stream':
+        abort(404)
+    stream = live_feed.stream(get_schedule_set(), request.headers.get('Last-Event-ID'))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/eventos/cambios', methods=['GET'])
+def cambios_route():
+    # The same events as /eventos, for pages that poll: answers at once with what changed
+    # since ?cursor= (from the previous answer), so it doesn't hold a sync worker.
+    if current_app.config['LIVE_UPDATES'] != 'poll':
+        abort(404)
+    response = jsonify(live_feed.read_changes(request.args.get('cursor')))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/cobertura', methods=['GET'])
+@conditional_page('schedules')
+def cobertura_route():
+    # Minimum number of teachers on refuerzo/guardia a slot should have
+    try:
+        min_guardias = max(1, int(request.args.get('min_guardias', 2)))
+    except ValueError:
+        min_guardias = 2
 
-@app.context_processor
+    schedules = load_schedules()
+    if not schedules:
+        flash("No hay horarios cargados. Por favor, carga primero un archivo de horarios.", "warning")
+        return render_template('cobertura.html', matrix=None, min_guardias=min_guardias)
+
+    from .coverage import get_coverage_matrix, coverage_per_slot, uncovered_slots, free_periods_per_teacher # numpy
+
+    matrix = get_coverage_matrix(schedules)
+    coverage = coverage_per_slot(matrix).tolist()
+    free_periods = sorted(free_periods_per_teacher(matrix).items(), key=lambda item: (-item[1], item[0]))
+    return render_template('cobertura.html', matrix=matrix, coverage=coverage,
+                           uncovered=uncovered_slots(matrix, min_guardias),
+                           free_periods=free_periods, min_guardias=min_guardias)
+
+@bp.route('/api/disponibilidad', methods=['GET', 'POST'])
+def api_disponibilidad_route():
+    # POST {"queries": [{"day": ..., "time": ..., "absent": ...}, ...]}; a GET asks for every
+    # day and time slot of the week. ?stream=1 (or Accept: application/x-ndjson) streams one
+    # JSON answer per line instead of a single document.
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        raw_queries = body.get('queries') if isinstance(body, dict) else None
+        if not isinstance(raw_queries, list):
+            return jsonify({'error': "Se esperaba un objeto JSON con una lista 'queries'."}), 400
+        if len(raw_queries) > MAX_CONSULTAS_DISPONIBILIDAD:
+            return jsonify({'error': f"Como máximo {MAX_CONSULTAS_DISPONIBILIDAD} consultas por petición."}), 400
+        queries = []
+        for number, query in enumerate(raw_queries):
+            if (not isinstance(query, dict) or not isinstance(query.get('day'), str)
+                    or not isinstance(query.get('time'), str)
+                    or not isinstance(query.get('absent'), (str, type(None)))):
+                return jsonify({'error': f"Consulta {number} no válida: se esperaban 'day', 'time' y opcionalmente 'absent'."}), 400
+            queries.append((query['day'], canonical_time(query['time']), query.get('absent')))
+    else:
+        queries = [(day, time_slot, None) for day in DIAS_SEMANA for time_slot in FRANJAS_HORARIAS]
+
+    # Every query is answered from the same loaded data
+    schedules = load_schedules()
+    fairness_weights = load_teacher_weights()
+    if current_app.config['FAIRNESS_WINDOW'] or fairness_weights:
+        # Same suggestions and counts as the confirmation page
+        window = current_app.config['FAIRNESS_WINDOW']
+        _, substitution_counts = suggest_substitute([], window, fairness_weights)
+        select_teacher = lambda names: suggest_substitute(names, window, fairness_weights)[0]
+    else:
+        substitution_counts = load_substitution_counts()
+        select_teacher = None
+    answers = answer_availability_queries(schedules, queries, substitution_counts, select_teacher)
+
+    if request.args.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+        def generate():
+            for answer in answers:
+                yield json.dumps(answer, ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    return jsonify({'results': list(answers)})
+
+@bp.route('/conjuntos', methods=['GET', 'POST'])
+def conjuntos_route():
+    if request.method == 'POST':
+        if request.form.get('accion') == 'crear':
+            centro = request.form.get('centro', '').strip()
+            curso = request.form.get('curso', '').strip()
+            name = f"{centro}/{curso}"
+            try:
+                create_schedule_set(name)
+            except ValueError:
+                flash("Nombre no válido. Use letras, números, '-', '_' o '.' para el centro y el curso.", 'error')
+                return redirect(url_for('.conjuntos_route'))
+            except OSError as e:
+                flash(f"No se pudo crear el conjunto de horarios: {e}", 'error')
+                return redirect(url_for('.conjuntos_route'))
+            flash(f"Conjunto de horarios '{name}' creado. Cargue ahora sus horarios.", 'success')
+        else:
+            name = request.form.get('conjunto') or None
+            if not schedule_set_exists(name):
+                flash("El conjunto de horarios seleccionado no existe.", 'error')
+                return redirect(url_for('.conjuntos_route'))
+            flash(f"Trabajando con el conjunto '{name or 'Principal'}'.", 'success')
+        if name is None:
+            session.pop('conjunto', None)
+        else:
+            session['conjunto'] = name
+        return redirect(url_for('.conjuntos_route'))
+    return render_template('conjuntos.html', conjuntos=list_schedule_sets())
+
+@bp.app_context_processor
 def inject_current_year():
     return {'current_year': datetime.date.today().year}
 
+@bp.app_context_processor
+def inject_schedule_set():
+    return {'conjunto_actual': get_schedule_set()}
+
 if __name__ == '__main__':
+    print("Testing app.py...")
+
+    # Uploads are removed when their ingestion can't be submitted, whatever the error
+    import io
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        upload_folder = os.path.join(temp_dir, 'uploads')
+        test_client = create_app({'DATA_DIR': temp_dir, 'UPLOAD_FOLDER': upload_folder}).test_client()
+        def failing_submit(*args, **kwargs):
+            raise OSError("disco lleno")
+        submit_ingestion_job = submit_batch_ingestion_job = failing_submit
+        for names in (['horarios.pdf'], ['ciencias.pdf', 'letras.pdf']):
+            response = test_client.post('/cargar_horarios', content_type='multipart/form-data', data={
+                'schedule_pdf': [(io.BytesIO(b'%PDF-1.4'), name) for name in names]})
+            assert response.status_code == 302
+            assert os.listdir(upload_folder) == [], f"Uploads left behind: {os.listdir(upload_folder)}"
+        configure_data_dir(DEFAULT_DATA_DIR)
+    print("App tests completed.\n")
+
     print("Flask app 'app.py' is ready to be run. Use 'flask run' or 'python -m flask run'.")
     print("Ensure you are in the directory containing 'sustituciones_app' or set FLASK_APP appropriately.")
     print("Example: export FLASK_APP=sustituciones_app.app")
@@ -0,0 +1,261 @@
+import datetime
+from collections import deque
+
+from . import event_log
+from .substitution_logic import AVAILABLE_ACTIVITY_TYPES
+
+# datetime.date.weekday() -> day name used in the schedules (weekends have no classes)
+WEEKDAY_NAMES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+
+def find_absence_slots(schedules_data, absent_teacher, start_date, end_date):
+    """
+    Lists every class the absent teacher has between two dates, according to their schedule.
+
+    Refuerzo/guardia periods are not listed, as they don't need a substitute.
+    Several activities in the same slot (e.g. split groups) count as one slot.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+        absent_teacher (str): Name of the absent teacher.
+        start_date (datetime.date): First day of the absence.
+        end_date (datetime.date): Last day of the absence (included).
+
+    Returns:
+        list: Dicts with 'date' (ISO string), 'day', 'time' and 'subject', ordered by date and time.
+    """
+    day_schedules = {}
+    for teacher_info in schedules_data:
+        if teacher_info.get('teacher_name') != absent_teacher:
+            continue
+        for day, day_schedule in (teacher_info.get('schedule') or {}).items():
+            for activity in day_schedule or []:
+                if activity.get('type', '').lower() in AVAILABLE_ACTIVITY_TYPES or activity.get('time') is None:
+                    continue
+                slots = day_schedules.setdefault(day, {})
+                if activity['time'] in slots:
+                    slots[activity['time']] += f" / {activity.get('subject', '')}"
+                else:
+                    slots[activity['time']] = activity.get('subject', '')
+
+    absence_slots = []
+    date = start_date
+    while date <= end_date:
+        if date.weekday() < len(WEEKDAY_NAMES):
+            day = WEEKDAY_NAMES[date.weekday()]
+            for time_slot, subject in sorted(day_schedules.get(day, {}).items()):
+                absence_slots.append({'date': date.isoformat(), 'day': day, 'time': time_slot, 'subject': subject})
+        date += datetime.timedelta(days=1)
+    return absence_slots
+
+def _recorded_bookings(slots):
+    """Returns (date, time, substitute) of the substitutions already in the event log on the dates of slots."""
+    if not slots:
+        return set()
+    dates = [slot['date'] for slot in slots]
+    return {(event['date'], event['slot'], event['substitute'])
+            for event in event_log.query_events(min(dates), max(dates))}
+
+def _rebalance(assignments, candidates, loads):
+    """
+    Moves slots between substitutes until no teacher could hand work, directly or
+    through a chain of reassignments, to someone with at least two fewer substitutions.
+
+    Each move lowers the sum of squared loads, so the loop ends; at that point no
+    sequence of reassignments can make the loads more even.
+    """
+    improved = True
+    while improved:
+        improved = False
+        for teacher in sorted(loads, key=lambda name: (-loads[name], name)):
+            # Breadth-first search over "teacher -> slot they cover -> another candidate of that slot"
+            parents = {teacher: None}
+            queue = deque([teacher])
+            target = None
+            while queue and target is None:
+                current = queue.popleft()
+                for slot_index in sorted(i for i, assigned in assignments.items() if assigned == current):
+                    for candidate in candidates[slot_index]:
+                        if candidate in parents:
+                            continue
+                        parents[candidate] = (current, slot_index)
+                        if loads.get(candidate, 0) <= loads[teacher] - 2:
+                            target = candidate
+                            break
+                        queue.append(candidate)
+                    if target is not None:
+                        break
+            if target is None:
+                continue
+
+            # Shift each slot on the path one step towards the less loaded teacher
+            node = target
+            while parents[node] is not None:
+                previous, slot_index = parents[node]
+                assignments[slot_index] = node
+                node = previous
+            loads[target] = loads.get(target, 0) + 1
+            loads[teacher] -= 1
+            improved = True
+            break
+
+def plan_absence(absence_slots, get_candidates, substitution_counts, absent_teacher):
+    """
+    Assigns a substitute to every slot of an absence in one pass over the whole batch.
+
+    Slots with the fewest candidates are filled first, each going to the candidate
+    with the lowest count so far (existing count plus assignments in this plan,
+    then name, as in select_teacher_for_substitution). The assignments are then
+    rebalanced across the batch. A substitute is never booked twice for the same
+    date and time slot, counting the substitutions already in the event log.
+
+    Args:
+        absence_slots (list): Slots from find_absence_slots.
+        get_candidates (callable): get_candidates(day, time_slot) -> list of available teacher names.
+        substitution_counts (dict): Current substitution counts.
+        absent_teacher (str): Name of the absent teacher, never proposed as substitute.
+
+    Returns:
+        list: One dict per slot with the slot fields plus 'candidates' and 'substitute'
+              (None when nobody is available), in the order of absence_slots.
+    """
+    booked = _recorded_bookings(absence_slots) # (date, time, teacher)
+    candidates_by_day_slot = {}
+    candidates = {}
+    for slot_index, slot in enumerate(absence_slots):
+        key = (slot['day'], slot['time'])
+        if key not in candidates_by_day_slot:
+            candidates_by_day_slot[key] = sorted(set(get_candidates(*key)) - {absent_teacher})
+        # Teachers already covering another absence at that time are not candidates, not even when rebalancing
+        candidates[slot_index] = [name for name in candidates_by_day_slot[key]
+                                  if (slot['date'], slot['time'], name) not in booked]
+
+    loads = {name: substitution_counts.get(name, 0) for names in candidates.values() for name in names}
+    assignments = {}
+    order = sorted(range(len(absence_slots)),
+                   key=lambda i: (len(candidates[i]), absence_slots[i]['date'], absence_slots[i]['time']))
+    for slot_index in order:
+        slot = absence_slots[slot_index]
+        free = [name for name in candidates[slot_index] if (slot['date'], slot['time'], name) not in booked]
+        if not free:
+            continue
+        substitute = min(free, key=lambda name: (loads[name], name))
+        assignments[slot_index] = substitute
+        booked.add((slot['date'], slot['time'], substitute))
+        loads[substitute] += 1
+
+    _rebalance(assignments, candidates, loads)
+
+    plan = []
+    for slot_index, slot in enumerate(absence_slots):
+        plan.append(dict(slot, candidates=candidates[slot_index], substitute=assignments.get(slot_index)))
+    return plan
+
+def validate_absence_plan(plan, get_candidates, absent_teacher):
+    """
+    Checks a (possibly edited) plan before committing it.
+
+    Args:
+        plan (list): Plan entries with 'date', 'day', 'time' and 'substitute'.
+        get_candidates (callable): get_candidates(day, time_slot) -> list of available teacher names.
+        absent_teacher (str): Name of the absent teacher.
+
+    Returns:
+        list: Error messages; empty if the plan can be committed.
+    """
+    errors = []
+    recorded = _recorded_bookings(plan)
+    booked = set()
+    for entry in plan:
+        substitute = entry.get('substitute')
+        if not substitute:
+            continue
+        slot_label = f"{entry['date']} {entry['time']}"
+        if substitute == absent_teacher or substitute not in get_candidates(entry['day'], entry['time']):
+            errors.append(f"{substitute} no está disponible el {slot_label}.")
+        if (entry['date'], entry['time'], substitute) in recorded:
+            errors.append(f"{substitute} ya cubre otra sustitución el {slot_label}.")
+        elif (entry['date'], entry['time'], substitute) in booked:
+            errors.append(f"{substitute} está asignado dos veces el {slot_label}.")
+        booked.add((entry['date'], entry['time'], substitute))
+    return errors
+
+def commit_absence_plan(plan, absent_teacher):
+    """
+    Records every assignment of a plan.
+
+    All events are written with one append, instead of one confirmation round
+    trip per slot; the substitution counts are derived from the event log.
+
+    Args:
+        plan (list): Plan entries with 'date', 'day', 'time' and 'substitute'.
+        absent_teacher (str): Name of the absent teacher.
+
+    Returns:
+        int: Number of substitutions recorded.
+    """
+    assigned = [entry for entry in plan if entry.get('substitute')]
+    if not assigned:
+        return 0
+    event_log.append_substitution_events([
+        {'absent': absent_teacher, 'substitute': entry['substitute'], 'day': entry['day'],
+         'slot': entry['time'], 'date': entry['date']}
+        for entry in assigned])
+    return len(assigned)
+
+if __name__ == "__main__":
+    print("Testing batch_planner.py...")
+
+    sample_schedules_data = [
+        {'teacher_name': 'Profesora Ausente', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'Mates', 'type': 'clase'},
+                      {'time': '09:00-10:00', 'subject': 'Lengua', 'type': 'clase'},
+                      {'time': '10:00-11:00', 'subject': 'GUARDIA', 'type': 'refuerzo'}],
+            'Martes': [{'time': '08:00-09:00', 'subject': 'Mates', 'type': 'clase'}]}},
+    ]
+    availability = {
+        ('Lunes', '08:00-09:00'): ['Profesor A', 'Profesor B'],
+        ('Lunes', '09:00-10:00'): ['Profesor A'],
+        ('Martes', '08:00-09:00'): ['Profesor A', 'Profesora Ausente'],
+    }
+    get_candidates = lambda day, time_slot: availability.get((day, time_slot), [])
+
+    # Monday 2026-10-12 to Sunday 2026-10-18: two Monday classes and one Tuesday class
+    slots = find_absence_slots(sample_schedules_data, 'Profesora Ausente',
+                               datetime.date(2026, 10, 12), datetime.date(2026, 10, 18))
+    print(f"Absence slots: {[(s['date'], s['time']) for s in slots]}")
+    assert [(s['day'], s['time']) for s in slots] == [('Lunes', '08:00-09:00'), ('Lunes', '09:00-10:00'),
+                                                      ('Martes', '08:00-09:00')]
+
+    # Slot by slot, Monday 08:00 would go to A (alphabetical tie) and A would end up covering
+    # all three classes; the batch plan leaves A only the slots nobody else can take.
+    plan = plan_absence(slots, get_candidates, {}, 'Profesora Ausente')
+    print(f"Plan: {[(p['date'], p['time'], p['substitute']) for p in plan]}")
+    assert [p['substitute'] for p in plan] == ['Profesor B', 'Profesor A', 'Profesor A']
+
+    # Existing counts are part of the balance: B has already covered five substitutions
+    plan = plan_absence(slots, get_candidates, {'Profesor A': 0, 'Profesor B': 5}, 'Profesora Ausente')
+    assert [p['substitute'] for p in plan] == ['Profesor A', 'Profesor A', 'Profesor A']
+    assert all(p['substitute'] != 'Profesora Ausente' for p in plan)
+    assert validate_absence_plan(plan, get_candidates, 'Profesora Ausente') == []
+
+    plan[1]['substitute'] = 'Profesor B'
+    assert validate_absence_plan(plan, get_candidates, 'Profesora Ausente'), "Unavailable substitute accepted"
+
+    # A substitute already recorded for a slot (covering another absence) is not booked again
+    import tempfile
+    from . import data_manager
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_manager.configure_data_dir(temp_dir)
+        try:
+            event_log.append_substitution_event('Profesor Otro', 'Profesor B', 'Lunes', '08:00-09:00',
+                                                date='2026-10-12')
+            plan = plan_absence(slots, get_candidates, {}, 'Profesora Ausente')
+            assert [p['substitute'] for p in plan] == ['Profesor A', 'Profesor A', 'Profesor A'], plan
+            assert plan[0]['candidates'] == ['Profesor A']
+            plan[0]['substitute'] = 'Profesor B'
+            errors = validate_absence_plan(plan, get_candidates, 'Profesora Ausente')
+            assert errors == ["Profesor B ya cubre otra sustitución el 2026-10-12 08:00-09:00."], errors
+        finally:
+            data_manager.configure_data_dir(data_manager.DEFAULT_DATA_DIR)
+
+    print("\nBatch planner tests completed.")
@@ -0,0 +1,282 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .substitution_logic import AVAILABLE_ACTIVITY_TYPES, find_available_teachers
+
+# Activity type codes stored in the matrix. When a teacher has several activities in
+# the same slot the highest code wins, so availability (refuerzo/guardia) takes precedence,
+# as in find_available_teachers.
+CODE_FREE = 0
+CODE_CLASS = 1
+CODE_OTHER = 2
+CODE_REFUERZO = 3
+CODE_GUARDIA = 4
+ACTIVITY_CODES = {'clase': CODE_CLASS, 'refuerzo': CODE_REFUERZO, 'guardia': CODE_GUARDIA}
+
+DAY_ORDER = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+
+class CoverageMatrix:
+    """
+    Compact array form of the whole timetable.
+
+    Attributes:
+        teachers (list): Teacher names, one per row (duplicated names are merged).
+        days (list): Day names, one per column.
+        slots (list): Time slots, sorted.
+        codes (numpy.ndarray): int8 array of shape (teachers, days, slots) with activity codes.
+        available_bits (numpy.ndarray): uint8 array of shape (days, slots, ceil(teachers / 8)):
+            for each slot, a bitset of the teachers on refuerzo or guardia.
+    """
+
+    def __init__(self, teachers, days, slots, codes):
+        self.teachers = teachers
+        self.days = days
+        self.slots = slots
+        self.codes = codes
+        available = np.isin(codes, [ACTIVITY_CODES[t] for t in AVAILABLE_ACTIVITY_TYPES])
+        # (teachers, days, slots) -> (days, slots, teachers), packed 8 teachers per byte
+        self.available_bits = np.packbits(available.transpose(1, 2, 0), axis=-1)
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays, in bytes."""
+        return self.codes.nbytes + self.available_bits.nbytes
+
+def build_coverage_matrix(schedules_data):
+    """
+    Builds the coverage matrix of a list of teacher schedules.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+
+    Returns:
+        CoverageMatrix: The timetable in array form.
+    """
+    teacher_rows = {}
+    day_columns = {day: None for day in DAY_ORDER}
+    slot_set = set()
+    entries = []
+    for teacher_info in schedules_data:
+        teacher_name = teacher_info.get('teacher_name')
+        if not teacher_name:
+            continue
+        row = teacher_rows.setdefault(teacher_name, len(teacher_rows))
+        for day, day_schedule in (teacher_info.get('schedule') or {}).items():
+            day_columns.setdefault(day, None)
+            for activity in day_schedule or []:
+                time_slot = activity.get('time')
+                if time_slot is None:
+                    continue
+                slot_set.add(time_slot)
+                code = ACTIVITY_CODES.get(activity.get('type', '').lower(), CODE_OTHER)
+                entries.append((row, day, time_slot, code))
+
+    days = list(day_columns)
+    slots = sorted(slot_set)
+    day_index = {day: i for i, day in enumerate(days)}
+    slot_index = {time_slot: i for i, time_slot in enumerate(slots)}
+    codes = np.zeros((len(teacher_rows), len(days), len(slots)), dtype=np.int8)
+    if entries:
+        rows, entry_days, entry_slots, entry_codes = zip(*entries)
+        np.maximum.at(codes,
+                      (np.array(rows), np.array([day_index[d] for d in entry_days]),
+                       np.array([slot_index[s] for s in entry_slots])),
+                      np.array(entry_codes, dtype=np.int8))
+    return CoverageMatrix(list(teacher_rows), days, slots, codes)
+
+def coverage_per_slot(matrix):
+    """
+    Counts the teachers available (refuerzo/guardia) in every slot.
+
+    Args:
+        matrix (CoverageMatrix): The timetable.
+
+    Returns:
+        numpy.ndarray: int array of shape (days, slots).
+    """
+    bits = np.unpackbits(matrix.available_bits, axis=-1, count=len(matrix.teachers))
+    return bits.sum(axis=-1, dtype=np.int32)
+
+def uncovered_slots(matrix, min_available=2):
+    """
+    Lists the slots with fewer available teachers than required.
+
+    Only slots where at least one teacher has an activity are considered, so
+    days or hours outside the timetable are not reported.
+
+    Args:
+        matrix (CoverageMatrix): The timetable.
+        min_available (int, optional): Teachers needed on refuerzo/guardia. Defaults to 2.
+
+    Returns:
+        list: (day, time_slot, available count) tuples, by day and time.
+    """
+    coverage = coverage_per_slot(matrix)
+    in_use = (matrix.codes != CODE_FREE).any(axis=0)
+    day_indexes, slot_indexes = np.nonzero((coverage < min_available) & in_use)
+    return [(matrix.days[d], matrix.slots[s], int(coverage[d, s])) for d, s in zip(day_indexes, slot_indexes)]
+
+def free_periods_per_teacher(matrix):
+    """
+    Counts each teacher's free periods: slots of the timetable where they have no activity.
+
+    Args:
+        matrix (CoverageMatrix): The timetable.
+
+    Returns:
+        dict: Teacher names and their number of free periods.
+    """
+    in_use = (matrix.codes != CODE_FREE).any(axis=0)
+    free = ((matrix.codes == CODE_FREE) & in_use).sum(axis=(1, 2))
+    return dict(zip(matrix.teachers, free.tolist()))
+
+def available_teachers_in_slot(matrix, day, time_slot):
+    """
+    Returns the names of the teachers on refuerzo/guardia in a slot, read from the bitset.
+
+    Args:
+        matrix (CoverageMatrix): The timetable.
+        day (str): The day (e.g. "Lunes").
+        time_slot (str): The time slot (e.g. "08:00-09:00").
+
+    Returns:
+        list: Teacher names, in schedule order.
+    """
+    if day not in matrix.days or time_slot not in matrix.slots:
+        return []
+    bits = np.unpackbits(matrix.available_bits[matrix.days.index(day), matrix.slots.index(time_slot)],
+                         count=len(matrix.teachers))
+    return [matrix.teachers[i] for i in np.flatnonzero(bits)]
+
+_cached_source = None
+_cached_matrix = None
+_cache_lock = threading.Lock()
+
+def get_coverage_matrix(schedules_data):
+    """
+    Returns the coverage matrix of schedules_data, reusing the last one built for the same object.
+
+    data_manager.load_schedules returns the same read-only object while the file is
+    unchanged, so page views don't rebuild the matrix.
+    """
+    global _cached_source, _cached_matrix
+    with _cache_lock:
+        if schedules_data is not _cached_source:
+            _cached_matrix = build_coverage_matrix(schedules_data)
+            _cached_source = schedules_data
+        return _cached_matrix
+
+def _deep_sizeof(obj, seen=None):
+    """Approximate memory of nested lists/dicts/strings, counting shared objects once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+def compare_with_dicts(schedules_data, min_available=2, repeat=5):
+    """
+    Measures memory and query time of the coverage queries on the matrix and on the dict form.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+        min_available (int, optional): Threshold for uncovered slots. Defaults to 2.
+        repeat (int, optional): Runs of each query; the best time is kept. Defaults to 5.
+
+    Returns:
+        dict: Bytes of each form and best seconds of each query, for both forms.
+    """
+    def best_of(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    build_seconds, matrix = best_of(lambda: build_coverage_matrix(schedules_data))
+
+    def dict_uncovered():
+        slots = sorted({a['time'] for t in schedules_data for d in (t.get('schedule') or {}).values()
+                        for a in d or [] if a.get('time') is not None})
+        return [(day, slot) for day in matrix.days for slot in slots
+                if len(find_available_teachers(schedules_data, day, slot)) < min_available]
+
+    def dict_free_periods():
+        in_use = {(day, a['time']) for t in schedules_data for day, d in (t.get('schedule') or {}).items()
+                  for a in d or [] if a.get('time') is not None}
+        busy = {}
+        for t in schedules_data:
+            for day, d in (t.get('schedule') or {}).items():
+                for a in d or []:
+                    busy.setdefault(t.get('teacher_name'), set()).add((day, a.get('time')))
+        return {name: len(in_use - slots) for name, slots in busy.items()}
+
+    dict_uncovered_seconds, _ = best_of(dict_uncovered)
+    matrix_uncovered_seconds, _ = best_of(lambda: uncovered_slots(matrix, min_available))
+    dict_free_seconds, _ = best_of(dict_free_periods)
+    matrix_free_seconds, _ = best_of(lambda: free_periods_per_teacher(matrix))
+    return {
+        'teachers': len(matrix.teachers),
+        'dict_bytes': _deep_sizeof(schedules_data),
+        'matrix_bytes': matrix.nbytes,
+        'build_seconds': build_seconds,
+        'uncovered_slots_seconds': {'dict': dict_uncovered_seconds, 'matrix': matrix_uncovered_seconds},
+        'free_periods_seconds': {'dict': dict_free_seconds, 'matrix': matrix_free_seconds},
+    }
+
+if __name__ == "__main__":
+    print("Testing coverage.py...")
+
+    sample_schedules_data = [
+        {'teacher_name': 'Profesor Davila', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'Matemáticas', 'type': 'clase'},
+                      {'time': '09:00-10:00', 'subject': 'GUARDIA', 'type': 'guardia'}],
+            'Martes': [{'time': '08:00-09:00', 'subject': 'REFUERZO', 'type': 'Refuerzo'}]}},
+        {'teacher_name': 'Profesora Elena', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'REFUERZO', 'type': 'refuerzo'},
+                      {'time': '09:00-10:00', 'subject': 'Historia', 'type': 'clase'}]}},
+        {'teacher_name': 'Profesora Sofia', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'GUARDIA', 'type': 'guardia'}]}},
+    ]
+    matrix = build_coverage_matrix(sample_schedules_data)
+    assert matrix.codes.shape == (3, 5, 2) and matrix.codes.dtype == np.int8
+
+    coverage = coverage_per_slot(matrix)
+    print(f"Coverage Lunes: {dict(zip(matrix.slots, coverage[0].tolist()))}")
+    assert coverage[0].tolist() == [2, 1] and coverage[1].tolist() == [1, 0]
+
+    # Same answers as the dict scan, for every slot
+    for day in matrix.days:
+        for time_slot in matrix.slots:
+            assert available_teachers_in_slot(matrix, day, time_slot) == \
+                find_available_teachers(sample_schedules_data, day, time_slot), (day, time_slot)
+
+    uncovered = uncovered_slots(matrix, min_available=2)
+    print(f"Uncovered slots: {uncovered}")
+    assert uncovered == [('Lunes', '09:00-10:00', 1), ('Martes', '08:00-09:00', 1)]
+
+    free = free_periods_per_teacher(matrix)
+    print(f"Free periods: {free}")
+    assert free == {'Profesor Davila': 0, 'Profesora Elena': 1, 'Profesora Sofia': 2}
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        import random
+        rng = random.Random(0)
+        slots = [f"{h:02d}:00-{h + 1:02d}:00" for h in range(8, 15)]
+        for teacher_count in (10, 100, 1000):
+            schedules = [{'teacher_name': f"Profesor {i:04d}", 'schedule': {
+                day: [{'time': slot, 'subject': 'X', 'type': rng.choice(['clase', 'clase', 'refuerzo', 'guardia'])}
+                      for slot in slots if rng.random() < 0.8]
+                for day in DAY_ORDER}} for i in range(teacher_count)]
+            print(compare_with_dicts(schedules))
+
+    print("\nCoverage tests completed.")
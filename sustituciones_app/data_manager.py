@@ -1,12 +1,501 @@
+import collections
+import contextlib
+import copy
 import json
 import os
+import re
+import sys
+import threading
 
-DATA_DIR = "sustituciones_app/data"
+try:
+    import fcntl
+except ImportError: # Not available on Windows: JSON count updates are then only serialized within one process
+    fcntl = None
+
+from . import data_versions, metrics, schedule_diff, sqlite_store
+from .schedule_snapshot import ScheduleSnapshot, SnapshotError, write_snapshot
+from .substitution_logic import build_availability_index, find_available_teachers
+from .time_slots import canonical_time
+
+DEFAULT_DATA_DIR = "sustituciones_app/data"
+DATA_DIR = DEFAULT_DATA_DIR # Changed with configure_data_dir
+
+# Named schedule sets, one per school and term ("school/term"), each with its own schedules,
+# counts and event log in DATA_DIR/SCHEDULE_SETS_DIR/<school>/<term>. The set in use is
+# chosen per thread with select_schedule_set(); with none selected DATA_DIR itself is used.
+SCHEDULE_SETS_DIR = "conjuntos"
+_SCHEDULE_SET_PATTERN = re.compile(r'^[\w-][\w.-]*/[\w-][\w.-]*$')
+_selected = threading.local()
+
+# Storage backends: 'json' (the default) keeps horarios.json, and counts derived from the event log
+# plus sustituciones_contador_base.json (see load_substitution_counts);
+# 'sqlite' keeps schedules and counts in DB_FILE_NAME, where file_name arguments are ignored.
+STORAGE_BACKENDS = ('json', 'sqlite')
+DB_FILE_NAME = "sustituciones.db"
+# Uploaded schedules waiting to be reviewed and applied, see stage_schedules
+STAGED_SCHEDULES_PREFIX = "horarios_pendientes_"
+_storage_backend = 'json'
+
+class SchedulesChangedError(Exception):
+    """Raised when a staged upload is applied over schedules that changed since it was reviewed."""
+
+_thread_locks = {} # lock file path -> threading.Lock, see data_file_lock
+_thread_locks_guard = threading.Lock()
+
+# In-process cache of parsed JSON files: file_path -> (file signature, read-only data, approximate bytes).
+# Entries are revalidated with a single os.stat per load, so a file replaced on disk
+# (by this or another process) is re-read on the next access.
+_json_cache = {}
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_cache_lock = threading.Lock()
+# Datasets (directories) with cached files, least recently used first: directory -> cached bytes.
+# When the total goes over MAX_CACHE_BYTES whole datasets are dropped, oldest first.
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+_datasets = collections.OrderedDict()
+# Mapped binary snapshots of schedules files: snapshot path -> (file signature, ScheduleSnapshot or None if invalid)
+_snapshots = {}
+
+def _read_only(*args, **kwargs):
+    raise TypeError("Cached data is read-only; make a copy (e.g. dict(data)) before modifying it.")
+
+class _ReadOnlyDict(dict):
+    """A dict that refuses in-place modification. copy() and deepcopy return plain dicts."""
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+class _ReadOnlyList(list):
+    """A list that refuses in-place modification. copy() and deepcopy return plain lists."""
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+def _freeze(data, size=None):
+    """
+    Recursively converts parsed JSON into read-only containers.
+
+    Args:
+        data: Parsed JSON.
+        size (list, optional): One-item list to which the approximate memory of data, in bytes, is added.
+    """
+    if isinstance(data, dict):
+        frozen = _ReadOnlyDict((key, _freeze(value, size)) for key, value in data.items())
+        if size is not None:
+            size[0] += sys.getsizeof(frozen) + sum(sys.getsizeof(key) for key in frozen)
+        return frozen
+    if isinstance(data, list):
+        frozen = _ReadOnlyList(_freeze(value, size) for value in data)
+        if size is not None:
+            size[0] += sys.getsizeof(frozen)
+        return frozen
+    if size is not None:
+        size[0] += sys.getsizeof(data)
+    return data
+
+def _file_signature(file_path):
+    """Returns a cheap (mtime, size, inode) signature, or None if the file doesn't exist."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _load_json_cached(file_path):
+    """
+    Loads a JSON file through the in-process cache.
+
+    Args:
+        file_path (str): Path of the JSON file.
+
+    Returns:
+        The parsed data as read-only containers, or None if the file doesn't exist.
+
+    Raises:
+        json.JSONDecodeError, IOError: If the file can't be read or parsed.
+    """
+    signature = _file_signature(file_path)
+    if signature is None:
+        with _cache_lock:
+            _drop_cached_file(file_path)
+        return None
+
+    dataset = os.path.dirname(file_path)
+    with _cache_lock:
+        cached = _json_cache.get(file_path)
+        if cached is not None and cached[0] == signature:
+            _cache_stats['hits'] += 1
+            _datasets.move_to_end(dataset)
+            return cached[1]
+        _cache_stats['misses'] += 1
+
+    size = [0]
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = _freeze(json.load(f), size)
+    if metrics.enabled:
+        file_name = os.path.basename(file_path)
+        metrics.inc_counter('sustituciones_json_loads_total', file=file_name)
+        metrics.inc_counter('sustituciones_json_load_bytes_total', signature[1], file=file_name)
+    with _cache_lock:
+        _drop_cached_file(file_path)
+        _json_cache[file_path] = (signature, data, size[0])
+        _datasets[dataset] = _datasets.get(dataset, 0) + size[0]
+        _datasets.move_to_end(dataset)
+        _evict_datasets()
+    return data
+
+def _drop_cached_file(file_path):
+    """Removes one file from the cache. Call with _cache_lock held."""
+    cached = _json_cache.pop(file_path, None)
+    if cached is not None:
+        dataset = os.path.dirname(file_path)
+        _datasets[dataset] -= cached[2]
+        if not any(os.path.dirname(path) == dataset for path in _json_cache):
+            del _datasets[dataset]
+
+def _evict_datasets():
+    """
+    Drops least recently used datasets until the cache fits in MAX_CACHE_BYTES.
+
+    The most recently used dataset is always kept, even if it alone is over the limit.
+    Call with _cache_lock held.
+    """
+    while len(_datasets) > 1 and sum(_datasets.values()) > MAX_CACHE_BYTES:
+        dataset, _ = _datasets.popitem(last=False)
+        for path in [path for path in _json_cache if os.path.dirname(path) == dataset]:
+            del _json_cache[path]
+        for path in [path for path in _snapshots if os.path.dirname(path) == dataset]:
+            del _snapshots[path]
+        _cache_stats['evictions'] += 1
+
+def _invalidate_cache(file_path):
+    """Drops the cached copy of a file that has just been written."""
+    with _cache_lock:
+        _drop_cached_file(file_path)
+
+def configure_cache(max_bytes):
+    """
+    Sets the memory budget of the in-process JSON cache, evicting datasets if needed.
+
+    Args:
+        max_bytes (int): Approximate bytes of parsed data to keep across all schedule sets.
+    """
+    global MAX_CACHE_BYTES
+    with _cache_lock:
+        MAX_CACHE_BYTES = max_bytes
+        _evict_datasets()
+
+def get_cache_stats():
+    """
+    Returns the in-process JSON cache counters.
+
+    Returns:
+        dict: 'hits', 'misses', 'entries' (number of files currently cached), 'bytes' (approximate
+            memory of the cached data), 'datasets' (directories with cached files, least recently
+            used first) and 'evictions' (datasets dropped to stay within MAX_CACHE_BYTES).
+    """
+    with _cache_lock:
+        return {'hits': _cache_stats['hits'], 'misses': _cache_stats['misses'], 'entries': len(_json_cache),
+                'bytes': sum(_datasets.values()), 'datasets': list(_datasets),
+                'evictions': _cache_stats['evictions']}
+
+def clear_cache():
+    """Empties the in-process JSON cache (and mapped snapshots) and resets its counters."""
+    with _cache_lock:
+        _json_cache.clear()
+        _snapshots.clear()
+        _datasets.clear()
+        _cache_stats['hits'] = 0
+        _cache_stats['misses'] = 0
+        _cache_stats['evictions'] = 0
+
+def _check_schedule_set_name(name):
+    if not isinstance(name, str) or not _SCHEDULE_SET_PATTERN.match(name):
+        raise ValueError(f"Invalid schedule set '{name}'. Expected 'school/term' (letters, digits, '-', '_', '.').")
+
+def data_dir():
+    """Returns the data directory of the schedule set selected in this thread (DATA_DIR if none)."""
+    name = getattr(_selected, 'name', None)
+    if name is None:
+        return DATA_DIR
+    return os.path.join(DATA_DIR, SCHEDULE_SETS_DIR, *name.split('/'))
+
+def select_schedule_set(name):
+    """
+    Selects the schedule set used by this thread.
+
+    Args:
+        name (str): A set name ("school/term"), or None for the default data directory.
+
+    Raises:
+        ValueError: If the name is not valid.
+    """
+    if name is not None:
+        _check_schedule_set_name(name)
+    _selected.name = name
+
+def get_schedule_set():
+    """Returns the name of the schedule set selected in this thread, or None for the default one."""
+    return getattr(_selected, 'name', None)
+
+@contextlib.contextmanager
+def schedule_set(name):
+    """Selects a schedule set for the duration of a with block, restoring the previous one afterwards."""
+    previous = get_schedule_set()
+    select_schedule_set(name)
+    try:
+        yield
+    finally:
+        _selected.name = previous
+
+def create_schedule_set(name):
+    """
+    Creates the (empty) data directory of a schedule set, if it doesn't exist.
+
+    Args:
+        name (str): The set name ("school/term").
+
+    Raises:
+        ValueError: If the name is not valid.
+    """
+    _check_schedule_set_name(name)
+    os.makedirs(os.path.join(DATA_DIR, SCHEDULE_SETS_DIR, *name.split('/')), exist_ok=True)
+
+def schedule_set_exists(name):
+    """Returns whether name is a valid schedule set with a data directory."""
+    if name is None:
+        return True
+    return (isinstance(name, str) and bool(_SCHEDULE_SET_PATTERN.match(name))
+            and os.path.isdir(os.path.join(DATA_DIR, SCHEDULE_SETS_DIR, *name.split('/'))))
+
+def list_schedule_sets():
+    """
+    Lists the schedule sets found on disk. Their data is only loaded when a set is used.
+
+    Returns:
+        list: Set names ("school/term"), sorted.
+    """
+    sets_dir = os.path.join(DATA_DIR, SCHEDULE_SETS_DIR)
+    names = []
+    try:
+        schools = os.listdir(sets_dir)
+    except OSError:
+        return names
+    for school in schools:
+        try:
+            terms = os.listdir(os.path.join(sets_dir, school))
+        except OSError:
+            continue
+        for term in terms:
+            name = f"{school}/{term}"
+            if _SCHEDULE_SET_PATTERN.match(name) and os.path.isdir(os.path.join(sets_dir, school, term)):
+                names.append(name)
+    return sorted(names)
+
+def configure_storage(backend):
+    """
+    Selects the storage backend used by the functions of this module.
+
+    Args:
+        backend (str): One of STORAGE_BACKENDS.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    global _storage_backend
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Expected one of {STORAGE_BACKENDS}.")
+    _storage_backend = backend
+
+def configure_data_dir(path):
+    """
+    Sets the directory all data (and the schedule sets) is stored in, for the whole process.
+
+    Args:
+        path (str): The data directory. It is created when something is first saved.
+    """
+    global DATA_DIR
+    if path != DATA_DIR:
+        DATA_DIR = path
+        clear_cache()
+
+def prewarm_caches(schedule_sets=None, schedules_file_name="horarios.json",
+                   counts_file_name="sustituciones_contador.json"):
+    """
+    Loads the schedules, counts and lookup indexes of schedule sets into the in-process cache.
+
+    Meant to run before a worker process accepts requests, so its first requests don't
+    pay for reading and parsing the data files. Sets beyond the cache budget (see
+    configure_cache) are loaded and evicted again; the default data is loaded last, so
+    it is the one kept.
+
+    Args:
+        schedule_sets (list, optional): Names of the sets to load (None for the default data).
+            Defaults to every set in list_schedule_sets() plus the default data.
+        schedules_file_name (str, optional): The schedules file. Defaults to "horarios.json".
+        counts_file_name (str, optional): The counts file. Defaults to "sustituciones_contador.json".
+
+    Returns:
+        dict: Number of teachers loaded per set.
+    """
+    if schedule_sets is None:
+        schedule_sets = list_schedule_sets() + [None]
+    previous = get_schedule_set()
+    loaded = {}
+    try:
+        for name in schedule_sets:
+            select_schedule_set(name)
+            loaded[name] = len(load_schedules(schedules_file_name))
+            load_substitution_counts(counts_file_name)
+            if _storage_backend == 'json' and _open_snapshot(schedules_file_name) is None:
+                load_availability_index(schedules_file_name)
+    finally:
+        select_schedule_set(previous)
+    return loaded
+
+def get_storage_backend():
+    """Returns the name of the storage backend in use."""
+    return _storage_backend
+
+def _sqlite_connection():
+    _ensure_data_dir_exists()
+    return sqlite_store.connect(os.path.join(data_dir(), DB_FILE_NAME))
 
 def _ensure_data_dir_exists():
     """Ensures that the data directory exists, creating it if necessary."""
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+    if not os.path.exists(data_dir()):
+        os.makedirs(data_dir())
+
+def _bump_version(kind):
+    """Marks one kind of data (see data_versions.KINDS) of the selected schedule set as changed."""
+    try:
+        data_versions.bump_version(data_dir(), kind)
+    except OSError as e:
+        print(f"Error updating the data versions in {data_dir()}: {e}")
+
+def get_data_versions():
+    """
+    Returns the version stamps of the selected schedule set, without loading its data.
+
+    Every save through this module (and every event appended to the event log) bumps
+    them, in this or any other process, so they change whenever the data does.
+    'base_counts' only changes with the counts the event log doesn't hold (see
+    load_substitution_counts), so followers of the log know when to reload them.
+
+    Returns:
+        tuple: See data_versions.read_versions.
+    """
+    return data_versions.read_versions(data_dir())
+
+def get_schedules_version():
+    """
+    Identifies the stored schedules of the selected set, to tell later whether they changed.
+
+    Returns:
+        list: [epoch, schedules version number], comparable with == and storable as JSON.
+    """
+    epoch, versions = get_data_versions()
+    return [epoch, versions['schedules'][0]]
+
+@contextlib.contextmanager
+def data_file_lock(lock_name):
+    """
+    Holds an exclusive named lock, shared by the threads of this process and,
+    where fcntl exists, by other processes using the same data directory.
+
+    Args:
+        lock_name (str): Name of the lock file inside the data directory of the selected
+            schedule set (e.g. ".contador.lock"), so each set has its own lock.
+    """
+    lock_path = os.path.join(data_dir(), lock_name)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(lock_path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        _ensure_data_dir_exists()
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_json_atomic(file_path, data):
+    """
+    Writes data as JSON to a temporary file and renames it over file_path.
+
+    Readers (in this or another process) see either the old or the new file,
+    never a partially written one.
+
+    Raises:
+        IOError: If the file can't be written.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            written_bytes = f.tell()
+        os.replace(temp_path, file_path)
+        if metrics.enabled:
+            file_name = os.path.basename(file_path)
+            metrics.inc_counter('sustituciones_json_saves_total', file=file_name)
+            metrics.inc_counter('sustituciones_json_save_bytes_total', written_bytes, file=file_name)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _write_schedule_lines_atomic(file_path, schedules_iter, min_count):
+    """
+    Writes schedules to a temporary file, one teacher per line, and renames it over file_path.
+
+    The file is a JSON list with each teacher on its own line ("[", one record per
+    line, "]"), so it loads as plain JSON but can also be read one teacher at a time
+    (see iter_schedules). Teachers are written as schedules_iter yields them.
+
+    Returns:
+        int: The number of teachers written. If it is below min_count, the temporary
+            file is discarded and file_path is left untouched.
+
+    Raises:
+        IOError: If the file can't be written.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    count = 0
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("[\n")
+            for teacher_info in schedules_iter:
+                if count:
+                    f.write(",\n")
+                f.write(json.dumps(teacher_info, ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+            written_bytes = f.tell()
+        if count < min_count:
+            os.remove(temp_path)
+            return count
+        os.replace(temp_path, file_path)
+        if metrics.enabled:
+            file_name = os.path.basename(file_path)
+            metrics.inc_counter('sustituciones_json_saves_total', file=file_name)
+            metrics.inc_counter('sustituciones_json_save_bytes_total', written_bytes, file=file_name)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
 
 def save_schedules(schedules_data, file_name="horarios.json"):
     """
@@ -16,14 +505,200 @@ def save_schedules(schedules_data, file_name="horarios.json"):
         schedules_data (list): A list of teacher schedules.
         file_name (str, optional): The name of the file. Defaults to "horarios.json".
     """
+    save_schedules_stream(schedules_data, file_name)
+
+def save_schedules_stream(schedules_iter, file_name="horarios.json", min_count=0):
+    """
+    Saves schedules as they are produced, without holding them all in memory.
+
+    Each teacher is written out as soon as schedules_iter yields it, to a temporary
+    file renamed into place at the end, so readers keep seeing the previous schedules
+    until the new ones are complete. The binary snapshot and the availability index
+    are then rebuilt by reading the new file back lazily.
+
+    Args:
+        schedules_iter (iterable): Teacher schedules, e.g. pdf_processor.iter_schedule_pdf().
+        file_name (str, optional): The name of the file. Defaults to "horarios.json".
+        min_count (int, optional): Fewest teachers to accept. With fewer, nothing is
+            replaced (e.g. 1, so a PDF that yields nothing doesn't wipe the schedules).
+
+    Returns:
+        int: The number of teachers read from schedules_iter, or None if they couldn't be saved.
+    """
+    if _storage_backend == 'sqlite':
+        count = sqlite_store.save_schedules(_sqlite_connection(), schedules_iter, min_count)
+        if count >= min_count:
+            print(f"Schedules saved to {os.path.join(data_dir(), DB_FILE_NAME)}")
+            _bump_version('schedules')
+        return count
     _ensure_data_dir_exists()
-    file_path = os.path.join(DATA_DIR, file_name)
+    file_path = os.path.join(data_dir(), file_name)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(schedules_data, f, indent=4, ensure_ascii=False)
+        count = _write_schedule_lines_atomic(file_path, schedules_iter, min_count)
+        if count < min_count:
+            return count
         print(f"Schedules saved to {file_path}")
     except IOError as e:
         print(f"Error saving schedules to {file_path}: {e}")
+        return None
+    finally:
+        _invalidate_cache(file_path)
+    # Keep the binary snapshot and the availability index in step with the schedules they were built from.
+    # A list is still at hand; a stream is read back from the file just written.
+    stored = schedules_iter if isinstance(schedules_iter, list) else iter_schedules(file_name)
+    save_schedule_snapshot(stored, file_name)
+    save_availability_index(build_availability_index(stored), file_name)
+    _bump_version('schedules')
+    return count
+
+def _snapshot_file_name(schedules_file_name):
+    """Returns the name of the binary snapshot stored next to a schedules file."""
+    base_name, _ = os.path.splitext(schedules_file_name)
+    return f"{base_name}.snapshot"
+
+def save_schedule_snapshot(schedules_data, schedules_file_name="horarios.json"):
+    """
+    Writes the binary snapshot of a schedules file (see schedule_snapshot.py).
+
+    The snapshot records the signature of the JSON file it was written with, so
+    it is ignored if the JSON is later replaced by other means.
+
+    Args:
+        schedules_data (iterable): The schedules just saved to schedules_file_name, iterated twice
+            (e.g. iter_schedules, so they are read back from the file instead of held in memory).
+        schedules_file_name (str, optional): The schedules file. Defaults to "horarios.json".
+    """
+    schedules_signature = _file_signature(os.path.join(data_dir(), schedules_file_name))
+    snapshot_path = os.path.join(data_dir(), _snapshot_file_name(schedules_file_name))
+    try:
+        write_snapshot(schedules_data, snapshot_path, schedules_signature[:2] if schedules_signature else (0, 0))
+    except (IOError, OSError) as e:
+        print(f"Error saving schedules snapshot to {snapshot_path}: {e}")
+
+def _open_snapshot(schedules_file_name):
+    """
+    Returns the mapped snapshot of a schedules file.
+
+    Returns None, so callers fall back to the JSON data, when the snapshot is
+    missing, invalid, or stale (its recorded JSON signature no longer matches).
+    """
+    snapshot_path = os.path.join(data_dir(), _snapshot_file_name(schedules_file_name))
+    snapshot_signature = _file_signature(snapshot_path)
+    if snapshot_signature is None:
+        return None
+    with _cache_lock:
+        cached = _snapshots.get(snapshot_path)
+    if cached is None or cached[0] != snapshot_signature:
+        try:
+            snapshot = ScheduleSnapshot(snapshot_path)
+        except (SnapshotError, OSError) as e:
+            print(f"Ignoring schedules snapshot {snapshot_path}: {e}")
+            snapshot = None
+        cached = (snapshot_signature, snapshot)
+        with _cache_lock:
+            _snapshots[snapshot_path] = cached
+    snapshot = cached[1]
+    schedules_signature = _file_signature(os.path.join(data_dir(), schedules_file_name))
+    if snapshot is None or schedules_signature is None or schedules_signature[:2] != snapshot.source_signature:
+        return None
+    return snapshot
+
+def _availability_index_file_name(schedules_file_name):
+    """Returns the name of the availability index stored next to a schedules file."""
+    base_name, _ = os.path.splitext(schedules_file_name)
+    return f"{base_name}_disponibilidad.json"
+
+def save_availability_index(availability_index, schedules_file_name="horarios.json"):
+    """
+    Saves the availability index for a schedules file.
+
+    Args:
+        availability_index (dict): Index built by build_availability_index.
+        schedules_file_name (str, optional): The schedules file the index belongs to.
+            Defaults to "horarios.json".
+    """
+    _ensure_data_dir_exists()
+    file_path = os.path.join(data_dir(), _availability_index_file_name(schedules_file_name))
+    try:
+        _write_json_atomic(file_path, availability_index)
+    except IOError as e:
+        print(f"Error saving availability index to {file_path}: {e}")
+    finally:
+        _invalidate_cache(file_path)
+
+def load_availability_index(schedules_file_name="horarios.json"):
+    """
+    Loads the availability index for a schedules file.
+
+    The index is rebuilt from the schedules (and saved again) when it is missing,
+    unreadable or older than the schedules file, e.g. after horarios.json was
+    replaced by hand.
+
+    Args:
+        schedules_file_name (str, optional): The schedules file the index belongs to.
+            Defaults to "horarios.json".
+
+    Returns:
+        dict: The availability index (read-only), or an empty dict if there are no schedules.
+    """
+    schedules_path = os.path.join(data_dir(), schedules_file_name)
+    index_path = os.path.join(data_dir(), _availability_index_file_name(schedules_file_name))
+    schedules_signature = _file_signature(schedules_path)
+    if schedules_signature is None:
+        return {}
+    index_signature = _file_signature(index_path)
+    if index_signature is not None and index_signature[0] >= schedules_signature[0]:
+        try:
+            return _load_json_cached(index_path)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading availability index from {index_path}: {e}. Rebuilding it.")
+
+    availability_index = build_availability_index(load_schedules(schedules_file_name))
+    save_availability_index(availability_index, schedules_file_name)
+    return availability_index
+
+def get_available_teachers(target_day_of_week, target_time_slot, schedules_file_name="horarios.json"):
+    """
+    Finds the teachers available for a time slot through the backend's index.
+
+    With the JSON backend this is a binary search in the mapped schedules
+    snapshot, or a lookup in the availability index when there is no valid
+    snapshot; with SQLite it is an indexed query on (day, slot, type).
+
+    Args:
+        target_day_of_week (str): The day to check (e.g., "Lunes").
+        target_time_slot (str): The time slot to check (e.g., "08:00-09:00" or "8:00 - 9:00"),
+            matched in its canonical form (see time_slots.canonical_time).
+        schedules_file_name (str, optional): The schedules file (JSON backend only).
+
+    Returns:
+        list: A list of teacher names who are available.
+    """
+    target_time_slot = canonical_time(target_time_slot)
+    if _storage_backend == 'sqlite':
+        return sqlite_store.find_available_teachers(_sqlite_connection(), target_day_of_week, target_time_slot)
+    snapshot = _open_snapshot(schedules_file_name)
+    if snapshot is not None:
+        return snapshot.available_teachers(target_day_of_week, target_time_slot)
+    return find_available_teachers([], target_day_of_week, target_time_slot,
+                                   load_availability_index(schedules_file_name))
+
+def load_teacher_names(file_name="horarios.json"):
+    """
+    Returns the sorted, distinct names of the teachers with a stored schedule.
+
+    Args:
+        file_name (str, optional): The schedules file (JSON backend only).
+
+    Returns:
+        list: Teacher names.
+    """
+    if _storage_backend == 'sqlite':
+        return sqlite_store.load_teacher_names(_sqlite_connection())
+    snapshot = _open_snapshot(file_name)
+    if snapshot is not None:
+        return snapshot.teacher_names()
+    return sorted(set(s.get('teacher_name') for s in load_schedules(file_name) if s.get('teacher_name')))
 
 def load_schedules(file_name="horarios.json"):
     """
@@ -34,14 +709,14 @@ def load_schedules(file_name="horarios.json"):
 
     Returns:
         list: The loaded schedules data, or an empty list if the file doesn't exist or is invalid.
+              The data is shared through the in-process cache and is read-only.
     """
-    file_path = os.path.join(DATA_DIR, file_name)
-    if not os.path.exists(file_path):
-        return []
+    if _storage_backend == 'sqlite':
+        return sqlite_store.load_schedules(_sqlite_connection())
+    file_path = os.path.join(data_dir(), file_name)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data
+        data = _load_json_cached(file_path)
+        return data if data is not None else []
     except json.JSONDecodeError:
         print(f"Error decoding JSON from {file_path}. Returning empty list.")
         return []
@@ -49,46 +724,524 @@ def load_schedules(file_name="horarios.json"):
         print(f"Error loading schedules from {file_path}: {e}. Returning empty list.")
         return []
 
-def save_substitution_counts(counts_data, file_name="sustituciones_contador.json"):
+class _ScheduleLines:
+    """
+    Lazy view of a schedules file: every iteration reads the file again, one teacher at a time.
+
+    Files written by save_schedules hold one teacher per line. Files in another layout
+    (written by older versions, or edited by hand) are loaded whole instead.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def __iter__(self):
+        try:
+            f = open(self.file_path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            first_line = f.readline().strip()
+            if first_line != "[":
+                f.seek(0)
+                yield from json.load(f) if first_line else []
+                return
+            for line_number, line in enumerate(f, start=2):
+                line = line.strip()
+                if not line or line == "]":
+                    continue
+                try:
+                    teacher_info = json.loads(line[:-1] if line.endswith(",") else line)
+                except json.JSONDecodeError:
+                    if line_number > 2:
+                        raise
+                    f.seek(0) # Not one teacher per line: load the whole file
+                    yield from json.load(f)
+                    return
+                yield teacher_info
+
+def iter_schedules(file_name="horarios.json"):
     """
-    Saves substitution counts to a JSON file.
+    Returns the stored schedules as a lazy iterable, for reading large files in constant memory.
+
+    Unlike load_schedules, the teachers are neither cached nor read-only: each iteration
+    reads the file again and builds fresh dictionaries.
 
     Args:
-        counts_data (dict): A dictionary of teacher names and their substitution counts.
-        file_name (str, optional): The name of the file. Defaults to "sustituciones_contador.json".
+        file_name (str, optional): The schedules file (JSON backend only). Defaults to "horarios.json".
+
+    Returns:
+        iterable: Teacher schedules, in the order they were saved. Iterating it may raise
+            json.JSONDecodeError or IOError if the file is damaged or unreadable.
+    """
+    if _storage_backend == 'sqlite':
+        return load_schedules()
+    return _ScheduleLines(os.path.join(data_dir(), file_name))
+
+def _staged_file_name(upload_id):
+    """Returns the name of the file holding an upload's schedules until it is applied."""
+    return f"{STAGED_SCHEDULES_PREFIX}{upload_id}.json"
+
+def stage_schedules(schedules_iter, upload_id, min_count=0):
+    """
+    Saves uploaded schedules next to the stored ones, without applying them, so the
+    changes can be reviewed first (see diff_staged_schedules and apply_staged_schedules).
+
+    The schedules are written as they are produced, as in save_schedules_stream, whatever
+    the storage backend. Only the latest upload of a schedule set stays staged: staging
+    one discards the others.
+
+    Args:
+        schedules_iter (iterable): Teacher schedules, e.g. pdf_processor.iter_schedule_pdf().
+        upload_id (str): Identifies the upload (e.g. the ingestion job id).
+        min_count (int, optional): Fewest teachers to accept. With fewer, nothing is staged.
+
+    Returns:
+        int: The number of teachers read from schedules_iter, or None if they couldn't be saved.
+    """
+    _ensure_data_dir_exists()
+    file_path = os.path.join(data_dir(), _staged_file_name(upload_id))
+    try:
+        count = _write_schedule_lines_atomic(file_path, schedules_iter, min_count)
+    except IOError as e:
+        print(f"Error staging schedules to {file_path}: {e}")
+        return None
+    if count >= min_count:
+        with data_file_lock('.horarios.lock'): # Not while another upload is being applied
+            for name in os.listdir(data_dir()):
+                if name.startswith(STAGED_SCHEDULES_PREFIX) and name != _staged_file_name(upload_id):
+                    _remove_staged_schedules(name[len(STAGED_SCHEDULES_PREFIX):-len('.json')])
+    return count
+
+def load_staged_schedules(upload_id):
     """
+    Returns the schedules of a staged upload as a lazy iterable (see iter_schedules),
+    or None if it is not (or no longer) staged.
+    """
+    file_path = os.path.join(data_dir(), _staged_file_name(upload_id))
+    if not os.path.exists(file_path):
+        return None
+    return _ScheduleLines(file_path)
+
+def _remove_staged_schedules(upload_id):
+    try:
+        os.remove(os.path.join(data_dir(), _staged_file_name(upload_id)))
+        return True
+    except OSError:
+        return False
+
+def discard_staged_schedules(upload_id):
+    """
+    Deletes the schedules of a staged upload, if they are still there.
+
+    Holds the same lock as apply_staged_schedules, so an upload is either applied or discarded.
+
+    Returns:
+        bool: True if the upload was staged, False if it was already applied or discarded.
+    """
+    with data_file_lock('.horarios.lock'):
+        return _remove_staged_schedules(upload_id)
+
+def diff_staged_schedules(upload_id, file_name="horarios.json"):
+    """
+    Compares a staged upload with the stored schedules, teacher by teacher.
+
+    Both are read from disk twice (see schedule_diff.diff_schedules_streamed), under the
+    schedules lock so neither changes in between; only the teachers that differ are
+    held in memory.
+
+    Args:
+        upload_id (str): The id the upload was staged with.
+        file_name (str, optional): The schedules file (JSON backend only).
+
+    Returns:
+        dict: See schedule_diff.diff_schedules, or None if the upload is not staged.
+    """
+    with data_file_lock('.horarios.lock'):
+        staged = load_staged_schedules(upload_id)
+        if staged is None:
+            return None
+        try:
+            return schedule_diff.diff_schedules_streamed(iter_schedules(file_name), staged)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error comparing staged schedules {upload_id}: {e}")
+            return None
+
+def apply_staged_schedules(upload_id, renames=None, file_name="horarios.json",
+                           counts_file_name="sustituciones_contador.json", base_version=None):
+    """
+    Applies a staged upload to the stored schedules, only for the teachers that differ.
+
+    Unchanged teachers keep their stored entries, and the derived data follows: SQLite
+    deletes and inserts only the rows of the changed teachers; with JSON, the availability
+    index is patched in the slots of the changed teachers (the schedules file and its
+    binary snapshot are rewritten, as they are single files). The substitution counts of
+    renamed teachers move to their new names (see rename_substitution_counts); those of
+    removed teachers stay in the counts, in case they come back.
+
+    Everything happens under one lock, so of two requests applying the same upload (in this
+    or another process), the second finds it no longer staged. The stored and staged
+    schedules are streamed from disk (see schedule_diff.merge_schedules_streamed): only
+    the teachers that differ are held in memory.
+
+    Args:
+        upload_id (str): The id the upload was staged with.
+        renames (dict, optional): Removed teachers and the added teachers they were renamed to.
+        file_name (str, optional): The schedules file (JSON backend only).
+        counts_file_name (str, optional): The counts file (JSON backend only).
+        base_version (list, optional): get_schedules_version() when the upload was reviewed.
+
+    Returns:
+        list: The changes applied (see schedule_diff.merge_schedules), or None if the upload
+            is no longer staged.
+
+    Raises:
+        SchedulesChangedError: If the stored schedules are no longer at base_version; nothing is applied.
+        IOError: If the schedules couldn't be saved; the upload stays staged.
+    """
+    with data_file_lock('.horarios.lock'):
+        staged = load_staged_schedules(upload_id)
+        if staged is None:
+            return None
+        if base_version is not None and get_schedules_version() != list(base_version):
+            raise SchedulesChangedError("The stored schedules changed since the upload was reviewed.")
+        try:
+            merged, changes = schedule_diff.merge_schedules_streamed(iter_schedules(file_name), staged, renames)
+        except json.JSONDecodeError as e:
+            print(f"Error reading staged schedules {upload_id}: {e}")
+            return None
+        if changes and _storage_backend == 'sqlite':
+            sqlite_store.update_teachers(_sqlite_connection(), changes, merged)
+            _bump_version('schedules')
+        elif changes:
+            previous_index = load_availability_index(file_name) # Read before the schedules file changes
+            file_path = os.path.join(data_dir(), file_name)
+            try:
+                _write_schedule_lines_atomic(file_path, merged, 0)
+                print(f"Schedules saved to {file_path}")
+            except IOError as e:
+                print(f"Error saving schedules to {file_path}: {e}")
+                raise
+            finally:
+                _invalidate_cache(file_path)
+            stored = iter_schedules(file_name) # Read back lazily, as in save_schedules_stream
+            save_schedule_snapshot(stored, file_name)
+            save_availability_index(schedule_diff.update_availability_index(previous_index, stored, changes),
+                                    file_name)
+            _bump_version('schedules')
+        rename_substitution_counts({old_name: new_name for old_name, new_name in changes
+                                    if old_name is not None and new_name is not None and old_name != new_name},
+                                   counts_file_name)
+        _remove_staged_schedules(upload_id)
+    return changes
+
+def _base_counts_file_name(counts_file_name):
+    base_name, extension = os.path.splitext(counts_file_name)
+    return f"{base_name}_base{extension}"
+
+def _load_base_counts(file_name):
+    """Loads the counts kept outside the event log (see load_substitution_counts), or {} if there are none."""
+    file_path = os.path.join(data_dir(), _base_counts_file_name(file_name))
+    try:
+        data = _load_json_cached(file_path)
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from {file_path}. Ignoring base counts.")
+        return {}
+    except IOError as e:
+        print(f"Error loading base counts from {file_path}: {e}. Ignoring base counts.")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def _save_base_counts(base_counts, file_name):
+    """Writes the counts kept outside the event log. Call with .contador.lock held."""
     _ensure_data_dir_exists()
-    file_path = os.path.join(DATA_DIR, file_name)
+    file_path = os.path.join(data_dir(), _base_counts_file_name(file_name))
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(counts_data, f, indent=4, ensure_ascii=False)
+        _write_json_atomic(file_path, base_counts)
         print(f"Substitution counts saved to {file_path}")
     except IOError as e:
         print(f"Error saving substitution counts to {file_path}: {e}")
+        return
+    finally:
+        _invalidate_cache(file_path)
+    _bump_version('counts')
+    _bump_version('base_counts')
+
+def _renamed_event_counts(renames=None):
+    """Counts of the event log, with substitutions logged under a former name counted for the current one."""
+    from . import event_log # event_log imports this module
+    if renames is None:
+        renames = load_teacher_renames()
+    event_counts, log_offset = event_log.load_event_counts_at_offset()
+    counts = {}
+    for teacher_name, count in event_counts.items():
+        teacher_name = renames.get(teacher_name, teacher_name)
+        counts[teacher_name] = counts.get(teacher_name, 0) + count
+    return counts, log_offset
+
+def _upgrade_counts_file(file_name):
+    """
+    Turns a counts file from before the event log was the source of the counts into base counts.
+
+    Back then every confirmation was added both to the file and to the log, so the base is what
+    the file holds beyond the log's counts. The old file is left untouched.
+    """
+    if os.path.exists(os.path.join(data_dir(), _base_counts_file_name(file_name))):
+        return
+    file_path = os.path.join(data_dir(), file_name)
+    if not os.path.exists(file_path):
+        return
+    with data_file_lock('.contador.lock'), data_file_lock('.eventos.lock'):
+        if os.path.exists(os.path.join(data_dir(), _base_counts_file_name(file_name))):
+            return # Upgraded by another process meanwhile
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                legacy_counts = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading substitution counts from {file_path}: {e}. Starting from the event log.")
+            legacy_counts = {}
+        event_counts, _ = _renamed_event_counts()
+        base_counts = {teacher_name: legacy_counts.get(teacher_name, 0) - event_counts.get(teacher_name, 0)
+                       for teacher_name in set(legacy_counts) | set(event_counts)}
+        _save_base_counts({teacher_name: count for teacher_name, count in base_counts.items() if count},
+                          file_name)
+
+_merged_counts = {} # Base counts file path -> (base counts, renames, log offset, merged counts)
+
+def save_substitution_counts(counts_data, file_name="sustituciones_contador.json"):
+    """
+    Replaces the substitution counts.
+
+    With JSON, the counts that the event log doesn't explain are saved as base counts
+    (see load_substitution_counts), so that the loaded counts become counts_data.
+
+    Args:
+        counts_data (dict): A dictionary of teacher names and their substitution counts.
+        file_name (str, optional): The name of the file. Defaults to "sustituciones_contador.json".
+    """
+    if _storage_backend == 'sqlite':
+        sqlite_store.save_substitution_counts(_sqlite_connection(), counts_data)
+        _bump_version('counts')
+        _bump_version('base_counts')
+        return
+    _upgrade_counts_file(file_name)
+    with data_file_lock('.contador.lock'), data_file_lock('.eventos.lock'):
+        event_counts, _ = _renamed_event_counts()
+        base_counts = {teacher_name: count - event_counts.get(teacher_name, 0)
+                       for teacher_name, count in counts_data.items()}
+        for teacher_name, count in event_counts.items():
+            if teacher_name not in counts_data:
+                base_counts[teacher_name] = -count
+        _save_base_counts(base_counts, file_name)
 
 def load_substitution_counts(file_name="sustituciones_contador.json"):
     """
-    Loads substitution counts from a JSON file.
+    Loads the substitution counts.
+
+    SQLite keeps them in a table. With JSON they are derived from the event log (its
+    snapshot plus the events appended after it, see event_log.load_event_counts), with
+    substitutions logged under a former teacher name counted for the current one, plus
+    the base counts saved next to file_name: counts from before the log, and manual
+    changes (save_substitution_counts, increment_substitution_counts). Confirming a
+    substitution only appends to the log.
 
     Args:
         file_name (str, optional): The name of the file. Defaults to "sustituciones_contador.json".
 
     Returns:
-        dict: The loaded substitution counts, or an empty dict if the file doesn't exist or is invalid.
+        dict: The substitution counts, or an empty dict if there are none.
+              The data is shared through the in-process cache and is read-only.
     """
-    file_path = os.path.join(DATA_DIR, file_name)
-    if not os.path.exists(file_path):
+    return load_substitution_counts_at_log_offset(file_name)[0]
+
+def load_substitution_counts_at_log_offset(file_name="sustituciones_contador.json"):
+    """
+    Loads the substitution counts together with the end of the event log they include.
+
+    The substitutions read_events_after returns for that offset are not in the counts yet,
+    so a reader can keep up with the log without counting an event twice.
+
+    Args:
+        file_name (str, optional): The name of the file. Defaults to "sustituciones_contador.json".
+
+    Returns:
+        tuple: (counts as returned by load_substitution_counts, log offset in bytes).
+    """
+    from . import event_log # event_log imports this module
+    if _storage_backend == 'sqlite':
+        # Appends store the log offset with the counts (see count_logged_substitutions)
+        counts, log_offset = sqlite_store.load_substitution_counts_at_log_offset(_sqlite_connection())
+        if log_offset is not None:
+            return counts, log_offset
+        with data_file_lock('.eventos.lock'): # Counts stored before the offset was: they include the whole log
+            return sqlite_store.load_substitution_counts(_sqlite_connection()), event_log.get_log_offset()
+    _upgrade_counts_file(file_name)
+    base_path = os.path.join(data_dir(), _base_counts_file_name(file_name))
+    base_counts = _load_base_counts(file_name)
+    renames = load_teacher_renames()
+    merged = _merged_counts.get(base_path)
+    log_offset = event_log.get_log_offset()
+    if merged is not None and merged[0] is base_counts and merged[1] is renames and merged[2] == log_offset:
+        return merged[3], log_offset
+
+    event_counts, log_offset = _renamed_event_counts(renames)
+    counts = dict(base_counts)
+    for teacher_name, count in event_counts.items():
+        counts[teacher_name] = counts.get(teacher_name, 0) + count
+    counts = _freeze(counts)
+    _merged_counts[base_path] = (base_counts, renames, log_offset, counts)
+    return counts, log_offset
+
+def increment_substitution_counts(increments, file_name="sustituciones_contador.json"):
+    """
+    Adds to the substitution counts of one or more teachers as a single atomic update.
+
+    Confirmed substitutions are counted by appending them to the event log instead
+    (event_log.append_substitution_events); this is for changes without an event.
+    SQLite applies one UPSERT per teacher in one transaction. The JSON backend updates
+    the base counts while holding a lock, so concurrent updates don't overwrite each other.
+
+    Args:
+        increments (dict): Teacher names and the amount to add to their counts.
+        file_name (str, optional): The counts file (JSON backend only).
+    """
+    if _storage_backend == 'sqlite':
+        sqlite_store.increment_substitution_counts(_sqlite_connection(), increments)
+        _bump_version('counts')
+        _bump_version('base_counts')
+        return
+    _upgrade_counts_file(file_name)
+    with data_file_lock('.contador.lock'):
+        base_counts = dict(_load_base_counts(file_name))
+        for teacher_name, amount in increments.items():
+            base_counts[teacher_name] = base_counts.get(teacher_name, 0) + amount
+        _save_base_counts(base_counts, file_name)
+
+def count_logged_substitutions(increments, log_offset):
+    """
+    Adds substitutions just appended to the event log to the stored counts.
+
+    Only SQLite keeps counts apart from the log; the JSON backend derives them from it.
+    The new end of the log is stored in the same transaction, so counts and offset are
+    read together without locking (see load_substitution_counts_at_log_offset).
+    Unlike increment_substitution_counts, this leaves the 'base_counts' version alone:
+    readers that follow the log (fairness) already see these substitutions there.
+    Call with .eventos.lock held, as event_log.append_substitution_events does.
+
+    Args:
+        increments (dict): Teacher names and the number of substitutions appended for them.
+        log_offset (int): End of the event log, in bytes, after the append.
+    """
+    if _storage_backend == 'sqlite':
+        sqlite_store.increment_substitution_counts(_sqlite_connection(), increments, log_offset)
+
+def rename_substitution_counts(renames, file_name="sustituciones_contador.json",
+                               renames_file_name="profesores_renombrados.json"):
+    """
+    Moves the substitution counts of renamed teachers to their new names, and records the renames.
+
+    The record (always JSON, see load_teacher_renames) lets substitutions logged in the event
+    log under an old name count for the new one; with JSON, only the base counts move.
+
+    Args:
+        renames (dict): Old and new teacher names.
+        file_name (str, optional): The counts file (JSON backend only).
+        renames_file_name (str, optional): The file recording the renames.
+    """
+    if not renames:
+        return
+    if _storage_backend == 'sqlite':
+        sqlite_store.rename_substitution_counts(_sqlite_connection(), renames)
+        _bump_version('counts')
+        _bump_version('base_counts')
+    else:
+        _upgrade_counts_file(file_name)
+        with data_file_lock('.contador.lock'):
+            base_counts = dict(_load_base_counts(file_name))
+            if any(old_name in base_counts for old_name in renames):
+                for old_name, new_name in renames.items():
+                    if old_name in base_counts:
+                        base_counts[new_name] = base_counts.get(new_name, 0) + base_counts.pop(old_name)
+                _save_base_counts(base_counts, file_name)
+
+    with data_file_lock('.renombres.lock'):
+        # Earlier names follow the teacher to the latest one; renaming back drops the entry
+        recorded = {old_name: renames.get(new_name, new_name)
+                    for old_name, new_name in load_teacher_renames(renames_file_name).items()}
+        recorded.update(renames)
+        recorded = {old_name: new_name for old_name, new_name in recorded.items() if old_name != new_name}
+        file_path = os.path.join(data_dir(), renames_file_name)
+        try:
+            _write_json_atomic(file_path, recorded)
+        except IOError as e:
+            print(f"Error saving teacher renames to {file_path}: {e}")
+        finally:
+            _invalidate_cache(file_path)
+    _bump_version('counts')
+
+def load_teacher_renames(file_name="profesores_renombrados.json"):
+    """
+    Loads the renames recorded when schedule uploads were applied.
+
+    Args:
+        file_name (str, optional): The name of the file. Defaults to "profesores_renombrados.json".
+
+    Returns:
+        dict: Former teacher names and the current name of each, or an empty dict if there are none.
+    """
+    file_path = os.path.join(data_dir(), file_name)
+    try:
+        data = _load_json_cached(file_path)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error loading teacher renames from {file_path}: {e}. Ignoring renames.")
         return {}
+    return data if isinstance(data, dict) else {}
+
+def load_teacher_weights(file_name="pesos_profesores.json"):
+    """
+    Loads the per-teacher fairness weights (e.g. 0.5 for a half-time contract).
+
+    Weights are configuration edited by hand, so they are always read from JSON,
+    whatever the storage backend. Non-positive or non-numeric weights are ignored.
+
+    Args:
+        file_name (str, optional): The name of the file. Defaults to "pesos_profesores.json".
+
+    Returns:
+        dict: Teacher names and their weights, or an empty dict if the file doesn't exist or is invalid.
+    """
+    file_path = os.path.join(data_dir(), file_name)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON from {file_path}. Returning empty dictionary.")
+        data = _load_json_cached(file_path)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error loading teacher weights from {file_path}: {e}. Ignoring weights.")
         return {}
-    except IOError as e:
-        print(f"Error loading substitution counts from {file_path}: {e}. Returning empty dictionary.")
+    if not isinstance(data, dict):
         return {}
+    return {name: float(weight) for name, weight in data.items()
+            if isinstance(weight, (int, float)) and weight > 0}
+
+def migrate_json_to_sqlite(schedules_file_name="horarios.json", counts_file_name="sustituciones_contador.json"):
+    """
+    One-shot migration of the JSON files into the SQLite database, replacing its contents.
+
+    The JSON files are left untouched, so switching back to the JSON backend is possible.
+
+    Returns:
+        tuple: (number of schedules, number of counts) copied.
+    """
+    previous_backend = _storage_backend
+    configure_storage('json')
+    try:
+        schedules_data = load_schedules(schedules_file_name)
+        counts_data, log_offset = load_substitution_counts_at_log_offset(counts_file_name)
+    finally:
+        configure_storage(previous_backend)
+    sqlite_store.migrate_from_json(_sqlite_connection(), schedules_data, counts_data, log_offset)
+    _bump_version('schedules')
+    _bump_version('counts')
+    _bump_version('base_counts')
+    return len(schedules_data), len(counts_data)
 
 if __name__ == "__main__":
     print("Testing data_manager.py...")
@@ -114,6 +1267,36 @@ if __name__ == "__main__":
         print("  No schedules loaded or file was empty/corrupt.")
     assert loaded_schedules == sample_schedules, "Mismatch in loaded schedules"
 
+    # Test the availability index saved alongside the schedules
+    sample_schedules[1]['schedule']['Martes'].append({'time': '11:00-12:00', 'subject': 'GUARDIA', 'type': 'refuerzo'})
+    save_schedules(sample_schedules, "test_horarios.json")
+    loaded_index = load_availability_index("test_horarios.json")
+    print(f"\nLoaded Availability Index: {loaded_index}")
+    assert loaded_index == {'Martes': {'11:00-12:00': ['Profesora Beta']}}, "Mismatch in availability index"
+
+    # Test the binary snapshot: used while it matches the JSON, ignored once the JSON is replaced
+    assert _open_snapshot("test_horarios.json") is not None, "Snapshot not written with the schedules"
+    assert get_available_teachers('Martes', '11:00-12:00', "test_horarios.json") == ['Profesora Beta']
+    assert get_available_teachers('Martes', '11:00 - 12:00', "test_horarios.json") == ['Profesora Beta']
+    assert load_teacher_names("test_horarios.json") == ['Profesor Alpha', 'Profesora Beta']
+    sample_schedules[0]['schedule']['Lunes'][0]['type'] = 'guardia'
+    _write_json_atomic(os.path.join(DATA_DIR, "test_horarios.json"), sample_schedules) # Not through save_schedules
+    assert _open_snapshot("test_horarios.json") is None, "Stale snapshot used"
+    assert get_available_teachers('Lunes', '08:00-09:00', "test_horarios.json") == ['Profesor Alpha']
+
+    # Test streamed saving and lazy reading: one teacher per line, whole-file fallback for other layouts
+    assert list(iter_schedules("test_horarios.json")) == sample_schedules # Indented file written above
+    assert save_schedules_stream(iter(sample_schedules), "test_horarios.json") == 2
+    with open(os.path.join(DATA_DIR, "test_horarios.json"), encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 4, "Not one teacher per line"
+    assert list(iter_schedules("test_horarios.json")) == sample_schedules
+    assert load_schedules("test_horarios.json") == sample_schedules
+    assert _open_snapshot("test_horarios.json") is not None, "Snapshot not rebuilt from the stream"
+    assert get_available_teachers('Lunes', '08:00-09:00', "test_horarios.json") == ['Profesor Alpha']
+    # Too few teachers: the stored schedules are kept
+    assert save_schedules_stream(iter([]), "test_horarios.json", min_count=1) == 0
+    assert load_schedules("test_horarios.json") == sample_schedules
+
     # Test saving and loading substitution counts
     sample_counts = {
         'Profesor Alpha': 3,
@@ -130,6 +1313,155 @@ if __name__ == "__main__":
         print("  No counts loaded or file was empty/corrupt.")
     assert loaded_counts == sample_counts, "Mismatch in loaded counts"
 
+    # Test the in-process cache: repeated loads are served from memory and are read-only
+    clear_cache()
+    load_substitution_counts("test_sustituciones_contador.json")
+    cached_counts = load_substitution_counts("test_sustituciones_contador.json")
+    print(f"\nCache stats after two loads: {get_cache_stats()}")
+    assert get_cache_stats()['hits'] == 1 and get_cache_stats()['misses'] == 1, "Second load did not hit the cache"
+    try:
+        cached_counts['Profesor Alpha'] = 100
+        raise AssertionError("Cached counts could be modified")
+    except TypeError:
+        pass
+    modified_counts = dict(cached_counts)
+    modified_counts['Profesor Alpha'] = 4
+    save_substitution_counts(modified_counts, "test_sustituciones_contador.json")
+    assert load_substitution_counts("test_sustituciones_contador.json")['Profesor Alpha'] == 4, "Cache not invalidated on save"
+
+    # Test the SQLite backend: migration, indexed lookups and atomic increments
+    migrate_json_to_sqlite("test_horarios.json", "test_sustituciones_contador.json")
+    configure_storage('sqlite')
+    try:
+        assert load_schedules() == sample_schedules, "Mismatch in schedules migrated to SQLite"
+        assert load_substitution_counts() == modified_counts, "Mismatch in counts migrated to SQLite"
+        assert get_available_teachers('Martes', '11:00-12:00') == ['Profesora Beta']
+        increment_substitution_counts({'Profesor Alpha': 1, 'Profesor Nuevo': 2})
+        sqlite_counts = load_substitution_counts()
+        print(f"\nSQLite counts after increments: {sqlite_counts}")
+        assert sqlite_counts['Profesor Alpha'] == 5 and sqlite_counts['Profesor Nuevo'] == 2
+    finally:
+        configure_storage('json')
+        sqlite_store.connect(os.path.join(DATA_DIR, DB_FILE_NAME)).close()
+        sqlite_store._local.connections.clear()
+
+    # Test schedule sets: each set keeps its own schedules and counts
+    create_schedule_set("test-centro/2026-27")
+    assert "test-centro/2026-27" in list_schedule_sets()
+    for bad_name in ("../2026", "centro", "centro/curso/extra", ".oculto/2026"):
+        try:
+            select_schedule_set(bad_name)
+            raise AssertionError(f"Invalid schedule set accepted: {bad_name}")
+        except ValueError:
+            pass
+    with schedule_set("test-centro/2026-27"):
+        assert data_dir() == os.path.join(DATA_DIR, SCHEDULE_SETS_DIR, "test-centro", "2026-27")
+        assert load_schedules("test_horarios.json") == [], "New set sees the default set's schedules"
+        save_schedules(sample_schedules[:1], "test_horarios.json")
+        increment_substitution_counts({'Profesor Alpha': 1}, "test_sustituciones_contador.json")
+        assert load_substitution_counts("test_sustituciones_contador.json") == {'Profesor Alpha': 1}
+    assert get_schedule_set() is None
+    assert load_substitution_counts("test_sustituciones_contador.json")['Profesor Alpha'] == 4
+    assert len(load_schedules("test_horarios.json")) == 2
+
+    # Test the memory budget: going over it evicts the least recently used set, not the one in use
+    clear_cache()
+    load_schedules("test_horarios.json")
+    with schedule_set("test-centro/2026-27"):
+        load_schedules("test_horarios.json")
+    stats = get_cache_stats()
+    print(f"\nCache stats with two schedule sets: {stats}")
+    assert len(stats['datasets']) == 2 and stats['bytes'] > 0
+    configure_cache(stats['bytes'] - 1)
+    stats = get_cache_stats()
+    assert stats['evictions'] == 1, stats
+    assert stats['datasets'] == [os.path.join(DATA_DIR, SCHEDULE_SETS_DIR, "test-centro", "2026-27")], stats
+    assert len(load_schedules("test_horarios.json")) == 2 # Evicted sets are simply re-read from disk
+    configure_cache(256 * 1024 * 1024)
+
+    # Test prewarming: every set is loaded, and later loads are cache hits
+    clear_cache()
+    assert prewarm_caches(schedules_file_name="test_horarios.json",
+                          counts_file_name="test_sustituciones_contador.json") == {"test-centro/2026-27": 1, None: 2}
+    misses = get_cache_stats()['misses']
+    with schedule_set("test-centro/2026-27"):
+        load_schedules("test_horarios.json")
+    load_substitution_counts("test_sustituciones_contador.json")
+    assert get_cache_stats()['misses'] == misses and get_schedule_set() is None
+    import shutil
+    shutil.rmtree(os.path.join(DATA_DIR, SCHEDULE_SETS_DIR))
+
+    # Test staged uploads: reviewed as a per-teacher diff, then applied only where teachers differ
+    stored = load_schedules("test_horarios.json")
+    upload = [
+        {'teacher_name': 'Profesora Beta', 'schedule': {'Martes': stored[1]['schedule']['Martes'][:1]}},
+        {'teacher_name': 'Profesora Delta', 'schedule': {'Lunes': [{'time': '08:00-09:00', 'subject': 'GUARDIA', 'type': 'guardia'}]}},
+        {'teacher_name': 'Profesor Alfa', 'schedule': stored[0]['schedule']},
+    ]
+    assert stage_schedules(iter(upload), "prueba", min_count=1) == 3
+    assert load_schedules("test_horarios.json") == stored, "Staging changed the stored schedules"
+    diff = diff_staged_schedules("prueba", "test_horarios.json")
+    print(f"\nStaged upload diff: {schedule_diff.diff_summary(diff)}")
+    assert schedule_diff.diff_summary(diff) == {'added': 2, 'removed': 1, 'changed': 1, 'renamed': 1, 'unchanged': 0}
+    assert diff['renamed'][0]['old_name'] == 'Profesor Alpha' and diff['renamed'][0]['new_name'] == 'Profesor Alfa'
+    apply_staged_schedules("prueba", {'Profesor Alpha': 'Profesor Alfa'}, "test_horarios.json",
+                           "test_sustituciones_contador.json")
+    applied = load_schedules("test_horarios.json")
+    assert [t['teacher_name'] for t in applied] == ['Profesor Alfa', 'Profesora Beta', 'Profesora Delta']
+    assert load_availability_index("test_horarios.json") == build_availability_index(applied)
+    assert get_available_teachers('Lunes', '08:00-09:00', "test_horarios.json") == ['Profesor Alfa', 'Profesora Delta']
+    renamed_counts = load_substitution_counts("test_sustituciones_contador.json")
+    assert renamed_counts['Profesor Alfa'] == 4 and 'Profesor Alpha' not in renamed_counts, "Count not moved on rename"
+    assert load_teacher_renames() == {'Profesor Alpha': 'Profesor Alfa'}
+    assert load_staged_schedules("prueba") is None, "Applied upload still staged"
+    assert apply_staged_schedules("prueba", file_name="test_horarios.json") is None
+    # A later upload replaces an earlier one still waiting for review
+    stage_schedules(iter(upload), "primera")
+    stage_schedules(iter(stored), "segunda")
+    assert load_staged_schedules("primera") is None and not discard_staged_schedules("primera")
+    # An upload reviewed against schedules that changed since is not applied
+    reviewed_version = get_schedules_version()
+    save_schedules(applied, "test_horarios.json")
+    try:
+        apply_staged_schedules("segunda", file_name="test_horarios.json", base_version=reviewed_version)
+        raise AssertionError("Upload applied over schedules that changed since the review")
+    except SchedulesChangedError:
+        pass
+    assert load_staged_schedules("segunda") is not None and load_schedules("test_horarios.json") == applied
+
+    # Same with SQLite: only the changed teachers' rows are replaced, in place
+    migrate_json_to_sqlite("test_horarios.json", "test_sustituciones_contador.json")
+    configure_storage('sqlite')
+    try:
+        apply_staged_schedules("segunda", {'Profesor Alfa': 'Profesor Alpha'})
+        assert [t['teacher_name'] for t in load_schedules()] == ['Profesor Alpha', 'Profesora Beta'], load_schedules()
+        assert load_schedules() == stored
+        assert load_substitution_counts()['Profesor Alpha'] == 4 and 'Profesor Alfa' not in load_substitution_counts()
+        assert load_teacher_renames() == {'Profesor Alfa': 'Profesor Alpha'} # Renamed back: no self-reference
+    finally:
+        configure_storage('json')
+        sqlite_store.connect(os.path.join(DATA_DIR, DB_FILE_NAME)).close()
+        sqlite_store._local.connections.clear()
+
+    # Test counts derived from the event log: confirming only appends, and an older counts file is upgraded
+    from . import event_log # Imports this module
+    legacy_path = os.path.join(DATA_DIR, "test_contador_antiguo.json")
+    event_log.append_substitution_event('Profesor Gamma', 'Profesora Beta', 'Lunes', '08:00-09:00')
+    with open(legacy_path, 'w', encoding='utf-8') as f:
+        json.dump({'Profesora Beta': 3, 'Profesor Omega': 1}, f) # Already includes the logged event
+    assert load_substitution_counts("test_contador_antiguo.json") == {'Profesora Beta': 3, 'Profesor Omega': 1}
+    event_log.append_substitution_event('Profesor Gamma', 'Profesora Beta', 'Martes', '10:00-11:00')
+    counts, log_offset = load_substitution_counts_at_log_offset("test_contador_antiguo.json")
+    print(f"\nCounts after one more logged substitution: {counts}")
+    assert counts == {'Profesora Beta': 4, 'Profesor Omega': 1} and log_offset == event_log.get_log_offset()
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'Profesora Beta': 3, 'Profesor Omega': 1}, "Older counts file rewritten"
+    save_substitution_counts({'Profesora Beta': 1}, "test_contador_antiguo.json")
+    assert load_substitution_counts("test_contador_antiguo.json") == {'Profesora Beta': 1}
+    for file_name in ("test_contador_antiguo.json", "test_contador_antiguo_base.json", event_log.LOG_FILE_NAME,
+                      ".eventos.lock"):
+        os.remove(os.path.join(DATA_DIR, file_name))
+
     # Test loading non-existent files
     print("\nTesting loading non-existent files (should return defaults):")
     non_existent_schedules = load_schedules("non_existent_horarios.json")
@@ -145,8 +1477,17 @@ if __name__ == "__main__":
          # Clean up test files and directory if needed for a clean test run
         if os.path.exists(os.path.join(DATA_DIR, "test_horarios.json")):
             os.remove(os.path.join(DATA_DIR, "test_horarios.json"))
-        if os.path.exists(os.path.join(DATA_DIR, "test_sustituciones_contador.json")):
-            os.remove(os.path.join(DATA_DIR, "test_sustituciones_contador.json"))
+        if os.path.exists(os.path.join(DATA_DIR, "test_horarios_disponibilidad.json")):
+            os.remove(os.path.join(DATA_DIR, "test_horarios_disponibilidad.json"))
+        if os.path.exists(os.path.join(DATA_DIR, "test_horarios.snapshot")):
+            os.remove(os.path.join(DATA_DIR, "test_horarios.snapshot"))
+        if os.path.exists(os.path.join(DATA_DIR, "test_sustituciones_contador_base.json")):
+            os.remove(os.path.join(DATA_DIR, "test_sustituciones_contador_base.json"))
+        for db_file in (DB_FILE_NAME, f"{DB_FILE_NAME}-wal", f"{DB_FILE_NAME}-shm", ".contador.lock",
+                        ".horarios.lock", ".renombres.lock", "profesores_renombrados.json",
+                        data_versions.VERSIONS_FILE_NAME):
+            if os.path.exists(os.path.join(DATA_DIR, db_file)):
+                os.remove(os.path.join(DATA_DIR, db_file))
         # Potentially remove DATA_DIR if it was created by this test,
         # but be cautious if other processes might use it.
         # For this script, if it's empty, we can try to remove.
@@ -0,0 +1,139 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows: version bumps are then only serialized within one process
+    fcntl = None
+
+# Monotonic version stamps of the data in a data directory, shared by every process using it.
+# data_manager and event_log bump a stamp after each write, so pages built from that data can
+# be revalidated (ETag / Last-Modified) by reading a few bytes from a mapped file instead of
+# loading the data itself.
+VERSIONS_FILE_NAME = ".versiones"
+# 'base_counts' changes only with the counts that don't come from the event log (see data_manager)
+KINDS = ('schedules', 'counts', 'base_counts')
+
+# Layout: a random epoch written when the file is created, so stamps of a deleted and
+# recreated directory never repeat, then one (version, modified time in ns) record per kind.
+_EPOCH = struct.Struct('<8s')
+_RECORD = struct.Struct('<QQ')
+_FILE_SIZE = _EPOCH.size + _RECORD.size * len(KINDS)
+
+_maps = {} # versions file path -> (inode, read-only mmap)
+_lock = threading.Lock()
+
+def _versions_path(directory):
+    return os.path.join(directory, VERSIONS_FILE_NAME)
+
+def bump_version(directory, kind):
+    """
+    Increments the version of one kind of data in a data directory.
+
+    Args:
+        directory (str): The data directory (it must exist).
+        kind (str): One of KINDS.
+
+    Returns:
+        int: The new version.
+    """
+    offset = _EPOCH.size + _RECORD.size * KINDS.index(kind)
+    with _lock:
+        fd = os.open(_versions_path(directory), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX) # Released by os.close
+            size = os.fstat(fd).st_size
+            if size < _EPOCH.size:
+                os.pwrite(fd, _EPOCH.pack(os.urandom(_EPOCH.size)) + bytes(_FILE_SIZE - _EPOCH.size), 0)
+            elif size < _FILE_SIZE: # Written before the last kinds were added: they start at 0
+                os.pwrite(fd, bytes(_FILE_SIZE - size), size)
+            version, modified_ns = _RECORD.unpack(os.pread(fd, _RECORD.size, offset))
+            # Never move Last-Modified backwards, even if the clock does
+            os.pwrite(fd, _RECORD.pack(version + 1, max(modified_ns, time.time_ns())), offset)
+        finally:
+            os.close(fd)
+    return version + 1
+
+def _mapped_versions(path):
+    """Returns the mapped versions file, remapping it if it was replaced, or None if it doesn't exist yet."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        _maps.pop(path, None)
+        return None
+    cached = _maps.get(path)
+    if cached is not None and cached[0] == st.st_ino:
+        return cached[1]
+    if st.st_size < _FILE_SIZE: # Being created, or written before the last kinds were added
+        return None
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), _FILE_SIZE, access=mmap.ACCESS_READ)
+    _maps[path] = (st.st_ino, mapped)
+    return mapped
+
+def read_versions(directory):
+    """
+    Returns the version stamps of a data directory.
+
+    Args:
+        directory (str): The data directory.
+
+    Returns:
+        tuple: (epoch as a hex string, dict of kind -> (version, modified time in ns)).
+            The epoch is None if nothing was ever written to the directory.
+    """
+    with _lock:
+        mapped = _mapped_versions(_versions_path(directory))
+        if mapped is None:
+            return None, {kind: (0, 0) for kind in KINDS}
+        # A bump can land between two byte copies; read until two copies agree
+        data = mapped[:_FILE_SIZE]
+        while True:
+            again = mapped[:_FILE_SIZE]
+            if again == data:
+                break
+            data = again
+    epoch, = _EPOCH.unpack_from(data)
+    return epoch.hex(), {kind: _RECORD.unpack_from(data, _EPOCH.size + _RECORD.size * i)
+                         for i, kind in enumerate(KINDS)}
+
+if __name__ == "__main__":
+    import multiprocessing
+    import tempfile
+
+    print("Testing data_versions.py...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        assert read_versions(temp_dir) == (None, {'schedules': (0, 0), 'counts': (0, 0), 'base_counts': (0, 0)})
+
+        assert bump_version(temp_dir, 'counts') == 1
+        epoch, versions = read_versions(temp_dir)
+        print(f"Epoch {epoch}: {versions}")
+        assert versions['counts'][0] == 1 and versions['schedules'] == (0, 0) and versions['counts'][1] > 0
+
+        # Bumps from other processes are seen through the same mapping
+        processes = [multiprocessing.Process(target=bump_version, args=(temp_dir, 'schedules')) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        assert read_versions(temp_dir)[1]['schedules'][0] == 4
+
+        # A recreated directory gets a new epoch, so its stamps don't repeat earlier ones
+        os.remove(os.path.join(temp_dir, VERSIONS_FILE_NAME))
+        bump_version(temp_dir, 'counts')
+        new_epoch, new_versions = read_versions(temp_dir)
+        assert new_epoch != epoch and new_versions['counts'][0] == 1
+
+        # A file without the last kind keeps its epoch and stamps; the new kind starts at 0
+        with open(os.path.join(temp_dir, VERSIONS_FILE_NAME), 'r+b') as f:
+            f.truncate(_FILE_SIZE - _RECORD.size)
+        _maps.clear()
+        bump_version(temp_dir, 'base_counts')
+        upgraded_epoch, upgraded_versions = read_versions(temp_dir)
+        assert upgraded_epoch == new_epoch and upgraded_versions['counts'][0] == 1
+        assert upgraded_versions['base_counts'][0] == 1
+    print("\nData versions tests completed.")
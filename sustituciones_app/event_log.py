@@ -0,0 +1,360 @@
+import bisect
+import datetime
+import json
+import os
+import threading
+
+from . import data_manager, data_versions
+
+LOG_FILE_NAME = "sustituciones_eventos.ndjson"
+SNAPSHOT_EVERY = 200 # Appended events between two snapshots
+
+# In-memory view of each log, keyed by path: counts and indexes as of 'offset' bytes into the file.
+# Other processes may append too; every access first replays whatever was appended after 'offset'.
+_states = {}
+_states_lock = threading.Lock()
+
+def _log_path(file_name):
+    return os.path.join(data_manager.data_dir(), file_name)
+
+def _snapshot_path(log_path):
+    base_name, _ = os.path.splitext(log_path)
+    return f"{base_name}_snapshot.json"
+
+def _empty_state():
+    return {
+        'offset': 0,        # Bytes of the log reflected in this state
+        'seq': 0,           # Sequence number of the last event
+        'counts': {},       # Substitute -> number of substitutions
+        'dates': [],        # Sorted [date, offset] pairs, one per event
+        'teachers': {},     # Teacher (absent or substitute) -> offsets of their events
+        'since_snapshot': 0,
+    }
+
+def _apply_event(state, event, offset):
+    """Adds one event, stored at the given byte offset, to the counts and indexes."""
+    state['seq'] = max(state['seq'], event['seq'])
+    state['counts'][event['substitute']] = state['counts'].get(event['substitute'], 0) + 1
+    bisect.insort(state['dates'], [event['date'], offset])
+    for teacher_name in {event['substitute'], event['absent']}:
+        if teacher_name:
+            state['teachers'].setdefault(teacher_name, []).append(offset)
+
+def _load_snapshot(log_path):
+    try:
+        with open(_snapshot_path(log_path), 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (IOError, OSError, json.JSONDecodeError):
+        return _empty_state()
+    state = _empty_state()
+    state.update({key: snapshot[key] for key in ('offset', 'seq', 'counts', 'dates', 'teachers') if key in snapshot})
+    return state
+
+def _write_snapshot(log_path, state):
+    """Writes the compacted state so the next cold start only replays the events appended after it."""
+    snapshot_path = _snapshot_path(log_path)
+    temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    snapshot = {key: state[key] for key in ('offset', 'seq', 'counts', 'dates', 'teachers')}
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(temp_path, snapshot_path)
+        state['since_snapshot'] = 0
+    except (IOError, OSError) as e:
+        print(f"Error saving event log snapshot to {snapshot_path}: {e}")
+
+def _catch_up(log_path, state):
+    """Replays the complete lines appended to the log after state['offset']."""
+    try:
+        size = os.path.getsize(log_path)
+    except OSError:
+        size = 0
+    if size < state['offset']: # The log was replaced or truncated: start over
+        state.clear()
+        state.update(_empty_state())
+    if size == state['offset']:
+        return
+
+    with open(log_path, 'rb') as f:
+        f.seek(state['offset'])
+        offset = state['offset']
+        for line in f:
+            if not line.endswith(b'\n'):
+                break # Partially written line: leave it for the next catch-up
+            if line.strip():
+                _apply_event(state, json.loads(line), offset)
+                state['since_snapshot'] += 1
+            offset += len(line)
+        state['offset'] = offset
+
+def _get_state(log_path):
+    """Returns the up-to-date state of a log, loading its snapshot on first use."""
+    state = _states.get(log_path)
+    if state is None:
+        state = _states[log_path] = _load_snapshot(log_path)
+    _catch_up(log_path, state)
+    return state
+
+def append_substitution_event(absent_teacher, substitute, day_of_week, time_slot, date=None,
+                              file_name=LOG_FILE_NAME):
+    """
+    Records a confirmed substitution at the end of the event log.
+
+    Appending writes a single line, whatever the size of the history. Every
+    SNAPSHOT_EVERY events the counts and indexes are saved as a snapshot. The log
+    is the record of confirmed substitutions: the substitution counts are derived
+    from it (see data_manager.load_substitution_counts).
+
+    Args:
+        absent_teacher (str): The teacher who is absent.
+        substitute (str): The teacher covering the absence.
+        day_of_week (str): Day of the covered slot (e.g. "Lunes").
+        time_slot (str): The covered time slot (e.g. "08:00-09:00").
+        date (datetime.date or str, optional): Date of the substitution. Defaults to today.
+        file_name (str, optional): The log file. Defaults to "sustituciones_eventos.ndjson".
+
+    Returns:
+        dict: The recorded event, including its sequence number.
+    """
+    return append_substitution_events([{
+        'absent': absent_teacher,
+        'substitute': substitute,
+        'day': day_of_week,
+        'slot': time_slot,
+        'date': date,
+    }], file_name)[0]
+
+def append_substitution_events(substitutions, file_name=LOG_FILE_NAME):
+    """
+    Records several confirmed substitutions with a single write to the event log.
+
+    Args:
+        substitutions (list): Dicts with 'absent', 'substitute', 'day', 'slot' and
+            optionally 'date' (datetime.date or ISO string, defaults to today).
+        file_name (str, optional): The log file. Defaults to "sustituciones_eventos.ndjson".
+
+    Returns:
+        list: The recorded events, including their sequence numbers.
+    """
+    log_path = _log_path(file_name)
+    recorded_at = datetime.datetime.now().isoformat(timespec='seconds')
+    with data_manager.data_file_lock('.eventos.lock'), _states_lock:
+        state = _get_state(log_path)
+        events = []
+        lines = []
+        for substitution in substitutions:
+            date = substitution.get('date') or datetime.date.today()
+            event = {
+                'seq': state['seq'] + len(events) + 1,
+                'date': date.isoformat() if isinstance(date, datetime.date) else str(date),
+                'day': substitution['day'],
+                'slot': substitution['slot'],
+                'absent': substitution['absent'],
+                'substitute': substitution['substitute'],
+                'recorded_at': recorded_at,
+            }
+            events.append(event)
+            lines.append((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+        with open(log_path, 'ab') as f:
+            f.write(b''.join(lines))
+        if file_name == LOG_FILE_NAME and data_manager.get_storage_backend() == 'sqlite':
+            # The JSON backend derives the counts from the log; SQLite's counts table follows it under the same lock
+            increments = {}
+            for event in events:
+                increments[event['substitute']] = increments.get(event['substitute'], 0) + 1
+            data_manager.count_logged_substitutions(increments, state['offset'] + sum(len(line) for line in lines))
+        for event, line in zip(events, lines):
+            _apply_event(state, event, state['offset'])
+            state['offset'] += len(line)
+            state['since_snapshot'] += 1
+        if state['since_snapshot'] >= SNAPSHOT_EVERY:
+            _write_snapshot(log_path, state)
+        try:
+            data_versions.bump_version(os.path.dirname(log_path), 'counts') # Pages listing events show counts too
+        except OSError as e:
+            print(f"Error updating the data versions in {os.path.dirname(log_path)}: {e}")
+    return events
+
+def compact_event_log(file_name=LOG_FILE_NAME):
+    """Writes a snapshot of the log's current counts and indexes."""
+    log_path = _log_path(file_name)
+    with _states_lock:
+        _write_snapshot(log_path, _get_state(log_path))
+
+def load_event_counts(file_name=LOG_FILE_NAME):
+    """
+    Returns the number of substitutions each teacher covered, over the whole log.
+
+    Comes from the latest snapshot plus the events appended after it.
+
+    Returns:
+        dict: Teacher names and their substitution counts.
+    """
+    log_path = _log_path(file_name)
+    with _states_lock:
+        return dict(_get_state(log_path)['counts'])
+
+def load_event_counts_at_offset(file_name=LOG_FILE_NAME):
+    """
+    Returns the counts of load_event_counts together with the end of the log they cover.
+
+    Both are read under the same lock, so the events read_events_after returns for that
+    offset are exactly the ones not included in the counts.
+
+    Returns:
+        tuple: (dict of teacher names and their substitution counts, offset in bytes).
+    """
+    log_path = _log_path(file_name)
+    with _states_lock:
+        state = _get_state(log_path)
+        return dict(state['counts']), state['offset']
+
+def query_events(start_date=None, end_date=None, teacher_name=None, file_name=LOG_FILE_NAME):
+    """
+    Returns the events of a period and/or teacher using the date and teacher indexes.
+
+    Only the matching lines are read from the log.
+
+    Args:
+        start_date (str, optional): First date (ISO "YYYY-MM-DD") included.
+        end_date (str, optional): Last date (ISO "YYYY-MM-DD") included.
+        teacher_name (str, optional): Only events where this teacher was absent or substitute.
+        file_name (str, optional): The log file. Defaults to "sustituciones_eventos.ndjson".
+
+    Returns:
+        list: Matching events, ordered by date and then by sequence number.
+    """
+    log_path = _log_path(file_name)
+    with _states_lock:
+        state = _get_state(log_path)
+        dates = state['dates']
+        teacher_offsets = state['teachers'].get(teacher_name, []) if teacher_name is not None else None
+        if start_date is None and end_date is None and teacher_offsets is not None:
+            offsets = list(teacher_offsets)
+        else:
+            low = bisect.bisect_left(dates, [start_date]) if start_date else 0
+            # [end_date, inf] sorts after every [end_date, offset] pair, so the whole last day is included
+            high = bisect.bisect_right(dates, [end_date, float('inf')]) if end_date else len(dates)
+            offsets = [offset for _, offset in dates[low:high]]
+            if teacher_offsets is not None:
+                teacher_offsets = set(teacher_offsets)
+                offsets = [offset for offset in offsets if offset in teacher_offsets]
+
+    events = []
+    if not offsets:
+        return events
+    with open(log_path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            events.append(json.loads(f.readline()))
+    events.sort(key=lambda event: (event['date'], event['seq']))
+    return events
+
+def get_log_offset(file_name=LOG_FILE_NAME):
+    """
+    Returns the current end of the log, to be passed later to read_events_after.
+
+    Returns:
+        int: Offset in bytes just after the last complete event.
+    """
+    log_path = _log_path(file_name)
+    with _states_lock:
+        return _get_state(log_path)['offset']
+
+def read_events_after(offset, file_name=LOG_FILE_NAME):
+    """
+    Reads the events appended to the log after a given offset, by any process.
+
+    Args:
+        offset (int): Offset from get_log_offset or from a previous call.
+        file_name (str, optional): The log file. Defaults to "sustituciones_eventos.ndjson".
+
+    Returns:
+        tuple: (events, new_offset).
+    """
+    events = []
+    try:
+        with open(_log_path(file_name), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break # Partially written line: read it next time
+                if line.strip():
+                    events.append(json.loads(line))
+                offset += len(line)
+    except (IOError, OSError):
+        pass
+    return events, offset
+
+def count_events_by_substitute(start_date=None, end_date=None, file_name=LOG_FILE_NAME):
+    """
+    Counts the substitutions each teacher covered within a period.
+
+    Args:
+        start_date (str, optional): First date (ISO "YYYY-MM-DD") included.
+        end_date (str, optional): Last date (ISO "YYYY-MM-DD") included.
+        file_name (str, optional): The log file. Defaults to "sustituciones_eventos.ndjson".
+
+    Returns:
+        dict: Teacher names and their substitution counts in the period.
+    """
+    counts = {}
+    for event in query_events(start_date, end_date, file_name=file_name):
+        counts[event['substitute']] = counts.get(event['substitute'], 0) + 1
+    return counts
+
+if __name__ == "__main__":
+    print("Testing event_log.py...")
+    test_log = "test_sustituciones_eventos.ndjson"
+    test_files = (_log_path(test_log), _snapshot_path(_log_path(test_log)), _log_path('.eventos.lock'),
+                  _log_path(data_versions.VERSIONS_FILE_NAME))
+    for path in test_files: # Leftovers of an interrupted run
+        if os.path.exists(path):
+            os.remove(path)
+
+    append_substitution_event('Profesora Beta', 'Profesor Alpha', 'Lunes', '08:00-09:00', date='2026-09-14',
+                              file_name=test_log)
+    append_substitution_event('Profesora Beta', 'Profesor Gamma', 'Lunes', '09:00-10:00', date='2026-09-14',
+                              file_name=test_log)
+    append_substitution_event('Profesor Alpha', 'Profesora Beta', 'Martes', '10:00-11:00', date='2026-10-06',
+                              file_name=test_log)
+    append_substitution_event('Profesora Beta', 'Profesor Alpha', 'Jueves', '12:00-13:00', date='2026-10-01',
+                              file_name=test_log)
+    compact_event_log(test_log)
+    append_substitution_event('Profesora Beta', 'Profesor Alpha', 'Viernes', '08:00-09:00', date='2026-10-09',
+                              file_name=test_log)
+
+    # Drop the in-memory state: counts must come back from the snapshot plus the tail of the log
+    _states.clear()
+    counts = load_event_counts(test_log)
+    print(f"Counts from snapshot + tail: {counts}")
+    assert counts == {'Profesor Alpha': 3, 'Profesor Gamma': 1, 'Profesora Beta': 1}
+
+    october = query_events('2026-10-01', '2026-10-31', file_name=test_log)
+    print(f"October events: {[(e['date'], e['substitute']) for e in october]}")
+    assert [e['date'] for e in october] == ['2026-10-01', '2026-10-06', '2026-10-09']
+    assert [e['seq'] for e in query_events(teacher_name='Profesor Gamma', file_name=test_log)] == [2]
+    assert count_events_by_substitute('2026-10-01', '2026-10-06', test_log) == {'Profesor Alpha': 1, 'Profesora Beta': 1}
+
+    for path in test_files:
+        if os.path.exists(path):
+            os.remove(path)
+
+    # With SQLite, appends store the log offset with the counts, which are then read without the log's lock
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_manager.configure_data_dir(temp_dir)
+        data_manager.configure_storage('sqlite')
+        try:
+            append_substitution_event('Profesora Beta', 'Profesor Alpha', 'Lunes', '08:00-09:00')
+            read = []
+            with data_manager.data_file_lock('.eventos.lock'):
+                reader = threading.Thread(target=lambda: read.append(data_manager.load_substitution_counts_at_log_offset()))
+                reader.start()
+                reader.join(5)
+                assert not reader.is_alive(), "SQLite counts read waited for the event log's lock"
+            assert read == [({'Profesor Alpha': 1}, get_log_offset())], read
+        finally:
+            data_manager.configure_storage('json')
+            data_manager.configure_data_dir(data_manager.DEFAULT_DATA_DIR)
+    print("\nEvent log tests completed.")
@@ -0,0 +1,356 @@
+import datetime
+import heapq
+import threading
+
+from . import data_manager, event_log
+
+# Length in days of the rolling windows that fairness can be computed over
+WINDOWS = {'week': 7, 'month': 30, 'term': 91}
+
+class IndexedMinHeap:
+    """
+    A binary min-heap of unique items whose keys can be changed in O(log n).
+
+    A position index maps every item to its slot in the heap array, so an item's
+    key can be updated and the heap repaired without searching for it.
+    """
+
+    def __init__(self):
+        self._heap = []      # [key, item] pairs
+        self._positions = {} # item -> index in self._heap
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def key(self, item):
+        """Returns the current key of an item."""
+        return self._heap[self._positions[item]][0]
+
+    def set(self, item, key):
+        """Inserts an item, or changes its key if it is already in the heap."""
+        position = self._positions.get(item)
+        if position is None:
+            self._heap.append([key, item])
+            self._positions[item] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        old_key = self._heap[position][0]
+        self._heap[position][0] = key
+        if key < old_key:
+            self._sift_up(position)
+        else:
+            self._sift_down(position)
+
+    def peek(self):
+        """Returns the (key, item) with the smallest key, or None if the heap is empty."""
+        return tuple(self._heap[0]) if self._heap else None
+
+    def min_among(self, allowed_items):
+        """
+        Returns the item with the smallest key among allowed_items, or None.
+
+        Walks the heap best-first from the root, so only the entries with a
+        smaller key than the answer are visited, not every allowed item.
+        """
+        if not self._heap:
+            return None
+        frontier = [(self._heap[0][0], 0)]
+        while frontier:
+            _, index = heapq.heappop(frontier)
+            item = self._heap[index][1]
+            if item in allowed_items:
+                return item
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self._heap):
+                    heapq.heappush(frontier, (self._heap[child][0], child))
+        return None
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._positions[self._heap[i][1]] = i
+        self._positions[self._heap[j][1]] = j
+
+    def _sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self._heap[index][0] >= self._heap[parent][0]:
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index):
+        size = len(self._heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
+
+class FairnessEngine:
+    """
+    Keeps substitution counts over a rolling window and picks the least loaded teacher.
+
+    Teachers are ordered by (count / weight, name): a weight of 0.5 (e.g. a half-time
+    contract) makes each substitution count double, and equal weighted counts fall back
+    to alphabetical order, as in select_teacher_for_substitution.
+    """
+
+    def __init__(self, window_days=None, weights=None):
+        """
+        Args:
+            window_days (int, optional): Only substitutions of the last window_days days count.
+                None counts every recorded substitution.
+            weights (dict, optional): Teacher names and their weights (default 1.0).
+        """
+        self.window_days = window_days
+        self.weights = dict(weights or {})
+        self._counts = {}
+        self._heap = IndexedMinHeap()
+        self._expiry = [] # (date, teacher) of the substitutions inside the window
+        # Position in the event log up to which substitutions have been recorded
+        self.log_offset = 0
+        self.last_seq = 0
+        self.renames = {} # Former teacher names and their current ones, see data_manager.load_teacher_renames
+        self.base_counts_version = None # 'base_counts' stamp of the stored counts the engine started from
+
+    def _key(self, teacher_name):
+        return (self._counts.get(teacher_name, 0) / self.weights.get(teacher_name, 1.0), teacher_name)
+
+    def _add(self, teacher_name, amount):
+        self._counts[teacher_name] = self._counts.get(teacher_name, 0) + amount
+        self._heap.set(teacher_name, self._key(teacher_name))
+
+    def record(self, teacher_name, date=None, amount=1):
+        """
+        Records substitutions covered by a teacher. O(log n).
+
+        Args:
+            teacher_name (str): The substitute.
+            date (str, optional): ISO date of the substitution. Defaults to today.
+            amount (int, optional): Number of substitutions. Defaults to 1.
+        """
+        if not teacher_name:
+            return
+        if date is None:
+            date = datetime.date.today().isoformat()
+        self._add(teacher_name, amount)
+        if self.window_days is not None:
+            for _ in range(amount):
+                heapq.heappush(self._expiry, (date, teacher_name))
+
+    def expire(self, today=None):
+        """Drops the substitutions that have left the rolling window."""
+        if self.window_days is None:
+            return
+        today = today or datetime.date.today()
+        cutoff = (today - datetime.timedelta(days=self.window_days)).isoformat()
+        while self._expiry and self._expiry[0][0] <= cutoff:
+            _, teacher_name = heapq.heappop(self._expiry)
+            self._add(teacher_name, -1)
+
+    def count(self, teacher_name):
+        """Returns the number of substitutions of a teacher in the window."""
+        return self._counts.get(teacher_name, 0)
+
+    def counts(self):
+        """Returns the substitution counts in the window of every teacher who has one."""
+        return {name: count for name, count in self._counts.items() if count}
+
+    def select(self, available_teachers, today=None):
+        """
+        Selects the available teacher with the lowest weighted count in the window.
+
+        Args:
+            available_teachers (list): Names of the available teachers.
+            today (datetime.date, optional): Reference date of the window. Defaults to today.
+
+        Returns:
+            str: The selected teacher, or None if no teacher is available.
+        """
+        if not available_teachers:
+            return None
+        self.expire(today)
+        for teacher_name in available_teachers:
+            if teacher_name not in self._heap:
+                self._heap.set(teacher_name, self._key(teacher_name))
+        return self._heap.min_among(set(available_teachers))
+
+def window_days_for(window):
+    """
+    Converts a window setting into days.
+
+    Args:
+        window: None, a name from WINDOWS ('week', 'month', 'term') or a number of days.
+
+    Returns:
+        int: Days in the window, or None for lifetime counts.
+
+    Raises:
+        ValueError: If the window name is unknown.
+    """
+    if window is None or window == '':
+        return None
+    if isinstance(window, int) or str(window).isdigit():
+        return int(window)
+    if window not in WINDOWS:
+        raise ValueError(f"Unknown fairness window '{window}'. Expected one of {tuple(WINDOWS)} or a number of days.")
+    return WINDOWS[window]
+
+def build_fairness_engine(window=None, weights=None, today=None):
+    """
+    Builds an engine from stored data.
+
+    With a window, the substitutions inside it are read from the event log
+    through its date index. Without one, the engine starts from the stored
+    lifetime counts, read together with the end of the event log they include.
+
+    Args:
+        window: See window_days_for.
+        weights (dict, optional): Teacher names and their weights.
+        today (datetime.date, optional): Reference date of the window.
+
+    Returns:
+        FairnessEngine: An engine positioned at the current end of the event log.
+    """
+    window_days = window_days_for(window)
+    engine = FairnessEngine(window_days, weights)
+    engine.renames = data_manager.load_teacher_renames()
+    if window_days is None:
+        # Stamped before reading, so an edit made meanwhile triggers a rebuild (see _get_engine)
+        engine.base_counts_version = _base_counts_version()
+        # Read together, so the events replayed by sync_fairness_engine are exactly those not yet counted
+        counts, engine.log_offset = data_manager.load_substitution_counts_at_log_offset()
+        for teacher_name, count in counts.items():
+            engine.record(teacher_name, amount=count)
+    else:
+        engine.log_offset = event_log.get_log_offset()
+        today = today or datetime.date.today()
+        start_date = (today - datetime.timedelta(days=window_days - 1)).isoformat()
+        for event in event_log.query_events(start_date=start_date):
+            # Substitutions logged before a teacher was renamed count for the new name
+            engine.record(engine.renames.get(event['substitute'], event['substitute']), event['date'])
+            engine.last_seq = max(engine.last_seq, event['seq'])
+    engine.expire(today)
+    return engine
+
+def sync_fairness_engine(engine):
+    """Applies the substitutions appended to the event log (by any process) since the engine last looked."""
+    events, engine.log_offset = event_log.read_events_after(engine.log_offset)
+    for event in events:
+        if event['seq'] > engine.last_seq:
+            engine.record(engine.renames.get(event['substitute'], event['substitute']), event['date'])
+            engine.last_seq = event['seq']
+
+def _base_counts_version():
+    epoch, versions = data_manager.get_data_versions()
+    return (epoch, versions['base_counts'][0])
+
+_engines = {} # (data directory, window, weights) -> FairnessEngine, one per schedule set and settings
+_engine_lock = threading.Lock()
+
+def _get_engine(window, weights):
+    """Returns the process-wide engine of the selected schedule set, up to date with its event log. Call with _engine_lock held."""
+    settings = (data_manager.data_dir(), window, tuple(sorted((weights or {}).items())))
+    engine = _engines.get(settings)
+    if engine is not None and engine.renames != data_manager.load_teacher_renames():
+        engine = None # An applied upload renamed teachers (and moved their counts): start over
+    elif engine is not None and engine.window_days is None and engine.base_counts_version != _base_counts_version():
+        engine = None # Stored counts were edited outside the event log, which sync_fairness_engine can't see
+    if engine is None:
+        # Settings changes replace the set's engine instead of piling up stale ones
+        for key in [key for key in _engines if key[0] == settings[0]]:
+            del _engines[key]
+        engine = _engines[settings] = build_fairness_engine(window, weights)
+    else:
+        sync_fairness_engine(engine)
+    return engine
+
+def suggest_substitute(available_teachers, window=None, weights=None):
+    """
+    Selects the fairest substitute using a process-wide engine.
+
+    The engine is built once and then only fed the events appended to the log
+    since the previous call, so a request costs O(new events x log n) instead
+    of a rebuild.
+
+    Args:
+        available_teachers (list): Names of the available teachers.
+        window: See window_days_for.
+        weights (dict, optional): Teacher names and their weights.
+
+    Returns:
+        tuple: (suggested teacher or None, dict of counts in the window).
+    """
+    with _engine_lock:
+        engine = _get_engine(window, weights)
+        return engine.select(available_teachers), engine.counts()
+
+if __name__ == "__main__":
+    print("Testing fairness.py...")
+
+    heap = IndexedMinHeap()
+    for name, key in [('c', 3), ('a', 5), ('b', 1), ('d', 4)]:
+        heap.set(name, key)
+    assert heap.peek() == (1, 'b')
+    heap.set('b', 10)
+    assert heap.peek() == (3, 'c')
+    assert heap.min_among({'a', 'b', 'd'}) == 'd'
+    assert heap.min_among({'zz'}) is None
+
+    # Same choice as select_teacher_for_substitution: lowest count, then alphabetical
+    engine = FairnessEngine()
+    for teacher_name, count in {'Profesor Davila': 2, 'Profesora Elena': 5, 'Profesora Sofia': 2}.items():
+        engine.record(teacher_name, amount=count)
+    available = ['Profesora Sofia', 'Profesora Elena', 'Profesor Davila']
+    assert engine.select(available) == 'Profesor Davila'
+    assert engine.select(available + ['Profesor Carlos']) == 'Profesor Carlos'
+    assert engine.select([]) is None
+
+    # Weights: a half-time teacher with 2 substitutions weighs as much as a full-time one with 4
+    weighted = FairnessEngine(weights={'Profesora Sofia': 0.5})
+    weighted.record('Profesora Sofia', amount=2)
+    weighted.record('Profesor Davila', amount=3)
+    assert weighted.select(['Profesor Davila', 'Profesora Sofia']) == 'Profesor Davila'
+
+    # Rolling window: September's substitutions no longer count in October
+    rolling = FairnessEngine(window_days=WINDOWS['week'])
+    rolling.record('Profesor Davila', '2026-09-10', amount=5)
+    rolling.record('Profesora Elena', '2026-10-14')
+    today = datetime.date(2026, 10, 16)
+    assert rolling.select(['Profesor Davila', 'Profesora Elena'], today) == 'Profesor Davila'
+    assert rolling.counts() == {'Profesora Elena': 1}
+    assert rolling.select(['Profesora Elena'], datetime.date(2026, 10, 21)) == 'Profesora Elena'
+    assert rolling.counts() == {}, rolling.counts()
+
+    # Lifetime engine: counts and log offset are read together, then only later events are replayed
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_manager.configure_data_dir(temp_dir)
+        try:
+            event_log.append_substitution_event('Profesora Elena', 'Profesor Davila', 'Lunes', '08:00-09:00')
+            lifetime = build_fairness_engine()
+            assert lifetime.counts() == {'Profesor Davila': 1}
+            event_log.append_substitution_event('Profesora Elena', 'Profesora Sofia', 'Lunes', '09:00-10:00')
+            sync_fairness_engine(lifetime)
+            sync_fairness_engine(lifetime)
+            assert lifetime.counts() == {'Profesor Davila': 1, 'Profesora Sofia': 1}, lifetime.counts()
+
+            # Confirmations keep the cached engine; edits to the stored counts replace it
+            cached = _get_engine(None, None)
+            event_log.append_substitution_event('Profesora Elena', 'Profesor Davila', 'Martes', '08:00-09:00')
+            assert _get_engine(None, None) is cached and cached.counts()['Profesor Davila'] == 2
+            data_manager.increment_substitution_counts({'Profesora Sofia': 3})
+            rebuilt = _get_engine(None, None)
+            assert rebuilt is not cached
+            assert rebuilt.counts() == {'Profesor Davila': 2, 'Profesora Sofia': 4}, rebuilt.counts()
+        finally:
+            data_manager.configure_data_dir(data_manager.DEFAULT_DATA_DIR)
+
+    print("\nFairness engine tests completed.")
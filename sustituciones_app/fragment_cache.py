@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+DEFAULT_MAX_ENTRIES = 256 # Rendered fragments kept per process
+
+class FragmentCache:
+    """
+    Bounded, least-recently-used cache of rendered page fragments (HTML strings).
+
+    Keys must identify everything a fragment is rendered from, including the version
+    stamps of its data: a fragment is never invalidated, a newer version just gets a
+    different key and the stale entry is evicted once it is the least recently used.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> html
+        self._lock = threading.Lock()
+        self._stats = {} # fragment name -> {'hits', 'misses'}
+        self.evictions = 0
+
+    def _count(self, name, hit):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+        if metrics.enabled:
+            metrics.inc_counter('sustituciones_fragment_cache_total', fragment=name, result='hit' if hit else 'miss')
+
+    def get_or_render(self, name, key, render):
+        """
+        Returns a cached fragment, rendering and storing it on a miss.
+
+        Two requests missing the same key at once both render it; the fragment is the same.
+
+        Args:
+            name (str): Name of the fragment, for the statistics.
+            key (tuple): Hashable key identifying the fragment and what it is rendered from.
+            render (callable): Called with no arguments to render the fragment.
+
+        Returns:
+            str: The rendered fragment.
+        """
+        key = (name,) + tuple(key)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+        if html is not None:
+            self._count(name, True)
+            return html
+        self._count(name, False)
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            self._evict()
+        return html
+
+    def _evict(self):
+        while len(self._entries) > max(0, self.max_entries):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_entries):
+        """Sets the maximum number of fragments kept, evicting the least recently used ones if needed."""
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def clear(self):
+        """Drops every fragment and resets the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: 'hits', 'misses', 'hit_rate' (hits / lookups, None before the first lookup),
+                'entries', 'max_entries', 'evictions' and 'fragments' (the same counters and
+                hit rate per fragment name).
+        """
+        def with_rate(hits, misses):
+            lookups = hits + misses
+            return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / lookups, 4) if lookups else None}
+
+        with self._lock:
+            fragments = {name: with_rate(s['hits'], s['misses']) for name, s in sorted(self._stats.items())}
+            totals = with_rate(sum(s['hits'] for s in self._stats.values()),
+                               sum(s['misses'] for s in self._stats.values()))
+            totals.update(entries=len(self._entries), max_entries=self.max_entries,
+                          evictions=self.evictions, fragments=fragments)
+            return totals
+
+_cache = FragmentCache()
+
+def configure_fragment_cache(max_entries):
+    """
+    Sets the size of the process-wide fragment cache.
+
+    Args:
+        max_entries (int): Maximum number of rendered fragments kept (0 disables caching).
+    """
+    _cache.resize(max_entries)
+
+def get_fragment_cache():
+    """Returns the process-wide FragmentCache."""
+    return _cache
+
+def get_fragment_cache_stats():
+    """Returns the counters of the process-wide fragment cache (see FragmentCache.stats)."""
+    return _cache.stats()
+
+if __name__ == "__main__":
+    print("Testing fragment_cache.py...")
+    cache = FragmentCache(max_entries=2)
+    renders = []
+
+    def renderer(text):
+        def render():
+            renders.append(text)
+            return f"<p>{text}</p>"
+        return render
+
+    assert cache.get_or_render('profesores', (1,), renderer('a')) == "<p>a</p>"
+    assert cache.get_or_render('profesores', (1,), renderer('b')) == "<p>a</p>" # Hit: not rendered again
+    assert cache.get_or_render('profesores', (2,), renderer('c')) == "<p>c</p>" # New data version: new key
+    assert cache.get_or_render('recuento', (1,), renderer('d')) == "<p>d</p>"   # Evicts ('profesores', 1)
+    assert renders == ['a', 'c', 'd']
+    assert cache.get_or_render('profesores', (1,), renderer('e')) == "<p>e</p>"
+    stats = cache.stats()
+    print(f"Stats: {stats}")
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['evictions']) == (1, 4, 2, 2)
+    assert stats['hit_rate'] == 0.2
+    assert stats['fragments']['profesores'] == {'hits': 1, 'misses': 3, 'hit_rate': 0.25}
+
+    metrics.enable_metrics()
+    cache.get_or_render('recuento', (1,), renderer('f'))
+    assert 'sustituciones_fragment_cache_total{fragment="recuento",result="hit"} 1' in metrics.render_metrics()
+
+    cache.resize(0) # Nothing kept: every lookup renders
+    cache.get_or_render('recuento', (1,), renderer('g'))
+    assert cache.stats()['entries'] == 0 and renders[-1] == 'g'
+    cache.clear()
+    assert cache.stats()['hit_rate'] is None
+    print("\nFragment cache tests completed.")
@@ -0,0 +1,573 @@
+import datetime
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows: uploads are then only serialized within one process
+    fcntl = None
+
+from . import data_manager, schedule_diff
+
+MAX_TRACKED_JOBS = 50 # Finished jobs kept for status queries
+JOBS_DIR = "cargas" # Under the data directory: one status file per job, read by every worker process
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+MAX_BATCH_FILES = 50 # PDFs parsed in one batch upload, counting those inside ZIP archives
+MAX_ZIP_MEMBER_BYTES = 50 * 1024 * 1024 # Larger files inside a ZIP archive are not extracted
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs_lock = threading.Lock()
+_active_job_id = None
+_ingestion_lock_file = None
+_success_callbacks = {} # job_id -> on_success, for jobs whose schedules are not applied yet
+
+class IngestionBusyError(Exception):
+    """Raised when a schedule upload is submitted while another one is still being processed."""
+
+class IngestionReviewError(Exception):
+    """Raised when an upload can't be applied or discarded: it isn't waiting for review (any more)."""
+
+def configure_ingestion_workers(max_workers):
+    """
+    Sets the size of the background worker pool. Must be called before the first job is submitted.
+
+    Args:
+        max_workers (int): Maximum number of threads running ingestion jobs.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='ingestion')
+
+def _get_executor():
+    configure_ingestion_workers(1)
+    return _executor
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+def _acquire_ingestion_lock():
+    """
+    Claims the right to ingest a schedule file, across all worker processes when possible.
+
+    Returns:
+        bool: True if the lock was acquired, False if another upload is in progress.
+    """
+    global _active_job_id, _ingestion_lock_file
+    if _active_job_id is not None:
+        return False
+    if fcntl is not None:
+        # One upload at a time for the whole data directory, whatever the schedule set
+        os.makedirs(data_manager.DATA_DIR, exist_ok=True)
+        lock_file = open(os.path.join(data_manager.DATA_DIR, '.ingestion.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        _ingestion_lock_file = lock_file
+    return True
+
+def _release_ingestion_lock():
+    global _active_job_id, _ingestion_lock_file
+    with _jobs_lock:
+        _active_job_id = None
+        if _ingestion_lock_file is not None:
+            fcntl.flock(_ingestion_lock_file, fcntl.LOCK_UN)
+            _ingestion_lock_file.close()
+            _ingestion_lock_file = None
+
+def _job_path(job_id):
+    return os.path.join(data_manager.DATA_DIR, JOBS_DIR, f"{job_id}.json")
+
+def _read_job(job_id):
+    """Reads the status file of a job, or returns None if there is none. Call with _jobs_lock held."""
+    if not isinstance(job_id, str) or not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, json.JSONDecodeError):
+        return None
+
+def _write_job(job):
+    """Saves the status of a job where any worker process can read it. Call with _jobs_lock held."""
+    os.makedirs(os.path.dirname(_job_path(job['job_id'])), exist_ok=True)
+    try:
+        data_manager._write_json_atomic(_job_path(job['job_id']), job)
+    except IOError as e:
+        print(f"Error saving the status of ingestion job {job['job_id']}: {e}")
+
+def _list_jobs():
+    """Returns the status of every tracked job, oldest first. Call with _jobs_lock held."""
+    jobs_dir = os.path.join(data_manager.DATA_DIR, JOBS_DIR)
+    try:
+        file_names = os.listdir(jobs_dir)
+    except OSError:
+        return []
+    jobs = [_read_job(os.path.splitext(file_name)[0]) for file_name in file_names if file_name.endswith('.json')]
+    return sorted((job for job in jobs if job is not None), key=lambda job: job['queued_at'])
+
+def _update_job(job_id, **changes):
+    with _jobs_lock:
+        job = _read_job(job_id)
+        if job is not None:
+            job.update(changes)
+            _write_job(job)
+
+def _remove_uploads(uploads):
+    """Deletes the saved uploads of a job; they are stored under unique names and only read by it."""
+    for path, _ in uploads:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _run_ingestion_job(job_id, uploads, parse_options, schedule_set, review):
+    """Parses the uploaded files and, only if they yield schedules, stages them for schedule_set."""
+    try:
+        with data_manager.schedule_set(schedule_set):
+            _ingest(job_id, uploads, parse_options, review)
+    finally:
+        _release_ingestion_lock()
+        _remove_uploads(uploads)
+
+def _is_batch(uploads):
+    return len(uploads) > 1 or uploads[0][1].lower().endswith('.zip')
+
+def _stage_pdf(job_id, pdf_path, parse_options, started):
+    """
+    Parses a single PDF, staging each teacher as soon as its page is parsed.
+
+    Returns:
+        tuple: (number of teachers staged or None if they couldn't be saved, parse seconds)
+    """
+    def progress(pages_done, pages_total):
+        _update_job(job_id, pages_done=pages_done, pages_total=pages_total)
+
+    from .pdf_processor import iter_schedule_pdf # PyMuPDF is only loaded once a PDF is uploaded
+
+    parse_report = {}
+    parse_finished = []
+    def parsed_schedules():
+        # Each teacher is written to disk as soon as its page is parsed
+        yield from iter_schedule_pdf(pdf_path, report=parse_report, progress=progress, **parse_options)
+        parse_finished.append(time.perf_counter())
+
+    # Staged next to the stored schedules until applied; an upload with no schedules stages nothing
+    teacher_count = data_manager.stage_schedules(parsed_schedules(), job_id, min_count=1)
+    parse_seconds = (parse_finished[0] if parse_finished else time.perf_counter()) - started
+    layout_report = parse_report.get('layout', {})
+    _update_job(job_id, parse_seconds=round(parse_seconds, 3),
+                pages_reused=parse_report.get('reused', 0), pages_parsed=parse_report.get('parsed', 0),
+                pages_failed=parse_report.get('failed_pages', []),
+                pages_layout=layout_report.get('layout_pages', 0),
+                layout_seconds_saved=round(layout_report.get('seconds_saved', 0.0), 3))
+    return teacher_count, parse_seconds
+
+def _expand_uploads(uploads, extract_dir, file_reports):
+    """
+    Lists the PDFs of a batch upload, extracting the ones inside ZIP archives to extract_dir.
+
+    ZIP archives that can't be read, files that aren't PDFs or can't be extracted and files
+    beyond MAX_BATCH_FILES get a failed entry in file_reports instead. A member that fails
+    to extract is removed at once; the caller removes extract_dir once the PDFs are parsed.
+
+    Returns:
+        list: (path, display name) of each PDF to parse.
+    """
+    pdfs = []
+    def add(path, name):
+        if len(pdfs) >= MAX_BATCH_FILES:
+            file_reports.append({'filename': name, 'status': 'failed',
+                                 'error': f"Se superó el máximo de {MAX_BATCH_FILES} archivos por carga."})
+        else:
+            pdfs.append((path, name))
+
+    for path, name in uploads:
+        if not name.lower().endswith('.zip'):
+            add(path, name)
+            continue
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    member_name = f"{name}/{member.filename}"
+                    base_name = os.path.basename(member.filename)
+                    if member.is_dir() or member.filename.startswith('__MACOSX/') or base_name.startswith('.'):
+                        continue
+                    if not base_name.lower().endswith('.pdf'):
+                        file_reports.append({'filename': member_name, 'status': 'failed',
+                                             'error': "No es un archivo PDF."})
+                    elif member.file_size > MAX_ZIP_MEMBER_BYTES:
+                        file_reports.append({'filename': member_name, 'status': 'failed',
+                                             'error': "El archivo es demasiado grande."})
+                    elif len(pdfs) < MAX_BATCH_FILES:
+                        os.makedirs(extract_dir, exist_ok=True)
+                        member_path = os.path.join(extract_dir, f"{uuid.uuid4().hex}.pdf")
+                        try:
+                            with archive.open(member) as source, open(member_path, 'wb') as target:
+                                shutil.copyfileobj(source, target)
+                        except (zipfile.BadZipFile, OSError, RuntimeError, EOFError, NotImplementedError,
+                                zlib.error) as e: # Corrupt, encrypted or unsupported member: the others still count
+                            try:
+                                os.remove(member_path)
+                            except OSError:
+                                pass
+                            file_reports.append({'filename': member_name, 'status': 'failed',
+                                                 'error': f"No se pudo extraer del archivo ZIP: {e}"})
+                            continue
+                        add(member_path, member_name)
+                    else:
+                        add(None, member_name)
+        except (zipfile.BadZipFile, OSError, RuntimeError) as e: # RuntimeError: encrypted member
+            file_reports.append({'filename': name, 'status': 'failed', 'error': f"No se pudo leer el archivo ZIP: {e}"})
+    return pdfs
+
+def _stage_batch(job_id, uploads, parse_options, started):
+    """
+    Parses the PDFs of a batch upload (several files or ZIP archives) concurrently, combines
+    their schedules and stages them. A file that fails is reported and left out.
+
+    The parsed schedules of every file stay in memory until they are combined (without
+    copies) into the staged file, so unlike _stage_pdf memory grows with the batch.
+
+    Returns:
+        tuple: (number of teachers staged or None if they couldn't be saved, parse seconds)
+    """
+    from .pdf_processor import parse_schedule_pdfs # PyMuPDF is only loaded once a PDF is uploaded
+
+    file_reports = []
+    extract_dir = os.path.join(os.path.dirname(uploads[0][0]), f"{job_id}_zip")
+    try:
+        pdfs = _expand_uploads(uploads, extract_dir, file_reports)
+        _update_job(job_id, files_done=0, files_total=len(pdfs))
+        results = parse_schedule_pdfs([path for path, _ in pdfs],
+                                      progress=lambda done, total: _update_job(job_id, files_done=done),
+                                      **parse_options)
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    parse_seconds = time.perf_counter() - started
+
+    sources = []
+    for (_, name), result in zip(pdfs, results):
+        report = result['report']
+        entry = {'filename': name, 'status': 'succeeded', 'teacher_count': len(result['schedules']),
+                 'pages': report.get('pages', 0), 'pages_reused': report.get('reused', 0),
+                 'seconds': round(result['seconds'], 3), 'error': None}
+        if result['error']:
+            print(f"Error parsing '{name}' of ingestion job {job_id}: {result['error']}")
+            entry.update(status='failed', error="No se pudo abrir el PDF o está vacío."
+                         if not report.get('pages') else "Error al procesar el PDF.")
+        elif not result['schedules']:
+            entry.update(status='failed', error="No se pudo extraer ningún horario del PDF.")
+        else:
+            sources.append((name, result['schedules']))
+            if report.get('failed_pages'):
+                # Teachers on the skipped pages would otherwise only show up as removed in the diff
+                entry.update(status='partial', pages_failed=report['failed_pages'],
+                             error="Páginas omitidas por errores: "
+                                   + ", ".join(str(failed['page']) for failed in report['failed_pages']) + ".")
+        file_reports.append(entry)
+
+    schedules, conflicts, duplicates = schedule_diff.combine_uploaded_schedules(sources)
+    teacher_count = data_manager.stage_schedules(schedules, job_id, min_count=1)
+    _update_job(job_id, parse_seconds=round(parse_seconds, 3), files=file_reports, conflicts=conflicts,
+                duplicates=duplicates, files_failed=sum(1 for entry in file_reports if entry['status'] != 'succeeded'),
+                pages_reused=sum(entry.get('pages_reused', 0) for entry in file_reports),
+                pages_parsed=sum(entry.get('pages', 0) - entry.get('pages_reused', 0) for entry in file_reports))
+    return teacher_count, parse_seconds
+
+def _ingest(job_id, uploads, parse_options, review):
+    started = time.perf_counter()
+    _update_job(job_id, status='running', started_at=_now())
+    batch = _is_batch(uploads)
+    try:
+        if batch:
+            teacher_count, parse_seconds = _stage_batch(job_id, uploads, parse_options, started)
+        else:
+            teacher_count, parse_seconds = _stage_pdf(job_id, uploads[0][0], parse_options, started)
+
+        if teacher_count is None:
+            _update_job(job_id, status='failed', finished_at=_now(),
+                        error="No se pudieron guardar los horarios extraídos del PDF.")
+            return
+        if not teacher_count:
+            _update_job(job_id, status='failed', finished_at=_now(),
+                        error="No se pudo extraer ningún horario de los archivos subidos." if batch else
+                        "No se pudo extraer ningún horario del PDF. Verifique el formato del archivo o que no esté vacío/corrupto.")
+            return
+
+        base_version = data_manager.get_schedules_version()
+        diff = data_manager.diff_staged_schedules(job_id)
+        _update_job(job_id, teacher_count=teacher_count, diff=diff, diff_summary=schedule_diff.diff_summary(diff),
+                    base_version=base_version, save_seconds=round(time.perf_counter() - started - parse_seconds, 3),
+                    total_seconds=round(time.perf_counter() - started, 3))
+        with _jobs_lock:
+            job = _read_job(job_id)
+            for other in _list_jobs(): # Staging this upload discarded theirs
+                if (other['status'] == 'preview' and other['schedule_set'] == job['schedule_set']
+                        and other['job_id'] != job_id):
+                    other.update(status='discarded', finished_at=_now(), error="Sustituida por una carga posterior.")
+                    _write_job(other)
+                    _success_callbacks.pop(other['job_id'], None)
+            # A batch with failed files or conflicting teachers is shown even with nothing stored to compare with
+            batch_issues = batch and (job['files_failed'] or job['conflicts'])
+        if review and (diff['removed'] or diff['changed'] or diff['unchanged'] or batch_issues):
+            _update_job(job_id, status='preview')
+        else: # Nothing stored to compare with (or no review wanted): applied straight away
+            _apply(job_id)
+    except Exception as e:
+        _update_job(job_id, status='failed', finished_at=_now(), error=str(e))
+        _success_callbacks.pop(job_id, None)
+        data_manager.discard_staged_schedules(job_id)
+
+def _apply(job_id, renames=None, base_version=None):
+    """
+    Applies a staged upload to the selected schedule set and marks its job as succeeded.
+
+    Raises:
+        data_manager.SchedulesChangedError: See data_manager.apply_staged_schedules.
+        IngestionReviewError: If the upload was applied or discarded meanwhile (e.g. through another worker).
+    """
+    try:
+        changes = data_manager.apply_staged_schedules(job_id, renames, base_version=base_version)
+    except IOError:
+        _update_job(job_id, status='failed', finished_at=_now(),
+                    error="No se pudieron guardar los horarios extraídos del PDF.")
+        _success_callbacks.pop(job_id, None)
+        return
+    if changes is None: # Its status is set by whoever applied or discarded it
+        raise IngestionReviewError("Esta carga de horarios ya no está pendiente de revisión.")
+    applied = {'added': 0, 'removed': 0, 'changed': 0, 'renamed': 0}
+    for old_name, new_name in changes:
+        kind = ('added' if old_name is None else 'removed' if new_name is None
+                else 'changed' if old_name == new_name else 'renamed')
+        applied[kind] += 1
+    _update_job(job_id, status='succeeded', finished_at=_now(), applied=applied)
+    on_success = _success_callbacks.pop(job_id, None)
+    if on_success is not None:
+        try:
+            on_success(get_job_status(job_id))
+        except Exception as e: # The schedules are saved; a failed notification doesn't undo that
+            print(f"Error notifying the end of ingestion job {job_id}: {e}")
+
+def _job_for_review(job_id):
+    job = get_job_status(job_id)
+    if job is None or job['status'] != 'preview':
+        raise IngestionReviewError("Esta carga de horarios ya no está pendiente de revisión.")
+    return job
+
+def apply_ingestion_job(job_id, renames=None):
+    """
+    Applies an upload waiting for review (status 'preview') to the schedules it was uploaded for.
+
+    Only the teachers that differ are changed (see data_manager.apply_staged_schedules).
+    If the stored schedules changed since the diff was shown, nothing is applied: the
+    diff is recomputed and the job stays in review. The check and the change happen under
+    the schedules lock, so concurrent requests (from any worker) apply an upload only once.
+
+    Args:
+        job_id (str): The id returned by submit_ingestion_job.
+        renames (dict, optional): Removed teachers and the added teachers they were renamed to,
+            normally chosen among the diff's 'renamed' suggestions. Their counts move to the new names.
+
+    Returns:
+        dict: The job status.
+
+    Raises:
+        IngestionReviewError: If the upload isn't waiting for review, or the stored schedules changed.
+    """
+    job = _job_for_review(job_id)
+    with data_manager.schedule_set(job['schedule_set']):
+        try:
+            _apply(job_id, renames, job['base_version'])
+        except data_manager.SchedulesChangedError:
+            base_version = data_manager.get_schedules_version()
+            diff = data_manager.diff_staged_schedules(job_id)
+            if diff is None:
+                raise IngestionReviewError("Esta carga de horarios ya no está pendiente de revisión.")
+            _update_job(job_id, diff=diff, diff_summary=schedule_diff.diff_summary(diff), base_version=base_version)
+            raise IngestionReviewError("Los horarios guardados han cambiado mientras revisabas la carga. "
+                                       "Revisa de nuevo los cambios.")
+    return get_job_status(job_id)
+
+def discard_ingestion_job(job_id):
+    """
+    Drops an upload waiting for review, leaving the stored schedules as they are.
+
+    Raises:
+        IngestionReviewError: If the upload isn't waiting for review.
+    """
+    job = _job_for_review(job_id)
+    with data_manager.schedule_set(job['schedule_set']):
+        if not data_manager.discard_staged_schedules(job_id):
+            raise IngestionReviewError("Esta carga de horarios ya no está pendiente de revisión.")
+    _update_job(job_id, status='discarded', finished_at=_now())
+    _success_callbacks.pop(job_id, None)
+
+def submit_ingestion_job(pdf_path, filename, parse_options=None, on_success=None, review=True):
+    """
+    Queues the ingestion of an uploaded schedule PDF and returns immediately.
+
+    Only one upload is processed at a time; submitting another one while a job is
+    queued or running raises IngestionBusyError instead of letting the two race
+    to write horarios.json. The schedules are staged for the schedule set selected
+    in the calling thread and compared with the stored ones: the job then waits in
+    status 'preview', with the per-teacher 'diff', until apply_ingestion_job or
+    discard_ingestion_job is called. With no stored schedules it is applied at once.
+
+    Args:
+        pdf_path (str): Path of the saved upload.
+        filename (str): Original file name, for display.
+        parse_options (dict, optional): Extra keyword arguments for iter_schedule_pdf
+            (workers, cache_dir, ...).
+        on_success (callable, optional): Called with the job status once the new schedules
+            are applied (from the worker thread, or from the thread applying a reviewed upload).
+        review (bool, optional): Wait for the diff to be reviewed. Defaults to True.
+
+    Returns:
+        str: The id of the new job.
+
+    Raises:
+        IngestionBusyError: If another upload is still being processed.
+    """
+    return _submit([(pdf_path, filename)], filename, parse_options, on_success, review)
+
+def submit_batch_ingestion_job(uploads, parse_options=None, on_success=None, review=True):
+    """
+    Queues the ingestion of several schedule PDFs (e.g. one per department) as one upload.
+
+    Like submit_ingestion_job, but the files, and the PDFs inside any ZIP archive among
+    them, are parsed concurrently (see pdf_processor.parse_schedule_pdfs) and combined into
+    a single set of schedules. A file that can't be parsed doesn't stop the others: the job
+    gets 'files', the outcome ('succeeded', 'partial' if some pages were skipped, or 'failed'),
+    teacher count and timing of each file, and 'conflicts', the teachers found with different
+    schedules in several files (the first file's is kept). Batches with failed or partial
+    files, or with conflicts, always wait for review.
+
+    Args:
+        uploads (list): (path of the saved upload, original file name) pairs, in upload order.
+            Files whose name ends in .zip are read as ZIP archives of PDFs.
+        parse_options (dict, optional): Extra keyword arguments for parse_schedule_pdfs
+            ('workers' bounds the files parsed at once, cache_dir, ...).
+        on_success (callable, optional): See submit_ingestion_job.
+        review (bool, optional): See submit_ingestion_job.
+
+    Returns:
+        str: The id of the new job.
+
+    Raises:
+        IngestionBusyError: If another upload is still being processed.
+    """
+    names = [filename for _, filename in uploads]
+    display_name = names[0] if len(names) == 1 else f"{len(names)} archivos ({', '.join(names)})"
+    return _submit(list(uploads), display_name, parse_options, on_success, review)
+
+def _submit(uploads, display_name, parse_options, on_success, review):
+    global _active_job_id
+    job_id = uuid.uuid4().hex
+    schedule_set = data_manager.get_schedule_set()
+    with _jobs_lock:
+        if not _acquire_ingestion_lock():
+            raise IngestionBusyError("Ya se está procesando otro archivo de horarios.")
+        _active_job_id = job_id
+        job = {
+            'job_id': job_id,
+            'filename': display_name,
+            'schedule_set': schedule_set,
+            'status': 'queued',
+            'pages_done': 0,
+            'pages_total': None,
+            'queued_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+            'teacher_count': None,
+            'diff': None,
+            'error': None,
+        }
+        if _is_batch(uploads):
+            job.update(files_done=0, files_total=None, files=[], conflicts=[])
+        _write_job(job)
+        if on_success is not None:
+            _success_callbacks[job_id] = on_success
+        for old_job in _list_jobs()[:-MAX_TRACKED_JOBS]:
+            try:
+                os.remove(_job_path(old_job['job_id']))
+            except OSError:
+                pass
+            _success_callbacks.pop(old_job['job_id'], None)
+    try:
+        _get_executor().submit(_run_ingestion_job, job_id, uploads, parse_options or {}, schedule_set, review)
+    except RuntimeError as e: # Executor shut down
+        _update_job(job_id, status='failed', finished_at=_now(), error=str(e))
+        _success_callbacks.pop(job_id, None)
+        _release_ingestion_lock()
+        _remove_uploads(uploads)
+    return job_id
+
+def get_job_status(job_id):
+    """
+    Returns the status of an ingestion job, submitted by this or any other worker process.
+
+    Args:
+        job_id (str): The id returned by submit_ingestion_job.
+
+    Returns:
+        dict: The job status ('status' is one of 'queued', 'running', 'preview',
+              'succeeded', 'failed' or 'discarded'), or None if the job is unknown.
+    """
+    with _jobs_lock:
+        return _read_job(job_id)
+
+if __name__ == "__main__":
+    print("Testing ingestion_jobs.py...")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_manager.configure_data_dir(os.path.join(temp_dir, 'data'))
+        upload_dir = os.path.join(temp_dir, 'uploads')
+        os.makedirs(upload_dir)
+        try:
+            # A corrupt member doesn't stop the rest of the archive, and leaves nothing behind
+            zip_path = os.path.join(upload_dir, 'horarios.zip')
+            with zipfile.ZipFile(zip_path, 'w') as archive:
+                archive.writestr('roto.pdf', b'%PDF-1.4 contenido roto')
+                archive.writestr('ciencias.pdf', b'%PDF-1.4 ciencias')
+                archive.writestr('notas.txt', b'notas')
+            with open(zip_path, 'r+b') as f:
+                data = f.read()
+                f.seek(data.index(b'contenido roto'))
+                f.write(b'CONTENIDO ROTO') # Same size, wrong CRC
+            extract_dir = os.path.join(upload_dir, 'extraidos')
+            file_reports = []
+            pdfs = _expand_uploads([(zip_path, 'horarios.zip')], extract_dir, file_reports)
+            assert [name for _, name in pdfs] == ['horarios.zip/ciencias.pdf'], pdfs
+            assert sorted(report['filename'] for report in file_reports) == ['horarios.zip/notas.txt',
+                                                                             'horarios.zip/roto.pdf']
+            assert os.listdir(extract_dir) == [os.path.basename(pdfs[0][0])], os.listdir(extract_dir)
+            shutil.rmtree(extract_dir)
+
+            # A whole job removes the saved archive and the extracted PDFs, even when every file fails
+            job_id = submit_batch_ingestion_job([(zip_path, 'horarios.zip')])
+            for _ in range(600):
+                job = get_job_status(job_id)
+                if job['status'] not in ('queued', 'running'):
+                    break
+                time.sleep(0.05)
+            print(f"Job {job['status']}: {job['error']}")
+            assert job['status'] == 'failed', job
+            assert [report['status'] for report in job['files']] == ['failed'] * 3, job['files']
+            assert os.listdir(upload_dir) == [], os.listdir(upload_dir)
+        finally:
+            data_manager.configure_data_dir(data_manager.DEFAULT_DATA_DIR)
+
+    print("\nIngestion jobs tests completed.")
@@ -0,0 +1,360 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from . import data_manager, event_log
+
+REPLAY_EVENTS = 500           # Recent events kept for clients reconnecting with Last-Event-ID
+CLIENT_BUFFER_EVENTS = 100    # Events queued for one client before it is told to reload instead
+HEARTBEAT_SECONDS = 15        # Idle time after which a comment line keeps the connection open
+RECONNECT_MILLISECONDS = 3000 # Sent as 'retry:' so browsers reconnect quickly
+POLL_SECONDS = 1.0            # How often the watcher looks for changes made by any process
+
+class _Subscription:
+    """A connected client: the events waiting to be sent to it and the event that wakes its stream."""
+
+    def __init__(self, topic, buffer_size):
+        self.topic = topic
+        self.buffer_size = buffer_size
+        self.pending = collections.deque()
+        self.missed_events = False # Set when events were dropped; the client then gets a 'reset'
+        self.wakeup = threading.Event()
+
+    def push(self, event):
+        """Queues an event without ever blocking the publisher. Call with the broadcaster lock held."""
+        if len(self.pending) >= self.buffer_size:
+            self.pending.clear()
+            self.missed_events = True
+        else:
+            self.pending.append(event)
+        self.wakeup.set()
+
+class Broadcaster:
+    """
+    Fans out events to Server-Sent Events streams.
+
+    Publishing only appends to each matching client's bounded queue and sets its
+    wake-up flag, so it costs O(clients of the topic) and never waits for a
+    client. A client that falls CLIENT_BUFFER_EVENTS behind loses its queue and
+    gets a 'reset' event asking it to reload, instead of holding up the others.
+
+    Event ids are "<epoch>-<number>", with an epoch chosen per broadcaster, so a
+    Last-Event-ID from another process or from before a restart is recognised
+    and answered with a 'reset' rather than a wrong replay.
+    """
+
+    def __init__(self, replay_size=REPLAY_EVENTS, buffer_size=CLIENT_BUFFER_EVENTS):
+        self.epoch = os.urandom(4).hex()
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._next_number = 1
+        self._recent = collections.deque(maxlen=replay_size) # (number, topic, event type, JSON data)
+        self._subscriptions = set()
+
+    def publish(self, event_type, data, topic=None):
+        """
+        Sends an event to every client subscribed to topic.
+
+        Args:
+            event_type (str): SSE event name (e.g. 'sustitucion').
+            data: JSON-serializable payload.
+            topic (str, optional): Schedule set the event belongs to (None for the default one).
+
+        Returns:
+            str: The event id.
+        """
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            event = (self._next_number, topic, event_type, payload)
+            self._next_number += 1
+            self._recent.append(event)
+            for subscription in self._subscriptions:
+                if subscription.topic == topic:
+                    subscription.push(event)
+        return f"{self.epoch}-{event[0]}"
+
+    def subscribe(self, topic=None, last_event_id=None):
+        """
+        Registers a client, queueing the events it missed since last_event_id.
+
+        Args:
+            topic (str, optional): Schedule set to receive events of.
+            last_event_id (str, optional): The Last-Event-ID sent by a reconnecting browser.
+
+        Returns:
+            _Subscription: Pass it to unsubscribe when the client goes away.
+        """
+        subscription = _Subscription(topic, self.buffer_size)
+        with self._lock:
+            if last_event_id:
+                epoch, _, number = last_event_id.partition('-')
+                oldest = self._recent[0][0] if self._recent else self._next_number
+                if epoch != self.epoch or not number.isdigit() or int(number) < oldest - 1:
+                    subscription.missed_events = True # Can't tell what was missed
+                else:
+                    for event in self._recent:
+                        if event[0] > int(number) and event[1] == topic:
+                            subscription.push(event)
+                if subscription.missed_events:
+                    subscription.wakeup.set()
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def topics(self):
+        """Returns the topics with at least one connected client."""
+        with self._lock:
+            return {subscription.topic for subscription in self._subscriptions}
+
+    def _take(self, subscription):
+        """Returns (events, missed_events) waiting for a client and clears them."""
+        with self._lock:
+            subscription.wakeup.clear()
+            events = list(subscription.pending)
+            subscription.pending.clear()
+            missed_events, subscription.missed_events = subscription.missed_events, False
+        return events, missed_events
+
+    def _format(self, event):
+        number, _, event_type, payload = event
+        return f"id: {self.epoch}-{number}\nevent: {event_type}\ndata: {payload}\n\n"
+
+    def stream(self, topic=None, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """
+        Yields the text of an SSE response for one client until it disconnects.
+
+        Args:
+            topic (str, optional): Schedule set to receive events of.
+            last_event_id (str, optional): The Last-Event-ID request header, if any.
+            heartbeat (float, optional): Seconds between keep-alive comments. Defaults to HEARTBEAT_SECONDS.
+
+        Yields:
+            str: Chunks of the event stream.
+        """
+        subscription = self.subscribe(topic, last_event_id)
+        try:
+            yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+            while True:
+                if not subscription.wakeup.wait(heartbeat):
+                    yield ": ping\n\n"
+                    continue
+                events, missed_events = self._take(subscription)
+                if missed_events:
+                    # The id lets the reloaded page's stream start after the last event
+                    yield f"id: {self.epoch}-{self._next_number - 1}\nevent: reset\ndata: {{}}\n\n"
+                for event in events:
+                    yield self._format(event)
+        finally: # The server closes the generator when the client disconnects
+            self.unsubscribe(subscription)
+
+class DataWatcher:
+    """
+    Publishes the changes made to the shared data of the schedule sets, by any process.
+
+    A single thread per process polls, every poll_seconds and only for the schedule sets
+    with connected clients, the end of the set's event log and its schedules version.
+    New substitutions are published as 'sustitucion' events and schedule changes as a
+    'horarios' event, so a confirmation handled by one worker process reaches the clients
+    of all of them. The thread stops when no client is left.
+    """
+
+    def __init__(self, broadcaster, poll_seconds=POLL_SECONDS):
+        self.broadcaster = broadcaster
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._positions = {} # topic -> [log offset, schedules version] already published
+        self._thread = None
+
+    def _position(self, topic):
+        with data_manager.schedule_set(topic):
+            return [event_log.get_log_offset(), data_manager.get_schedules_version()]
+
+    def watch(self, topic):
+        """
+        Starts publishing the changes of a schedule set made from now on, if not done already.
+
+        Args:
+            topic (str): The schedule set (None for the default one). Subscribe its client
+                first, so the watcher doesn't stop for lack of clients in between.
+        """
+        with self._lock:
+            if topic not in self._positions:
+                self._positions[topic] = self._position(topic)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-feed-watcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                # Sets without clients are dropped; a new client starts from their data as it is then
+                topics = self.broadcaster.topics()
+                self._positions = {topic: position for topic, position in self._positions.items() if topic in topics}
+                if not self._positions:
+                    self._thread = None
+                    return
+                watched = list(self._positions.items())
+            for topic, position in watched:
+                try:
+                    self._poll(topic, position)
+                except Exception as e: # A broken set must not stop the others' events
+                    print(f"Error watching the data of schedule set {topic or 'principal'}: {e}")
+
+    def _poll(self, topic, position):
+        """Publishes what changed in a schedule set since position, and moves position forward."""
+        with data_manager.schedule_set(topic):
+            events, position[0] = event_log.read_events_after(position[0])
+            schedules_version = data_manager.get_schedules_version()
+            teacher_count = None
+            if schedules_version != position[1]:
+                position[1] = schedules_version
+                teacher_count = len(data_manager.load_teacher_names())
+        for event in events:
+            self.broadcaster.publish('sustitucion', event, topic)
+        if teacher_count is not None:
+            self.broadcaster.publish('horarios', {'teacher_count': teacher_count}, topic)
+
+# Process-wide broadcaster used by the app, fed by a single watcher thread
+broadcaster = Broadcaster()
+watcher = DataWatcher(broadcaster)
+
+def stream(topic=None, last_event_id=None):
+    """
+    Yields the SSE response of one client of a schedule set, from the process-wide broadcaster.
+
+    Each open stream waits in its own server thread (or greenlet, with an asynchronous
+    worker) between events, as any streamed WSGI response does, so under sync workers a
+    few open pages take every worker: use read_changes there. The shared data is only
+    polled by the watcher. See Broadcaster.stream and DataWatcher.
+
+    Args:
+        topic (str, optional): Schedule set to receive events of.
+        last_event_id (str, optional): The Last-Event-ID request header, if any.
+    """
+    chunks = broadcaster.stream(topic, last_event_id)
+    try:
+        yield next(chunks) # Subscribes the client before the watcher looks for it
+        watcher.watch(topic)
+        yield from chunks
+    finally:
+        chunks.close()
+
+def read_changes(cursor=None):
+    """
+    Returns what changed in the selected schedule set since a cursor, for pages that poll.
+
+    Unlike stream, each call answers at once, so polling pages don't hold a server
+    thread while idle and work with any WSGI worker. The cursor is the end of the
+    event log and the schedules version seen by the previous call; a cursor that
+    doesn't belong to the current data (a malformed one, or one from a log that was
+    replaced) gets a 'reset', as a stream reconnecting to another process does.
+
+    Args:
+        cursor (str, optional): The cursor returned by the previous call. None for the
+            first call, which only returns the current cursor.
+
+    Returns:
+        dict: {'cursor': str, 'events': [{'event': event type, 'data': payload}]}, with the
+            same event types and payloads as the stream.
+    """
+    end_offset = event_log.get_log_offset()
+    epoch, schedules_number = data_manager.get_schedules_version()
+    events = []
+    if cursor is not None:
+        offset, _, schedules_version = cursor.partition('-')
+        if not offset.isdigit() or int(offset) > end_offset:
+            events.append({'event': 'reset', 'data': {}})
+        else:
+            new_events, end_offset = event_log.read_events_after(int(offset))
+            events.extend({'event': 'sustitucion', 'data': event} for event in new_events)
+            if schedules_version != f"{epoch}-{schedules_number}":
+                events.append({'event': 'horarios', 'data': {'teacher_count': len(data_manager.load_teacher_names())}})
+    return {'cursor': f"{end_offset}-{epoch}-{schedules_number}", 'events': events}
+
+if __name__ == "__main__":
+    print("Testing live_feed.py...")
+    feed = Broadcaster(replay_size=3, buffer_size=2)
+
+    # Events reach clients of the same topic only
+    stream = feed.stream(topic='centro/2026', heartbeat=0.01)
+    assert next(stream).startswith("retry:")
+    first_id = feed.publish('sustitucion', {'substitute': 'Ana'}, topic='centro/2026')
+    feed.publish('sustitucion', {'substitute': 'Otro'}, topic=None)
+    chunk = next(stream)
+    print(chunk)
+    assert chunk == f"id: {first_id}\nevent: sustitucion\ndata: {{\"substitute\": \"Ana\"}}\n\n"
+    assert next(stream) == ": ping\n\n"
+
+    # A slow client loses its queue and is told to reload; the publisher never waits
+    for number in range(5):
+        feed.publish('sustitucion', {'number': number}, topic='centro/2026')
+    assert "event: reset" in next(stream)
+    assert '"number": 3' in next(stream) and '"number": 4' in next(stream)
+    stream.close()
+    assert feed.client_count() == 0
+
+    # Reconnecting with Last-Event-ID replays the missed events of the topic
+    last_id = feed.publish('horarios', {'teachers': 10})
+    feed.publish('sustitucion', {'substitute': 'Bea'})
+    feed.publish('sustitucion', {'substitute': 'Carlos'})
+    replay = feed.stream(last_event_id=last_id, heartbeat=0.01)
+    next(replay)
+    assert '"Bea"' in next(replay) and '"Carlos"' in next(replay)
+    replay.close()
+
+    # Ids that can't be replayed (too old, or from another process) get a reset
+    for stale_id in (first_id, "otro-1"):
+        stale = feed.stream(last_event_id=stale_id, heartbeat=0.01)
+        next(stale)
+        assert "event: reset" in next(stale), stale_id
+        stale.close()
+
+    # The watcher publishes what any process records in the shared data
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_manager.configure_data_dir(temp_dir)
+        try:
+            watched_feed = Broadcaster()
+            data_watcher = DataWatcher(watched_feed, poll_seconds=0.01)
+            client = watched_feed.stream(heartbeat=0.01)
+            next(client)
+            data_watcher.watch(None)
+            event_log.append_substitution_event('Bea', 'Ana', 'Lunes', '08:00-09:00', date='2026-10-12')
+            data_manager.save_schedules([{'teacher_name': 'Ana', 'schedule': {}}])
+            chunks = [chunk for chunk in (next(client) for _ in range(300)) if chunk != ": ping\n\n"][:2]
+            print(chunks)
+            assert "event: sustitucion" in chunks[0] and '"substitute": "Ana"' in chunks[0]
+            assert chunks[1].endswith('event: horarios\ndata: {"teacher_count": 1}\n\n')
+            client.close()
+            for _ in range(100): # No clients left: the watcher thread ends
+                if data_watcher._thread is None:
+                    break
+                time.sleep(0.01)
+            assert data_watcher._thread is None
+
+            # Polling: the first call only returns the cursor, later ones what changed since it
+            changes = read_changes()
+            assert changes['events'] == []
+            assert read_changes(changes['cursor']) == changes
+            event_log.append_substitution_event('Carlos', 'Bea', 'Martes', '09:00-10:00', date='2026-10-13')
+            data_manager.save_schedules([{'teacher_name': 'Ana', 'schedule': {}}, {'teacher_name': 'Bea', 'schedule': {}}])
+            later = read_changes(changes['cursor'])
+            print(later)
+            assert [event['event'] for event in later['events']] == ['sustitucion', 'horarios']
+            assert later['events'][0]['data']['substitute'] == 'Bea' and later['events'][1]['data'] == {'teacher_count': 2}
+            assert read_changes(later['cursor'])['events'] == []
+            for stale_cursor in ("999999-x-1", "otro"): # Past the end of the log, or malformed
+                assert read_changes(stale_cursor)['events'] == [{'event': 'reset', 'data': {}}]
+        finally:
+            data_manager.configure_data_dir(data_manager.DEFAULT_DATA_DIR)
+    print("\nLive feed tests completed.")
@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+
+# Instrumented code checks this flag before measuring anything, so disabled metrics cost
+# a single attribute lookup. Set it with enable_metrics().
+enabled = False
+
+# Upper bounds (seconds) of the histogram buckets, from a single PDF page to a full upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help)
+METRICS = {
+    'sustituciones_http_request_duration_seconds': ('histogram', "Time spent handling HTTP requests."),
+    'sustituciones_pdf_stage_duration_seconds': ('histogram', "Time spent in each stage of schedule PDF parsing."),
+    'sustituciones_pdf_pages_total': ('counter', "Schedule PDF pages handled, by whether they came from the page cache."),
+    'sustituciones_json_loads_total': ('counter', "JSON data files read from disk (cache misses)."),
+    'sustituciones_json_load_bytes_total': ('counter', "Bytes of JSON data files read from disk."),
+    'sustituciones_json_saves_total': ('counter', "JSON data files written."),
+    'sustituciones_json_save_bytes_total': ('counter', "Bytes of JSON data files written."),
+    'sustituciones_fragment_cache_total': ('counter', "Rendered page fragment lookups, by whether they were cached."),
+}
+
+_lock = threading.Lock()
+_counters = {}   # name -> {labels: value}
+_histograms = {} # name -> {labels: [bucket counts..., +Inf count, sum]}
+
+def enable_metrics():
+    """Turns instrumentation on for this process."""
+    global enabled
+    enabled = True
+
+def reset_metrics():
+    """Drops every recorded value."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def inc_counter(name, amount=1, **labels):
+    """
+    Adds to a counter.
+
+    Args:
+        name (str): Metric name, declared in METRICS.
+        amount (float, optional): Amount to add. Defaults to 1.
+        **labels: Label names and values.
+    """
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        values = _counters.setdefault(name, {})
+        values[key] = values.get(key, 0) + amount
+
+def observe(name, seconds, **labels):
+    """
+    Records a duration in a histogram.
+
+    Args:
+        name (str): Metric name, declared in METRICS.
+        seconds (float): The observed value.
+        **labels: Label names and values.
+    """
+    key = tuple(sorted(labels.items()))
+    bucket = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+    with _lock:
+        values = _histograms.setdefault(name, {})
+        counts = values.get(key)
+        if counts is None:
+            counts = values[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+        counts[bucket] += 1
+        counts[-1] += seconds
+
+def observe_stages(stage_seconds):
+    """
+    Records the PDF parsing stage timings collected by parse_schedule_pdf.
+
+    Args:
+        stage_seconds (dict): Stage names and lists of durations, one per page (or per document open).
+    """
+    for stage, durations in stage_seconds.items():
+        for seconds in durations:
+            observe('sustituciones_pdf_stage_duration_seconds', seconds, stage=stage)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_metrics():
+    """
+    Returns every recorded metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics text.
+    """
+    lines = []
+    with _lock:
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'counter':
+                for labels, value in sorted(_counters.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                continue
+            for labels, counts in sorted(_histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, count in zip(DEFAULT_BUCKETS + ('+Inf',), counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(counts[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def instrument_app(app):
+    """
+    Records the latency of every request to a Flask app and serves the metrics on /metrics.
+
+    Only call this when metrics are enabled: an app that is not instrumented has no
+    request hooks and no /metrics route.
+
+    Args:
+        app (flask.Flask): The application.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_duration(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # The route pattern, not the URL, so /cargar_horarios/estado/<job_id> is a single series
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            observe('sustituciones_http_request_duration_seconds', time.perf_counter() - started,
+                    route=route, method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics_route():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+if __name__ == "__main__":
+    print("Testing metrics.py...")
+    inc_counter('sustituciones_json_loads_total', file='horarios.json')
+    inc_counter('sustituciones_json_load_bytes_total', 2048, file='horarios.json')
+    observe('sustituciones_http_request_duration_seconds', 0.003, route='/', method='GET', status=200)
+    observe('sustituciones_http_request_duration_seconds', 0.2, route='/', method='GET', status=200)
+    observe_stages({'find_tables': [0.02, 0.03], 'get_text': [0.001]})
+
+    text = render_metrics()
+    print(text)
+    assert 'sustituciones_json_load_bytes_total{file="horarios.json"} 2048' in text
+    assert 'sustituciones_http_request_duration_seconds_bucket{method="GET",route="/",status="200",le="0.005"} 1' in text
+    assert 'sustituciones_http_request_duration_seconds_count{method="GET",route="/",status="200"} 2' in text
+    assert 'sustituciones_pdf_stage_duration_seconds_count{stage="find_tables"} 2' in text
+
+    reset_metrics()
+    assert 'sustituciones_json_loads_total{' not in render_metrics()
+    print("\nMetrics tests completed.")
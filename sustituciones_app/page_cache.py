@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import uuid
+
+DEFAULT_MAX_CACHE_BYTES = 50 * 1024 * 1024 # 50 MB
+
+def page_cache_key(page, parser_version):
+    """
+    Computes the cache key of a PDF page from its content and the parser version.
+
+    The key covers the page's content stream, its size and rotation, the fonts
+    it uses, and the Form XObjects and images it draws, whose content lives in
+    their own streams (all by name, not by xref number, which differs between
+    files). A re-exported timetable therefore produces the same keys for
+    unchanged pages.
+
+    Args:
+        page (fitz.Page): The page to hash.
+        parser_version (int): Version of the page parser; bumping it invalidates all entries.
+
+    Returns:
+        str: Hex digest identifying the page content.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"parser:{parser_version}|rect:{tuple(page.rect)}|rotation:{page.rotation}|".encode('utf-8'))
+    for font in page.get_fonts():
+        # (xref, ext, type, basefont, name, encoding[, referencer]) -> drop the xref numbers
+        digest.update(repr(font[1:6]).encode('utf-8'))
+    digest.update(page.read_contents())
+    document = page.parent
+    for xref, name, _, bbox in page.get_xobjects(): # Nested forms too
+        digest.update(f"|xobject:{name}|{tuple(bbox)}|{document.xref_get_key(xref, 'Matrix')}|".encode('utf-8'))
+        digest.update(document.xref_stream(xref) or b'')
+    for image in page.get_images(full=True):
+        # (xref, smask, width, height, bpc, colorspace, alt. colorspace, name, filter, referencer)
+        digest.update(f"|image:{image[7]}|{image[2:6]}|{image[8]}|".encode('utf-8'))
+        digest.update(document.xref_stream_raw(image[0]) or b'') # Still compressed: images can be large
+    return digest.hexdigest()
+
+def _entry_path(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.json")
+
+def get_cached_page(cache_dir, key):
+    """
+    Looks up the parse result of a page.
+
+    A hit refreshes the entry's modification time, which is what eviction uses
+    as its least-recently-used order.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        key (str): Key from page_cache_key.
+
+    Returns:
+        tuple: (found, teacher_data). teacher_data is None for pages that produced no schedule.
+    """
+    file_path = _entry_path(cache_dir, key)
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(file_path)
+    except (IOError, OSError, json.JSONDecodeError):
+        return False, None
+    return True, entry.get('teacher_data')
+
+def store_cached_page(cache_dir, key, teacher_data):
+    """
+    Stores the parse result of a page.
+
+    Entries are written to a temporary file and renamed into place, so parallel
+    parser processes never see partially written entries.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        key (str): Key from page_cache_key.
+        teacher_data (dict): Result of process_teacher_schedule_from_page, or None.
+    """
+    file_path = _entry_path(cache_dir, key)
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'teacher_data': teacher_data}, f, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+    except (IOError, OSError) as e:
+        print(f"Error storing page cache entry {file_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def evict_page_cache(cache_dir, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """
+    Deletes the least recently used entries until the cache fits in max_bytes.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        max_bytes (int, optional): Size limit of the cache on disk.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    total_bytes = 0
+    with os.scandir(cache_dir) as it:
+        for dir_entry in it:
+            if not dir_entry.name.endswith('.json'):
+                continue
+            try:
+                st = dir_entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, dir_entry.path))
+            total_bytes += st.st_size
+
+    removed = 0
+    for _, size, file_path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+    return removed
+
+if __name__ == "__main__":
+    print("Testing page_cache.py...")
+    import tempfile
+    import time
+
+    import fitz  # PyMuPDF
+
+    def timetable_page(text):
+        document = fitz.open()
+        page = document.new_page()
+        page.insert_text((72, 72), text)
+        return document, page
+
+    # The same content gives the same key in another file; different content or parser version doesn't
+    _, first = timetable_page("Profesora Beta - Lunes 08:00-09:00 Mates")
+    _, again = timetable_page("Profesora Beta - Lunes 08:00-09:00 Mates")
+    _, other = timetable_page("Profesora Beta - Lunes 08:00-09:00 Lengua")
+    assert page_cache_key(first, 1) == page_cache_key(again, 1)
+    assert page_cache_key(first, 1) != page_cache_key(other, 1)
+    assert page_cache_key(first, 1) != page_cache_key(first, 2)
+
+    # Pages that only draw a Form XObject have the same content stream: the XObject tells them apart
+    def form_page(text):
+        source, _ = timetable_page(text)
+        document = fitz.open()
+        page = document.new_page()
+        page.show_pdf_page(page.rect, source, 0) # Content stream: "q /fzFrm0 Do Q"
+        return document, page
+    _, form_first = form_page("Profesora Beta - Lunes 08:00-09:00 Mates")
+    _, form_other = form_page("Profesora Beta - Lunes 08:00-09:00 Lengua")
+    _, form_again = form_page("Profesora Beta - Lunes 08:00-09:00 Mates")
+    assert form_first.read_contents() == form_other.read_contents()
+    assert page_cache_key(form_first, 1) != page_cache_key(form_other, 1)
+    assert page_cache_key(form_first, 1) == page_cache_key(form_again, 1)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        key = page_cache_key(first, 1)
+        assert get_cached_page(cache_dir, key) == (False, None)
+        teacher_data = {'teacher_name': 'Profesora Beta', 'schedule': {'Lunes': []}}
+        store_cached_page(cache_dir, key, teacher_data)
+        store_cached_page(cache_dir, page_cache_key(other, 1), None) # A page without a schedule is cached too
+        assert get_cached_page(cache_dir, key) == (True, teacher_data)
+        assert get_cached_page(cache_dir, page_cache_key(other, 1)) == (True, None)
+
+        # Eviction drops the least recently used entries first
+        old_time = time.time() - 60
+        os.utime(_entry_path(cache_dir, key), (old_time, old_time))
+        entry_bytes = os.path.getsize(_entry_path(cache_dir, page_cache_key(other, 1)))
+        assert evict_page_cache(cache_dir, max_bytes=entry_bytes) == 1
+        assert get_cached_page(cache_dir, key) == (False, None)
+        assert get_cached_page(cache_dir, page_cache_key(other, 1)) == (True, None)
+
+    print("\nPage cache tests completed.")
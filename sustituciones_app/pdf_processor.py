@@ -1,5 +1,22 @@
+import collections
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
 import fitz  # PyMuPDF
 
+from . import metrics
+from .time_slots import canonicalize_slot
+from .table_layout import TableLayout
+from .page_cache import page_cache_key, get_cached_page, store_cached_page, evict_page_cache, DEFAULT_MAX_CACHE_BYTES
+
+# Documents shorter than this are parsed serially: starting worker processes costs more than it saves.
+PARALLEL_MIN_PAGES = 16
+# Pages per task when iter_schedule_pdf parses in parallel; at most two tasks per worker are pending at once.
+STREAM_CHUNK_PAGES = 32
+# Bump whenever process_teacher_schedule_from_page changes its output, so cached pages are re-parsed.
+PARSER_VERSION = 2
+
 def extract_text_from_pdf(pdf_path):
     """
     Extracts all text from a PDF file.
@@ -132,7 +149,8 @@ def process_teacher_schedule_from_page(page_text, page_tables):
 
     for row_idx in range(1, len(schedule_table)): # Skip header row
         row = schedule_table[row_idx]
-        time_slot = str(row[0]) if row and row[0] else "Unknown Time"
+        # "8:00 - 9:00\n" -> "08:00-09:00"; a row spanning several slots of the grid is stored once per slot
+        time_slots = canonicalize_slot(str(row[0])) if row and row[0] else ["Unknown Time"]
 
         for day_name, col_idx in day_columns.items():
             if col_idx < len(row) and row[col_idx]:
@@ -141,69 +159,452 @@ def process_teacher_schedule_from_page(page_text, page_tables):
                 if "refuerzo" in cell_text.lower() or "guardia" in cell_text.lower():
                     activity_type = 'refuerzo'
 
-                schedule[day_name].append({
-                    'time': time_slot,
-                    'subject': cell_text.strip(), # Clean up whitespace
-                    'type': activity_type
-                })
+                for time_slot in time_slots:
+                    schedule[day_name].append({
+                        'time': time_slot,
+                        'subject': cell_text.strip(), # Clean up whitespace
+                        'type': activity_type
+                    })
 
     return {
         'teacher_name': teacher_name,
         'schedule': schedule
     }
 
-def parse_schedule_pdf(pdf_path):
+def _lap(stage_seconds, stage, started):
+    """Records the time elapsed since started under a parsing stage and returns the current time."""
+    now = time.perf_counter()
+    stage_seconds.setdefault(stage, []).append(now - started)
+    return now
+
+def _new_layout_state():
+    """Returns the state of layout learning for one run over a document's pages (see _parse_schedule_page)."""
+    return {'layout': None, 'layout_pages': 0, 'layout_seconds': 0.0,
+            'detected_pages': 0, 'detected_seconds': 0.0, 'fallback_pages': 0, 'fallback_seconds': 0.0}
+
+def _layout_counts(layout_state):
+    """Returns the page counts and timings of a layout state, without the layout (None stays None)."""
+    if layout_state is None:
+        return None
+    return {key: value for key, value in layout_state.items() if key != 'layout'}
+
+def _merge_layout_counts(total, counts):
+    """Adds the page counts and timings of one layout state to another."""
+    for key, value in counts.items():
+        if key != 'layout':
+            total[key] += value
+
+def _layout_report(layout_state):
+    """
+    Summarizes layout learning for a parse report.
+
+    Returns:
+        dict: 'layout_pages' (read through a learned layout), 'fallback_pages' (didn't fit it and
+            went through full table detection), 'seconds_saved_per_page' (average cost of table
+            detection minus that of reading a page through the layout) and 'seconds_saved' (in
+            total, after paying for the failed attempts of fallback pages).
+    """
+    saved_per_page = 0.0
+    if layout_state['layout_pages'] and layout_state['detected_pages']:
+        saved_per_page = (layout_state['detected_seconds'] / layout_state['detected_pages']
+                          - layout_state['layout_seconds'] / layout_state['layout_pages'])
+    return {
+        'layout_pages': layout_state['layout_pages'],
+        'fallback_pages': layout_state['fallback_pages'],
+        'seconds_saved_per_page': round(saved_per_page, 6),
+        'seconds_saved': round(saved_per_page * layout_state['layout_pages'] - layout_state['fallback_seconds'], 6),
+    }
+
+def _parse_schedule_page(page, stage_seconds=None, layout_state=None):
+    """
+    Extracts the text and tables of a single page and processes them into a teacher's schedule.
+
+    Args:
+        page (fitz.Page): The page to process.
+        stage_seconds (dict, optional): If given, the duration of each stage (get_text, find_tables,
+            extract, layout, process) is appended to stage_seconds[stage].
+        layout_state (dict, optional): Layout learning state shared by the pages of a document
+            (see _new_layout_state). The table found on a page is learned as a TableLayout, and
+            the following pages are read through it instead of running find_tables(), until a
+            page doesn't fit it; that page is parsed normally and its table learned instead.
+
+    Returns:
+        dict: Processed schedule for a teacher, or None if the page is empty or has no usable data.
+    """
+    started = time.perf_counter() if stage_seconds is not None else None
+    page_text = page.get_text("text") # Get plain text
+    if started is not None:
+        started = _lap(stage_seconds, 'get_text', started)
+
+    # Extract tables for the current page
+    current_page_tables_extracted = None
+    if layout_state is not None and layout_state['layout'] is not None:
+        layout_started = time.perf_counter()
+        table = layout_state['layout'].extract(page)
+        layout_seconds = time.perf_counter() - layout_started
+        if table is not None:
+            # Only the first table is used for the schedule, and it is the one the layout was learned from
+            current_page_tables_extracted = [table]
+            layout_state['layout_pages'] += 1
+            layout_state['layout_seconds'] += layout_seconds
+        else:
+            layout_state['fallback_pages'] += 1
+            layout_state['fallback_seconds'] += layout_seconds
+            layout_state['layout'] = None
+        if started is not None:
+            started = _lap(stage_seconds, 'layout', started)
+
+    if current_page_tables_extracted is None:
+        detect_started = time.perf_counter()
+        current_page_tables_extracted = []
+        tables_on_page = page.find_tables()
+        if started is not None:
+            started = _lap(stage_seconds, 'find_tables', started)
+        for table_obj in tables_on_page:
+            current_page_tables_extracted.append(table_obj.extract())
+        if started is not None:
+            started = _lap(stage_seconds, 'extract', started)
+        if layout_state is not None:
+            layout_state['detected_pages'] += 1
+            layout_state['detected_seconds'] += time.perf_counter() - detect_started
+            if tables_on_page.tables:
+                layout_state['layout'] = TableLayout.learn(tables_on_page[0])
+
+    if not current_page_tables_extracted and not page_text.strip():
+        # Skip page if it's essentially empty (no text, no tables)
+        # This might happen for blank pages or pages with only images not OCR'd
+        return None
+
+    # Even if there are no tables, page_text might contain the teacher's name
+    # The process_teacher_schedule_from_page should handle cases with no tables gracefully
+    teacher_data = process_teacher_schedule_from_page(page_text, current_page_tables_extracted)
+    if started is not None:
+        _lap(stage_seconds, 'process', started)
+    return teacher_data
+
+def _parse_schedule_page_cached(page, cache_dir, stage_seconds=None, layout_state=None):
+    """
+    Parses a page, serving the result from the page cache when its content is unchanged.
+
+    Args:
+        page (fitz.Page): The page to process.
+        cache_dir (str): Page cache directory, or None to always parse.
+        stage_seconds (dict, optional): Collects stage timings, see _parse_schedule_page.
+        layout_state (dict, optional): Layout learning state, see _parse_schedule_page.
+
+    Returns:
+        tuple: (teacher_data, reused) where reused tells whether the result came from the cache.
+    """
+    if not cache_dir:
+        return _parse_schedule_page(page, stage_seconds, layout_state), False
+
+    key = page_cache_key(page, PARSER_VERSION)
+    found, teacher_data = get_cached_page(cache_dir, key)
+    if found:
+        return teacher_data, True
+    teacher_data = _parse_schedule_page(page, stage_seconds, layout_state)
+    store_cached_page(cache_dir, key, teacher_data)
+    return teacher_data, False
+
+def _iter_page_range(doc, start_page, stop_page, cache_dir, stage_seconds, layout_state, failed_pages=None):
+    """
+    Parses the pages of a range one at a time.
+
+    Args:
+        doc (fitz.Document): The open document.
+        start_page (int): First page of the range.
+        stop_page (int): Page after the last one of the range.
+        cache_dir (str): Page cache directory, or None.
+        stage_seconds (dict): Collects stage timings, or None (see _parse_schedule_page).
+        layout_state (dict): Layout learning state, or None (see _parse_schedule_page).
+        failed_pages (list, optional): If given, a page that can't be parsed is skipped and its
+            (page number, error message) appended here; otherwise the error is raised.
+
+    Yields:
+        tuple: (teacher_data, reused) for every page parsed, see _parse_schedule_page_cached.
+    """
+    for page_num in range(start_page, stop_page):
+        try:
+            result = _parse_schedule_page_cached(doc.load_page(page_num), cache_dir, stage_seconds, layout_state)
+        except Exception as e:
+            if failed_pages is None:
+                raise
+            print(f"Error processing page {page_num + 1} of the PDF for schedules: {e}. Skipping it.")
+            failed_pages.append((page_num, str(e)))
+            if layout_state is not None:
+                layout_state['layout'] = None # The next page detects its table again
+            continue
+        yield result
+
+def _parse_page_range(pdf_path, start_page, stop_page, cache_dir=None, collect_stages=False, learn_layout=False):
+    """
+    Parses a contiguous range of pages. Runs inside a worker process, which opens its own document.
+    Pages that can't be parsed are skipped and reported.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        start_page (int): First page of the range.
+        stop_page (int): Page after the last one of the range.
+        cache_dir (str, optional): Page cache directory.
+        collect_stages (bool, optional): Whether to time the parsing stages.
+        learn_layout (bool, optional): Whether to learn the table layout of the range's pages.
+
+    Returns:
+        tuple: (results, reused, error, stage_seconds, layout_counts, failed_pages) where results holds
+               the processed schedule (or None) of every page parsed, reused is how many of them came
+               from the page cache, error is the error message if the document couldn't be opened,
+               stage_seconds holds the stage timings (None unless collect_stages), layout_counts the
+               page counts and timings of layout learning (None unless learn_layout) and failed_pages
+               the (page number, error message) of the pages skipped.
+    """
+    results = []
+    reused = 0
+    stage_seconds = {} if collect_stages else None
+    layout_state = _new_layout_state() if learn_layout else None
+    failed_pages = []
+    started = time.perf_counter() if collect_stages else None
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        return (results, reused, f"Error opening PDF file for schedule parsing: {e}", stage_seconds,
+                _layout_counts(layout_state), failed_pages)
+    if started is not None:
+        _lap(stage_seconds, 'open', started)
+    try:
+        for teacher_data, from_cache in _iter_page_range(doc, start_page, stop_page, cache_dir, stage_seconds,
+                                                         layout_state, failed_pages):
+            results.append(teacher_data)
+            reused += from_cache
+    finally:
+        doc.close()
+    return results, reused, None, stage_seconds, _layout_counts(layout_state), failed_pages
+
+def parse_schedule_pdf(pdf_path, workers=None, min_pages_for_parallel=PARALLEL_MIN_PAGES,
+                       cache_dir=None, cache_max_bytes=DEFAULT_MAX_CACHE_BYTES, report=None, progress=None,
+                       learn_layout=False):
     """
     Parses a PDF file to extract teacher schedules from each page.
 
+    The schedules of iter_schedule_pdf, gathered in a list: a page that can't be parsed is
+    skipped and listed in the report's 'failed_pages'.
+
     Args:
         pdf_path (str): The path to the PDF file.
+        workers (int, optional): Number of worker processes used to parse pages in parallel.
+            None or 1 parses serially in the calling process.
+        min_pages_for_parallel (int, optional): Documents with fewer pages than this are parsed
+            serially, as starting the worker processes would cost more than it saves.
+        cache_dir (str, optional): Directory of the page cache. Pages whose content was parsed
+            before are served from it instead of running text and table extraction again.
+        cache_max_bytes (int, optional): Size limit of the page cache, enforced after parsing.
+        report (dict, optional): If given, filled with 'pages' (pages handled), 'reused'
+            (served from the page cache), 'parsed' (extracted from the PDF), 'failed_pages' and
+            'error' (see iter_schedule_pdf). When metrics are enabled, also 'stage_seconds':
+            total seconds spent in each parsing stage.
+        progress (callable, optional): Called as progress(pages_done, pages_total) while parsing.
+        learn_layout (bool, optional): Learn the position and grid of the schedule table from the
+            first page parsed and read the following pages through it, skipping full-page table
+            detection. A page that doesn't fit the learned layout falls back to detection, and its
+            table becomes the new layout. The report then also gets 'layout' (see _layout_report).
 
     Returns:
         list: A list of dictionaries, where each dictionary contains
               a teacher's name and their structured schedule.
-              Returns an empty list if an error occurs or no data is found.
+              Returns an empty list if the file can't be opened or no data is found.
+    """
+    return list(iter_schedule_pdf(pdf_path, workers, min_pages_for_parallel, cache_dir, cache_max_bytes,
+                                  report, progress, learn_layout))
+
+def _parse_batch_file(pdf_path, options):
     """
+    Parses one file of a batch with iter_schedule_pdf. Runs inside a worker process, or serially.
+
+    Returns:
+        tuple: (schedules, report, error, seconds), error being None unless the file couldn't be opened
+            or parsed. Pages skipped because they couldn't be parsed are in report['failed_pages'].
+    """
+    started = time.perf_counter()
+    report = {}
     try:
-        doc = fitz.open(pdf_path)
+        schedules = list(iter_schedule_pdf(pdf_path, report=report, **options))
+        error = report.get('error') or (None if report.get('pages') or report.get('failed_pages')
+                                        else "The PDF has no pages")
     except Exception as e:
-        print(f"Error opening PDF file for schedule parsing: {e}")
-        return []
+        schedules, error = [], f"Error processing PDF for schedules: {e}"
+    return schedules, report, error, time.perf_counter() - started
 
-    all_schedules = []
-    try:
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            page_text = page.get_text("text") # Get plain text
+def parse_schedule_pdfs(pdf_paths, workers=None, progress=None, **options):
+    """
+    Parses several schedule PDFs, several at a time across a bounded process pool.
 
-            # Extract tables for the current page
-            current_page_tables_extracted = []
-            tables_on_page = page.find_tables()
-            for table_obj in tables_on_page:
-                current_page_tables_extracted.append(table_obj.extract())
+    Each file is parsed whole by iter_schedule_pdf (serially inside its worker), so a file
+    that can't be opened or parsed only fails its own entry, and a page that can't be parsed
+    only that page. A single file, or workers None or 1, is parsed in the calling process,
+    where iter_schedule_pdf may still split its pages across workers.
 
-            if not current_page_tables_extracted and not page_text.strip():
-                # Skip page if it's essentially empty (no text, no tables)
-                # This might happen for blank pages or pages with only images not OCR'd
-                continue
+    Args:
+        pdf_paths (list): Paths of the PDF files.
+        workers (int, optional): Maximum number of files parsed at once.
+        progress (callable, optional): Called as progress(files_done, files_total) after each file.
+        **options: Other keyword arguments for iter_schedule_pdf (cache_dir, learn_layout, ...).
+
+    Returns:
+        list: One dict per file, in the order of pdf_paths: 'schedules' (list), 'report' (see
+              iter_schedule_pdf), 'error' (message, or None) and 'seconds' spent on the file.
+    """
+    results = [None] * len(pdf_paths)
+
+    def finish(i, result):
+        schedules, report, error, seconds = result
+        results[i] = {'schedules': schedules, 'report': report, 'error': error, 'seconds': seconds}
+        if progress:
+            progress(sum(1 for r in results if r is not None), len(pdf_paths))
+
+    pool_size = min(workers or 1, len(pdf_paths))
+    if pool_size > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=pool_size) as executor:
+                futures = {executor.submit(_parse_batch_file, pdf_path, options): i
+                           for i, pdf_path in enumerate(pdf_paths)}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    finish(i, future.result())
+                    # Recorded in the worker's own copy of the metrics, which the pool discards
+                    if metrics.enabled:
+                        report = results[i]['report']
+                        metrics.inc_counter('sustituciones_pdf_pages_total', report.get('reused', 0), source='cache')
+                        metrics.inc_counter('sustituciones_pdf_pages_total', report.get('parsed', 0), source='parsed')
+        except (OSError, BrokenProcessPool) as e:
+            print(f"Parallel schedule parsing unavailable ({e}). Parsing the remaining files serially.")
+    for i, pdf_path in enumerate(pdf_paths):
+        if results[i] is None:
+            finish(i, _parse_batch_file(pdf_path, dict(options, workers=workers if pool_size <= 1 else None)))
+    return results
+
+def _finish_parse_report(report, stage_seconds, layout_state, cache_dir, cache_max_bytes):
+    """Completes the report of a parse, records its metrics and trims the page cache."""
+    report['parsed'] = report['pages'] - report['reused']
+    if layout_state is not None:
+        report['layout'] = _layout_report(layout_state)
+    if stage_seconds is not None:
+        metrics.observe_stages(stage_seconds)
+        metrics.inc_counter('sustituciones_pdf_pages_total', report['reused'], source='cache')
+        metrics.inc_counter('sustituciones_pdf_pages_total', report['parsed'], source='parsed')
+        report['stage_seconds'] = {stage: sum(durations) for stage, durations in stage_seconds.items()}
+    if cache_dir:
+        evict_page_cache(cache_dir, cache_max_bytes)
+
+def _iter_chunks_parallel(pdf_path, chunks, workers, cache_dir, collect_stages, learn_layout):
+    """
+    Parses chunks of pages across a process pool and yields their results in page order.
+
+    Only two chunks per worker are submitted ahead of the one being consumed, so the results
+    held in memory stay bounded however long the document is.
+
+    Yields:
+        tuple: (start, stop, chunk result) for each chunk, see _parse_page_range.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        chunks = iter(chunks)
+        for start, stop in chunks:
+            pending.append((start, stop, executor.submit(_parse_page_range, pdf_path, start, stop, cache_dir,
+                                                         collect_stages, learn_layout)))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            start, stop, future = pending.popleft()
+            result = future.result()
+            for next_start, next_stop in chunks:
+                pending.append((next_start, next_stop, executor.submit(
+                    _parse_page_range, pdf_path, next_start, next_stop, cache_dir, collect_stages, learn_layout)))
+                break
+            yield start, stop, result
 
-            # Process this page's data
-            # Even if there are no tables, page_text might contain the teacher's name
-            # The process_teacher_schedule_from_page should handle cases with no tables gracefully
-            teacher_data = process_teacher_schedule_from_page(page_text, current_page_tables_extracted)
+def iter_schedule_pdf(pdf_path, workers=None, min_pages_for_parallel=PARALLEL_MIN_PAGES,
+                      cache_dir=None, cache_max_bytes=DEFAULT_MAX_CACHE_BYTES, report=None, progress=None,
+                      learn_layout=False):
+    """
+    Parses a PDF file page by page, yielding each teacher schedule as soon as its page is done.
+
+    The schedules are never gathered in a list, so memory use doesn't grow with the number of
+    pages, and a page that can't be parsed is skipped (and reported) instead of ending the parse.
+    Meant to be consumed by data_manager.save_schedules_stream; parse_schedule_pdf wraps it in a list.
 
-            if teacher_data: # Only add if some data was processed
-                # We might want to add page_num for reference, if multiple teachers share a name
-                # teacher_data['page_number'] = page_num
-                all_schedules.append(teacher_data)
+    Args:
+        pdf_path (str): The path to the PDF file.
+        workers (int, optional): Number of worker processes; pages are then parsed in chunks of
+            STREAM_CHUNK_PAGES and still yielded in page order. None or 1 parses serially.
+        min_pages_for_parallel (int, optional): See parse_schedule_pdf.
+        cache_dir (str, optional): See parse_schedule_pdf.
+        cache_max_bytes (int, optional): See parse_schedule_pdf.
+        report (dict, optional): Filled with 'pages', 'reused' and 'parsed' (see parse_schedule_pdf)
+            once the generator is exhausted or closed, plus 'failed_pages': a list of {'page': page
+            number (from 1), 'error': message}, and 'error': the message if the file couldn't be opened.
+        progress (callable, optional): Called as progress(pages_done, pages_total) while parsing.
+        learn_layout (bool, optional): See parse_schedule_pdf.
+
+    Yields:
+        dict: The schedule of each page with usable data, in page order.
+    """
+    if report is None:
+        report = {}
+    report.update({'pages': 0, 'reused': 0, 'parsed': 0, 'failed_pages': [], 'error': None})
+    stage_seconds = {} if metrics.enabled else None
+    layout_state = _new_layout_state() if learn_layout else None
 
+    started = time.perf_counter() if stage_seconds is not None else None
+    try:
+        doc = fitz.open(pdf_path)
     except Exception as e:
-        print(f"Error processing PDF for schedules: {e}")
-        # Optionally, re-raise or handle more gracefully
+        print(f"Error opening PDF file for schedule parsing: {e}")
+        report['error'] = f"Error opening PDF file for schedule parsing: {e}"
+        return
+    if started is not None:
+        _lap(stage_seconds, 'open', started)
+
+    page_count = len(doc)
+    next_page = 0 # First page not yielded yet
+    failed_pages = []
+    try:
+        if workers and workers > 1 and page_count >= max(min_pages_for_parallel, 2):
+            chunks = [(start, min(start + STREAM_CHUNK_PAGES, page_count))
+                      for start in range(0, page_count, STREAM_CHUNK_PAGES)]
+            try:
+                for start, stop, chunk_result in _iter_chunks_parallel(
+                        pdf_path, chunks, min(workers, len(chunks)), cache_dir, stage_seconds is not None,
+                        learn_layout):
+                    results, reused, error, chunk_stage_seconds, chunk_layout_counts, chunk_failed = chunk_result
+                    if error: # The worker couldn't open the document; parse the rest here
+                        raise OSError(error)
+                    report['pages'] += len(results)
+                    report['reused'] += reused
+                    failed_pages.extend(chunk_failed)
+                    for stage, durations in (chunk_stage_seconds or {}).items():
+                        stage_seconds.setdefault(stage, []).extend(durations)
+                    if chunk_layout_counts:
+                        _merge_layout_counts(layout_state, chunk_layout_counts)
+                    next_page = stop
+                    if progress:
+                        progress(stop, page_count)
+                    for teacher_data in results:
+                        if teacher_data:
+                            yield teacher_data
+            except (OSError, BrokenProcessPool) as e:
+                print(f"Parallel schedule parsing unavailable ({e}). Parsing the remaining pages serially.")
+
+        for teacher_data, from_cache in _iter_page_range(doc, next_page, page_count, cache_dir, stage_seconds,
+                                                         layout_state, failed_pages):
+            report['pages'] += 1
+            report['reused'] += from_cache
+            if progress:
+                progress(report['pages'] + len(failed_pages), page_count)
+            if teacher_data:
+                yield teacher_data
     finally:
         doc.close()
-
-    return all_schedules
+        report['failed_pages'] = [{'page': page_num + 1, 'error': error} for page_num, error in failed_pages]
+        _finish_parse_report(report, stage_seconds, layout_state, cache_dir, cache_max_bytes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,368 @@
+import difflib
+import hashlib
+import json
+from collections import Counter
+
+from .substitution_logic import build_availability_index
+
+DAY_ORDER = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"] # Order activities are listed in
+
+# A removed and an added teacher this similar (in name or in timetable, from 0 to 1) are suggested as a rename
+RENAME_MIN_SIMILARITY = 0.8
+
+def _group_by_teacher(schedules_data):
+    """Returns {teacher name: [schedule records]}, in order of first appearance."""
+    grouped = {}
+    for teacher_info in schedules_data:
+        grouped.setdefault(teacher_info.get('teacher_name'), []).append(teacher_info)
+    return grouped
+
+def _teacher_digests(schedules_data):
+    """Returns {teacher name: (digest of their records, number of records)}, in order of first appearance."""
+    digests = {}
+    counts = {}
+    for teacher_info in schedules_data:
+        name = teacher_info.get('teacher_name')
+        if name not in digests:
+            digests[name] = hashlib.sha256()
+            counts[name] = 0
+        digests[name].update(json.dumps(teacher_info, sort_keys=True, ensure_ascii=False).encode('utf-8') + b'\n')
+        counts[name] += 1
+    return {name: (digest.digest(), counts[name]) for name, digest in digests.items()}
+
+def _activity_counts(records):
+    """Returns the (day, time, subject, type) of every activity of a teacher's records, with multiplicity."""
+    return Counter((day, activity.get('time'), activity.get('subject'), activity.get('type'))
+                   for teacher_info in records
+                   for day, day_schedule in (teacher_info.get('schedule') or {}).items()
+                   for activity in day_schedule or [])
+
+def _activity_list(activity_counts):
+    """Returns activities as dicts, in day and time order."""
+    day_position = {day: i for i, day in enumerate(DAY_ORDER)}
+    keys = sorted(activity_counts.elements(),
+                  key=lambda key: (day_position.get(key[0], len(DAY_ORDER)), str(key[0]), str(key[1]), str(key[2])))
+    return [{'day': day, 'time': time_slot, 'subject': subject, 'type': activity_type}
+            for day, time_slot, subject, activity_type in keys]
+
+def _similarity(old_name, old_activities, new_name, new_activities):
+    """How likely a removed teacher and an added one are the same person, from 0 to 1."""
+    name_similarity = difflib.SequenceMatcher(None, str(old_name).lower(), str(new_name).lower()).ratio()
+    total = max(sum(old_activities.values()), sum(new_activities.values()))
+    schedule_similarity = sum((old_activities & new_activities).values()) / total if total else 0.0
+    return max(name_similarity, schedule_similarity)
+
+def diff_schedules(current, incoming):
+    """
+    Compares the stored schedules with newly uploaded ones, teacher by teacher.
+
+    Args:
+        current (list): The stored teacher schedules.
+        incoming (iterable): The uploaded teacher schedules.
+
+    Returns:
+        dict: 'added' and 'removed' (lists of {'teacher_name', 'activities'}), 'changed'
+            (list of {'teacher_name', 'added', 'removed'}, the activities gained and lost),
+            'renamed' (suggested renames: list of {'old_name', 'new_name', 'similarity'},
+            pairing removed and added teachers with similar names or timetables) and
+            'unchanged' (number of teachers whose schedule is identical). Activities are
+            {'day', 'time', 'subject', 'type'} dicts.
+    """
+    current_by_name = _group_by_teacher(current)
+    incoming_by_name = _group_by_teacher(incoming)
+    diff = {'added': [], 'removed': [], 'changed': [], 'renamed': [], 'unchanged': 0}
+    added_activities = {}
+    for name, records in incoming_by_name.items():
+        current_records = current_by_name.get(name)
+        if current_records is None:
+            added_activities[name] = _activity_counts(records)
+            diff['added'].append({'teacher_name': name, 'activities': _activity_list(added_activities[name])})
+        elif current_records == records:
+            diff['unchanged'] += 1
+        else:
+            old_activities, new_activities = _activity_counts(current_records), _activity_counts(records)
+            diff['changed'].append({'teacher_name': name,
+                                    'added': _activity_list(new_activities - old_activities),
+                                    'removed': _activity_list(old_activities - new_activities)})
+    removed_activities = {}
+    for name, records in current_by_name.items():
+        if name not in incoming_by_name:
+            removed_activities[name] = _activity_counts(records)
+            diff['removed'].append({'teacher_name': name, 'activities': _activity_list(removed_activities[name])})
+
+    # Best pairs first; each teacher is paired at most once
+    candidates = sorted(((_similarity(old_name, old_activities, new_name, new_activities), old_name, new_name)
+                         for old_name, old_activities in removed_activities.items()
+                         for new_name, new_activities in added_activities.items()),
+                        key=lambda candidate: -candidate[0])
+    paired = set()
+    for similarity, old_name, new_name in candidates:
+        if similarity < RENAME_MIN_SIMILARITY:
+            break
+        if ('old', old_name) in paired or ('new', new_name) in paired:
+            continue
+        paired.update({('old', old_name), ('new', new_name)})
+        diff['renamed'].append({'old_name': old_name, 'new_name': new_name, 'similarity': round(similarity, 2)})
+    return diff
+
+def diff_schedules_streamed(current, incoming):
+    """
+    Like diff_schedules, for schedules read from files rather than held in memory.
+
+    A first pass over each side keeps only a digest of every teacher's records; a second
+    one reads the records of the teachers that differ. Memory then grows with the number
+    of teachers and the size of the changes, not with the size of the schedules.
+
+    Args:
+        current (iterable): The stored teacher schedules, iterated twice (e.g. data_manager.iter_schedules()).
+        incoming (iterable): The uploaded teacher schedules, iterated twice.
+
+    Returns:
+        dict: See diff_schedules.
+    """
+    current_digests = _teacher_digests(current)
+    unchanged = {name for name, digest in _teacher_digests(incoming).items() if current_digests.get(name) == digest}
+    diff = diff_schedules((t for t in current if t.get('teacher_name') not in unchanged),
+                          (t for t in incoming if t.get('teacher_name') not in unchanged))
+    diff['unchanged'] = len(unchanged)
+    return diff
+
+def merge_schedules(current, incoming, renames=None):
+    """
+    Applies uploaded schedules onto the stored ones, touching only the teachers that differ.
+
+    Teachers keep their place: a changed (or renamed) teacher's records are replaced where
+    they were, removed teachers are dropped and new ones are added at the end.
+
+    Args:
+        current (list): The stored teacher schedules.
+        incoming (iterable): The uploaded teacher schedules.
+        renames (dict, optional): Old names of removed teachers and the new names of the added
+            teachers they became. Other pairs are ignored.
+
+    Returns:
+        tuple: (merged schedules, changes), changes being a list of (old name, new name) pairs
+            for each teacher that differs: (name, None) for a removed teacher, (None, name) for
+            an added one, (old, new) for a rename and (name, name) for a changed schedule.
+    """
+    current_by_name = _group_by_teacher(current)
+    incoming_by_name = _group_by_teacher(incoming)
+    renames = {old_name: new_name for old_name, new_name in (renames or {}).items()
+               if old_name in current_by_name and old_name not in incoming_by_name
+               and new_name in incoming_by_name and new_name not in current_by_name}
+    merged = []
+    changes = []
+    placed = set()
+    for name, records in current_by_name.items():
+        new_name = renames.get(name, name)
+        new_records = incoming_by_name.get(new_name)
+        if new_records is None:
+            changes.append((name, None))
+            continue
+        if new_name != name or new_records != records or len(records) > 1:
+            changes.append((name, new_name))
+        merged.extend(new_records)
+        placed.add(new_name)
+    for name, records in incoming_by_name.items():
+        if name not in placed:
+            changes.append((None, name))
+            merged.extend(records)
+    return merged, changes
+
+def merge_schedules_streamed(current, incoming, renames=None):
+    """
+    Like merge_schedules, for schedules read from files rather than held in memory.
+
+    Only the uploaded records of the teachers that differ are kept in memory; the
+    others are passed through from current as the merged schedules are read.
+
+    Args:
+        current (iterable): The stored teacher schedules, iterated twice (e.g. data_manager.iter_schedules()).
+        incoming (iterable): The uploaded teacher schedules, iterated twice.
+        renames (dict, optional): See merge_schedules.
+
+    Returns:
+        tuple: (merged, changes). merged is a generator over the merged schedules, in the
+            order of merge_schedules, reading current once more; changes is as in merge_schedules.
+    """
+    current_digests = _teacher_digests(current)
+    incoming_digests = _teacher_digests(incoming)
+    renames = {old_name: new_name for old_name, new_name in (renames or {}).items()
+               if old_name in current_digests and old_name not in incoming_digests
+               and new_name in incoming_digests and new_name not in current_digests}
+    changes = []
+    placed = set()
+    for name, digest in current_digests.items():
+        new_name = renames.get(name, name)
+        if new_name not in incoming_digests:
+            changes.append((name, None))
+            continue
+        if new_name != name or incoming_digests[new_name] != digest or digest[1] > 1:
+            changes.append((name, new_name))
+        placed.add(new_name)
+    changes.extend((None, name) for name in incoming_digests if name not in placed)
+
+    changed_names = {new_name for _, new_name in changes if new_name is not None}
+    changed_records = {}
+    for teacher_info in incoming:
+        if teacher_info.get('teacher_name') in changed_names:
+            changed_records.setdefault(teacher_info.get('teacher_name'), []).append(teacher_info)
+
+    def merged():
+        seen = set()
+        for teacher_info in current:
+            name = teacher_info.get('teacher_name')
+            new_name = renames.get(name, name)
+            if new_name not in incoming_digests or name in seen:
+                continue # Removed, or already placed with the teacher's first record
+            seen.add(name)
+            if new_name in changed_records:
+                yield from changed_records[new_name]
+            else:
+                yield teacher_info
+        for old_name, new_name in changes:
+            if old_name is None:
+                yield from changed_records[new_name]
+    return merged(), changes
+
+def combine_uploaded_schedules(sources):
+    """
+    Combines the schedules parsed from several files of one upload into a single sequence.
+
+    A teacher found in more than one file keeps the records of the first file it appears
+    in. If another file has the same schedule for them it is a plain duplicate; if it has
+    a different one, that is reported as a conflict. Nothing is copied: the combined
+    schedules are read from sources as they are consumed (e.g. by data_manager.stage_schedules).
+
+    Args:
+        sources (list): (file name, teacher schedules) pairs, in upload order. Each file's
+            schedules are iterated twice.
+
+    Returns:
+        tuple: (schedules, conflicts, duplicates). schedules is a generator over the combined
+            teacher schedules, to be consumed once; conflicts is a list of {'teacher_name',
+            'kept' (file whose schedule is kept), 'dropped' (other files with a different
+            schedule)}; duplicates is the number of identical schedules dropped.
+    """
+    kept = {} # teacher name -> (position of the file in sources, records)
+    conflicts = {}
+    duplicates = 0
+    for position, (file_name, schedules) in enumerate(sources):
+        for name, records in _group_by_teacher(schedules).items():
+            if name not in kept:
+                kept[name] = (position, records)
+            elif records == kept[name][1]:
+                duplicates += 1
+            else:
+                conflict = conflicts.setdefault(name, {'teacher_name': name, 'kept': sources[kept[name][0]][0],
+                                                       'dropped': []})
+                conflict['dropped'].append(file_name)
+
+    def combined():
+        for position, (_, schedules) in enumerate(sources):
+            for name, records in _group_by_teacher(schedules).items():
+                if kept[name][0] == position:
+                    yield from records
+    return combined(), list(conflicts.values()), duplicates
+
+def update_availability_index(availability_index, merged, changes):
+    """
+    Updates an availability index for the teachers changed by merge_schedules.
+
+    Only the lists of the slots where a changed teacher was or is available are rewritten;
+    the result equals build_availability_index(merged).
+
+    Args:
+        availability_index (dict): Index of the schedules before the merge (not modified).
+        merged (iterable): The merged schedules, iterated twice.
+        changes (list): The changes returned by merge_schedules.
+
+    Returns:
+        dict: The updated index.
+    """
+    changed_names = {name for pair in changes for name in pair if name is not None}
+    position = {}
+    for i, teacher_info in enumerate(merged):
+        position.setdefault(teacher_info.get('teacher_name'), i)
+    updated = {}
+    for day, slots in availability_index.items():
+        for time_slot, teachers in slots.items():
+            if changed_names.isdisjoint(teachers):
+                updated.setdefault(day, {})[time_slot] = teachers
+            else:
+                kept = [name for name in teachers if name not in changed_names]
+                if kept:
+                    updated.setdefault(day, {})[time_slot] = kept
+    additions = build_availability_index([t for t in merged if t.get('teacher_name') in changed_names])
+    for day, slots in additions.items():
+        for time_slot, teachers in slots.items():
+            merged_teachers = list(updated.setdefault(day, {}).get(time_slot, [])) + teachers
+            merged_teachers.sort(key=position.get)
+            updated[day][time_slot] = merged_teachers
+    return updated
+
+def diff_summary(diff):
+    """Returns the number of added, removed, changed and renamed teachers of a diff, and the unchanged ones."""
+    return {'added': len(diff['added']), 'removed': len(diff['removed']), 'changed': len(diff['changed']),
+            'renamed': len(diff['renamed']), 'unchanged': diff['unchanged']}
+
+if __name__ == "__main__":
+    print("Testing schedule_diff.py...")
+
+    def teacher(name, *activities):
+        return {'teacher_name': name, 'schedule': {'Lunes': [
+            {'time': time_slot, 'subject': subject, 'type': activity_type}
+            for time_slot, subject, activity_type in activities]}}
+
+    current = [
+        teacher('Profesora Elena', ('08:00-09:00', 'Historia', 'clase'), ('09:00-10:00', 'GUARDIA', 'guardia')),
+        teacher('Profesor Davila', ('08:00-09:00', 'REFUERZO', 'refuerzo'), ('09:00-10:00', 'Lengua', 'clase')),
+        teacher('Profesora Sofia', ('08:00-09:00', 'GUARDIA', 'guardia'), ('09:00-10:00', 'REFUERZO', 'refuerzo')),
+        teacher('Profesor Bruno', ('08:00-09:00', 'Física', 'clase')),
+    ]
+    incoming = [
+        teacher('Profesor Bruno', ('08:00-09:00', 'Física', 'clase')),
+        teacher('Profesora Elena', ('08:00-09:00', 'GUARDIA', 'guardia'), ('09:00-10:00', 'GUARDIA', 'guardia')),
+        teacher('Profesora Sofía', ('08:00-09:00', 'GUARDIA', 'guardia'), ('09:00-10:00', 'REFUERZO', 'refuerzo')),
+        teacher('Profesor Nuevo', ('09:00-10:00', 'REFUERZO', 'refuerzo')),
+    ]
+    diff = diff_schedules(current, incoming)
+    print(f"Diff: {diff_summary(diff)}")
+    assert diff_summary(diff) == {'added': 2, 'removed': 2, 'changed': 1, 'renamed': 1, 'unchanged': 1}
+    assert diff['changed'][0]['added'] == [{'day': 'Lunes', 'time': '08:00-09:00', 'subject': 'GUARDIA', 'type': 'guardia'}]
+    assert diff['changed'][0]['removed'][0]['subject'] == 'Historia'
+    # The accent fix is suggested as a rename; Davila -> Nuevo are too different
+    assert [(r['old_name'], r['new_name']) for r in diff['renamed']] == [('Profesora Sofia', 'Profesora Sofía')]
+
+    merged, changes = merge_schedules(current, incoming, {'Profesora Sofia': 'Profesora Sofía'})
+    # Stored order is kept: changed and renamed teachers in place, new ones at the end
+    assert [t['teacher_name'] for t in merged] == ['Profesora Elena', 'Profesora Sofía', 'Profesor Bruno', 'Profesor Nuevo']
+    assert sorted(changes, key=str) == sorted([('Profesora Elena', 'Profesora Elena'), ('Profesor Davila', None),
+                                               ('Profesora Sofia', 'Profesora Sofía'), (None, 'Profesor Nuevo')], key=str)
+    assert update_availability_index(build_availability_index(current), merged, changes) == build_availability_index(merged)
+    # Renames that don't pair a removed teacher with an added one are ignored
+    merged, changes = merge_schedules(current, incoming, {'Profesora Elena': 'Profesor Nuevo'})
+    assert ('Profesora Elena', 'Profesora Elena') in changes and (None, 'Profesor Nuevo') in changes
+    assert update_availability_index(build_availability_index(current), merged, changes) == build_availability_index(merged)
+    # Identical uploads change nothing
+    assert merge_schedules(current, list(current)) == (current, [])
+
+    # The streamed variants give the same results, with teachers split over several records too
+    split_current = current + [teacher('Profesor Bruno', ('10:00-11:00', 'Física', 'clase'))]
+    assert diff_schedules_streamed(current, incoming) == diff_schedules(current, incoming)
+    assert diff_schedules_streamed(split_current, incoming) == diff_schedules(split_current, incoming)
+    for old, new, renames in [(current, incoming, {'Profesora Sofia': 'Profesora Sofía'}),
+                              (split_current, incoming, None), (current, list(current), None)]:
+        merged_stream, changes_stream = merge_schedules_streamed(old, new, renames)
+        assert (list(merged_stream), changes_stream) == merge_schedules(old, new, renames)
+
+    # One upload split across files: a teacher in two files keeps the first file's schedule
+    combined, conflicts, duplicates = combine_uploaded_schedules([
+        ('ciencias.pdf', [current[3], current[0]]),
+        ('letras.pdf', [incoming[1], current[1]]),
+        ('copia.pdf', [current[3]]),
+    ])
+    assert [t['teacher_name'] for t in combined] == ['Profesor Bruno', 'Profesora Elena', 'Profesor Davila']
+    assert conflicts == [{'teacher_name': 'Profesora Elena', 'kept': 'ciencias.pdf', 'dropped': ['letras.pdf']}]
+    assert duplicates == 1
+    print("\nSchedule diff tests completed.")
@@ -0,0 +1,331 @@
+import array
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from .substitution_logic import build_availability_index
+
+# File layout (all integers little-endian):
+#   header          _HEADER
+#   string offsets  u32 * (string_count + 1), into the string data
+#   string data     UTF-8, strings sorted so they can be found by binary search; padded to 4 bytes
+#   teachers        _RECORD * teacher_count         (name, first teacher-day, teacher-day count)
+#   teacher days    _RECORD * teacher_day_count     (day, first activity, activity count)
+#   activities      _RECORD * activity_count        (time slot, subject, type)
+#   availability    _RECORD * available_count       (day, time slot, teacher name), sorted by (day, slot)
+#   teacher names   u32 * name_count                distinct teacher names, sorted
+# Every string field is an index into the string table, or NO_STRING for a missing value.
+MAGIC = b'SUSTSNAP'
+FORMAT_VERSION = 1
+NO_STRING = 0xFFFFFFFF
+_HEADER = struct.Struct('<8sHHIqq7I')
+_RECORD = struct.Struct('<III')
+_U32 = struct.Struct('<I')
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is truncated, corrupt or of an unsupported version."""
+
+def _intern(strings, value):
+    return NO_STRING if value is None else strings.setdefault(value, len(strings))
+
+def _renumber(values, new_index, step=1):
+    """Maps the string indexes at every step-th position of values (in place) through new_index."""
+    for i in range(0, len(values), step):
+        if values[i] != NO_STRING:
+            values[i] = new_index[values[i]]
+
+def _write_u32(f, crc, values):
+    """Writes an array('I') as little-endian u32 and returns the CRC32 of the file body so far."""
+    if sys.byteorder != 'little':
+        values = array.array('I', values)
+        values.byteswap()
+    with memoryview(values) as view, view.cast('B') as data:
+        f.write(data)
+        return zlib.crc32(data, crc)
+
+def write_snapshot(schedules_data, snapshot_path, source_signature=(0, 0)):
+    """
+    Writes schedules as a binary snapshot, atomically (temporary file + rename).
+
+    The records are gathered as flat arrays of u32 (12 bytes per activity) and each
+    section is written out as it is, so the memory used is a small multiple of the
+    snapshot's size rather than of the parsed schedules.
+
+    Args:
+        schedules_data (iterable): Teacher schedules, iterated twice (e.g. data_manager.iter_schedules()).
+        snapshot_path (str): Path of the snapshot file.
+        source_signature (tuple, optional): (mtime_ns, size) of the JSON file the schedules were
+            saved to, used by readers to detect a snapshot older than the JSON.
+
+    Raises:
+        IOError: If the file can't be written.
+    """
+    strings = {}
+    # Flat _RECORD fields: (name, first day, day count), (day, first activity, activity count), (time, subject, type)
+    teachers, teacher_days, activities = array.array('I'), array.array('I'), array.array('I')
+    teacher_names = set()
+    for teacher_info in schedules_data:
+        schedule = teacher_info.get('schedule') or {}
+        if teacher_info.get('teacher_name'):
+            teacher_names.add(teacher_info['teacher_name'])
+        teachers.extend((_intern(strings, teacher_info.get('teacher_name')), len(teacher_days) // 3, len(schedule)))
+        for day, day_schedule in schedule.items():
+            day_schedule = day_schedule or []
+            teacher_days.extend((_intern(strings, day), len(activities) // 3, len(day_schedule)))
+            for activity in day_schedule:
+                activities.extend((_intern(strings, activity.get('time')), _intern(strings, activity.get('subject')),
+                                   _intern(strings, activity.get('type'))))
+    available = []
+    for day, slots in build_availability_index(schedules_data).items():
+        for time_slot, names in slots.items():
+            available.extend((_intern(strings, day), _intern(strings, time_slot), _intern(strings, name))
+                             for name in names)
+    teacher_names = sorted(teacher_names)
+    for name in teacher_names:
+        _intern(strings, name)
+
+    # Renumber the strings in sorted order, so lookups can binary-search the table
+    sorted_strings = sorted(strings, key=lambda s: s.encode('utf-8'))
+    new_index = array.array('I', bytes(4 * len(sorted_strings)))
+    for i, value in enumerate(sorted_strings):
+        new_index[strings[value]] = i
+    _renumber(teachers, new_index, 3)
+    _renumber(teacher_days, new_index, 3)
+    _renumber(activities, new_index)
+    # Stable sort: teachers of a slot keep their schedule order
+    available = sorted(((new_index[d], new_index[s], new_index[n]) for d, s, n in available), key=lambda r: r[:2])
+    available = array.array('I', (field for record in available for field in record))
+    name_indexes = array.array('I', (new_index[strings[name]] for name in teacher_names))
+
+    encoded = [s.encode('utf-8') for s in sorted_strings]
+    offsets = array.array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    string_data = b''.join(encoded)
+    string_data += b'\0' * (-len(string_data) % 4)
+
+    temp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(bytes(_HEADER.size)) # Written last, once the checksum of the body is known
+            checksum = _write_u32(f, 0, offsets)
+            f.write(string_data)
+            checksum = zlib.crc32(string_data, checksum)
+            for records in (teachers, teacher_days, activities, available, name_indexes):
+                checksum = _write_u32(f, checksum, records)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, checksum, source_signature[0], source_signature[1],
+                                 len(sorted_strings), len(string_data), len(teachers) // 3, len(teacher_days) // 3,
+                                 len(activities) // 3, len(available) // 3, len(name_indexes)))
+        os.replace(temp_path, snapshot_path)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class _Records:
+    """Read-only sequence view of fixed-width records in the mapped file, decoded on access."""
+
+    def __init__(self, buffer, offset, count, record_struct):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._struct = record_struct
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._struct.unpack_from(self._buffer, self._offset + i * self._struct.size)
+
+class ScheduleSnapshot:
+    """
+    A schedules snapshot mapped into memory.
+
+    Opening one only reads the header; strings and records are decoded when a
+    query touches them, so availability lookups don't deserialize every teacher.
+    """
+
+    def __init__(self, snapshot_path, verify_checksum=True):
+        """
+        Args:
+            snapshot_path (str): Path of the snapshot file.
+            verify_checksum (bool, optional): Whether to check the CRC32 of the whole file. Defaults to True.
+
+        Raises:
+            SnapshotError: If the file is not a valid snapshot of this format version.
+            OSError: If the file can't be opened.
+        """
+        with open(snapshot_path, 'rb') as f:
+            try:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # Empty file
+                raise SnapshotError(f"{snapshot_path} is empty")
+        if len(self._buffer) < _HEADER.size:
+            raise SnapshotError(f"{snapshot_path} is truncated")
+        (magic, version, _, checksum, mtime_ns, size, self._string_count, string_bytes, teacher_count,
+         teacher_day_count, activity_count, available_count, name_count) = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{snapshot_path} is not a schedules snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{snapshot_path} has format version {version}, expected {FORMAT_VERSION}")
+        self.source_signature = (mtime_ns, size)
+
+        offset = _HEADER.size
+        self._offsets = _Records(self._buffer, offset, self._string_count + 1, _U32)
+        offset += _U32.size * (self._string_count + 1)
+        self._strings_start = offset
+        offset += string_bytes
+        self._teachers = _Records(self._buffer, offset, teacher_count, _RECORD)
+        offset += _RECORD.size * teacher_count
+        self._teacher_days = _Records(self._buffer, offset, teacher_day_count, _RECORD)
+        offset += _RECORD.size * teacher_day_count
+        self._activities = _Records(self._buffer, offset, activity_count, _RECORD)
+        offset += _RECORD.size * activity_count
+        self._available = _Records(self._buffer, offset, available_count, _RECORD)
+        offset += _RECORD.size * available_count
+        self._names = _Records(self._buffer, offset, name_count, _U32)
+        offset += _U32.size * name_count
+        if len(self._buffer) != offset:
+            raise SnapshotError(f"{snapshot_path} has {len(self._buffer)} bytes, expected {offset}")
+        if verify_checksum:
+            with memoryview(self._buffer) as view: # Released at once, so the map can be closed
+                valid = zlib.crc32(view[_HEADER.size:]) == checksum
+            if not valid:
+                raise SnapshotError(f"{snapshot_path} failed its checksum")
+
+    def close(self):
+        self._buffer.close()
+
+    def _string(self, index):
+        if index == NO_STRING:
+            return None
+        start = self._offsets[index][0]
+        stop = self._offsets[index + 1][0]
+        return self._buffer[self._strings_start + start:self._strings_start + stop].decode('utf-8')
+
+    def _find_string(self, value):
+        """Returns the index of a string by binary search, or None if the snapshot doesn't contain it."""
+        target = value.encode('utf-8')
+        low, high = 0, self._string_count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._strings_start + self._offsets[middle][0]
+            candidate = self._buffer[start:self._strings_start + self._offsets[middle + 1][0]]
+            if candidate < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._string_count and self._string(low) == value:
+            return low
+        return None
+
+    def available_teachers(self, target_day_of_week, target_time_slot):
+        """
+        Returns the teachers on refuerzo/guardia in a slot, like find_available_teachers.
+
+        Args:
+            target_day_of_week (str): The day to check (e.g., "Lunes").
+            target_time_slot (str): The time slot to check (e.g., "08:00-09:00").
+
+        Returns:
+            list: Teacher names, in schedule order.
+        """
+        day = self._find_string(target_day_of_week)
+        time_slot = self._find_string(target_time_slot)
+        if day is None or time_slot is None:
+            return []
+        key = (day, time_slot)
+        low, high = 0, len(self._available)
+        while low < high:
+            middle = (low + high) // 2
+            if self._available[middle][:2] < key:
+                low = middle + 1
+            else:
+                high = middle
+        names = []
+        while low < len(self._available) and self._available[low][:2] == key:
+            names.append(self._string(self._available[low][2]))
+            low += 1
+        return names
+
+    def teacher_names(self):
+        """Returns the sorted, distinct names of the teachers."""
+        return [self._string(self._names[i][0]) for i in range(len(self._names))]
+
+    def schedules(self):
+        """
+        Decodes every teacher schedule.
+
+        Returns:
+            list: The schedules, equal to the ones the snapshot was written from.
+        """
+        strings = [self._string(i) for i in range(self._string_count)]
+        name_of = lambda index: None if index == NO_STRING else strings[index]
+        schedules_data = []
+        for t in range(len(self._teachers)):
+            name, first_day, day_count = self._teachers[t]
+            schedule = {}
+            for d in range(first_day, first_day + day_count):
+                day, first_activity, activity_count = self._teacher_days[d]
+                activities = []
+                for a in range(first_activity, first_activity + activity_count):
+                    # Missing values were written as NO_STRING and come back as missing keys
+                    activities.append({key: strings[index] for key, index in zip(('time', 'subject', 'type'),
+                                                                                 self._activities[a])
+                                       if index != NO_STRING})
+                schedule[name_of(day)] = activities
+            schedules_data.append({'teacher_name': name_of(name), 'schedule': schedule})
+        return schedules_data
+
+if __name__ == "__main__":
+    import tempfile
+    from .substitution_logic import find_available_teachers
+
+    print("Testing schedule_snapshot.py...")
+    sample_schedules_data = [
+        {'teacher_name': 'Profesor Davila', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'Matemáticas', 'type': 'clase'},
+                      {'time': '09:00-10:00', 'subject': 'GUARDIA', 'type': 'refuerzo'}],
+            'Martes': []}},
+        {'teacher_name': 'Profesora Elena', 'schedule': {
+            'Lunes': [{'time': '09:00-10:00', 'subject': 'REFUERZO', 'type': 'Refuerzo'},
+                      {'time': '09:00-10:00', 'subject': 'GUARDIA', 'type': 'guardia'}],
+            'Miércoles': [{'time': '10:00-11:00', 'subject': 'Guardia patio', 'type': 'guardia'}]}},
+        {'teacher_name': 'Profesora Sofía', 'schedule': {
+            'Lunes': [{'time': '09:00-10:00', 'subject': 'GUARDIA', 'type': 'guardia'}]}},
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_path = os.path.join(temp_dir, "horarios.snapshot")
+        write_snapshot(sample_schedules_data, snapshot_path, (123, 456))
+        snapshot = ScheduleSnapshot(snapshot_path)
+        assert snapshot.source_signature == (123, 456)
+        assert snapshot.schedules() == sample_schedules_data
+        assert snapshot.teacher_names() == ['Profesor Davila', 'Profesora Elena', 'Profesora Sofía']
+        for day in ['Lunes', 'Martes', 'Miércoles', 'Jueves']:
+            for time_slot in ['08:00-09:00', '09:00-10:00', '10:00-11:00']:
+                assert snapshot.available_teachers(day, time_slot) == \
+                    find_available_teachers(sample_schedules_data, day, time_slot), (day, time_slot)
+        print(f"Lunes 09:00-10:00: {snapshot.available_teachers('Lunes', '09:00-10:00')}")
+        print(f"Snapshot size: {os.path.getsize(snapshot_path)} bytes")
+        snapshot.close()
+
+        # A flipped byte is caught by the checksum
+        with open(snapshot_path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        try:
+            ScheduleSnapshot(snapshot_path)
+            raise AssertionError("Corrupt snapshot accepted")
+        except SnapshotError as e:
+            print(f"Corrupt snapshot rejected: {e}")
+
+    print("\nSchedule snapshot tests completed.")
@@ -0,0 +1,318 @@
+import json
+import sqlite3
+import threading
+
+from .substitution_logic import AVAILABLE_ACTIVITY_TYPES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS teachers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- order of the teacher in the uploaded schedules
+    days TEXT NOT NULL          -- JSON list of the schedule's day keys, including days without activities
+);
+CREATE INDEX IF NOT EXISTS idx_teachers_name ON teachers (name);
+
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY,
+    teacher_id INTEGER NOT NULL REFERENCES teachers (id) ON DELETE CASCADE,
+    day TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- order of the activity within the day
+    time_slot TEXT,
+    subject TEXT,
+    type TEXT,
+    type_key TEXT               -- lower-cased type, used for availability lookups
+);
+CREATE INDEX IF NOT EXISTS idx_activities_lookup ON activities (day, time_slot, type_key);
+CREATE INDEX IF NOT EXISTS idx_activities_teacher ON activities (teacher_id);
+
+-- Counts are keyed by name: they outlive schedule uploads, which replace the teachers table
+CREATE TABLE IF NOT EXISTS substitution_counts (
+    teacher_name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+
+-- End of the event log (in bytes) whose substitutions the counts include, written together with them
+CREATE TABLE IF NOT EXISTS counted_log (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    log_offset INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+
+def connect(db_path):
+    """
+    Returns this thread's connection to the database, opening it on first use.
+
+    Connections run in WAL mode so page views can read while a confirmation or
+    an upload is writing.
+
+    Args:
+        db_path (str): Path of the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: An open connection with the schema in place.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+def save_schedules(conn, schedules_data, min_count=0):
+    """
+    Replaces all stored schedules in a single transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        schedules_data (iterable): Teacher schedules; read once, so it can be a generator.
+        min_count (int, optional): With fewer teachers than this, the transaction is rolled
+            back and the stored schedules are kept.
+
+    Returns:
+        int: The number of teachers read from schedules_data.
+    """
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM activities")
+        conn.execute("DELETE FROM teachers")
+        for position, teacher_info in enumerate(schedules_data):
+            count += 1
+            _insert_teacher(conn, teacher_info, position)
+        if count < min_count:
+            conn.rollback()
+    return count
+
+def _insert_teacher(conn, teacher_info, position):
+    """Inserts one teacher schedule and its activities. Call inside a transaction."""
+    schedule = teacher_info.get('schedule') or {}
+    cursor = conn.execute(
+        "INSERT INTO teachers (name, position, days) VALUES (?, ?, ?)",
+        (teacher_info.get('teacher_name'), position, json.dumps(list(schedule), ensure_ascii=False)))
+    teacher_id = cursor.lastrowid
+    conn.executemany(
+        "INSERT INTO activities (teacher_id, day, position, time_slot, subject, type, type_key) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(teacher_id, day, activity_position, activity.get('time'), activity.get('subject'),
+          activity.get('type'), activity.get('type', '').lower())
+         for day, day_schedule in schedule.items()
+         for activity_position, activity in enumerate(day_schedule or [])])
+
+def update_teachers(conn, changes, schedules_data):
+    """
+    Applies per-teacher changes in a single transaction, leaving the other teachers' rows alone.
+
+    A changed or renamed teacher takes the place of the old rows, so the order of
+    load_schedules matches schedule_diff.merge_schedules; added teachers go last.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        changes (list): (old name, new name) pairs, as returned by schedule_diff.merge_schedules.
+        schedules_data (iterable): The merged schedules, holding the new records of the changed
+            teachers; read once, and only those records are kept.
+    """
+    changed_names = {new_name for _, new_name in changes if new_name is not None}
+    records_by_name = {}
+    for teacher_info in schedules_data:
+        if teacher_info.get('teacher_name') in changed_names:
+            records_by_name.setdefault(teacher_info.get('teacher_name'), []).append(teacher_info)
+    with conn:
+        next_position = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM teachers").fetchone()[0]
+        for old_name, new_name in changes:
+            position = None
+            if old_name is not None:
+                position = conn.execute("SELECT MIN(position) FROM teachers WHERE name = ?", (old_name,)).fetchone()[0]
+                conn.execute("DELETE FROM teachers WHERE name = ?", (old_name,)) # Activities go with ON DELETE CASCADE
+            if new_name is None:
+                continue
+            if position is None:
+                position, next_position = next_position, next_position + 1
+            for teacher_info in records_by_name.get(new_name, []):
+                _insert_teacher(conn, teacher_info, position)
+
+def rename_substitution_counts(conn, renames):
+    """
+    Moves the substitution counts of renamed teachers to their new names, in a single transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        renames (dict): Old and new teacher names.
+    """
+    with conn:
+        for old_name, new_name in renames.items():
+            row = conn.execute("SELECT count FROM substitution_counts WHERE teacher_name = ?", (old_name,)).fetchone()
+            if row is None:
+                continue
+            conn.execute("DELETE FROM substitution_counts WHERE teacher_name = ?", (old_name,))
+            conn.execute("INSERT INTO substitution_counts (teacher_name, count) VALUES (?, ?) "
+                         "ON CONFLICT (teacher_name) DO UPDATE SET count = count + excluded.count",
+                         (new_name, row[0]))
+
+def load_schedules(conn):
+    """
+    Rebuilds the list of teacher schedules, in the same shape (and order) they were saved in.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        list: The teacher schedules.
+    """
+    schedules_data = []
+    schedules_by_id = {}
+    for teacher_id, name, days in conn.execute("SELECT id, name, days FROM teachers ORDER BY position"):
+        teacher_info = {'teacher_name': name, 'schedule': {day: [] for day in json.loads(days)}}
+        schedules_by_id[teacher_id] = teacher_info
+        schedules_data.append(teacher_info)
+
+    for teacher_id, day, time_slot, subject, activity_type in conn.execute(
+            "SELECT teacher_id, day, time_slot, subject, type FROM activities ORDER BY teacher_id, day, position"):
+        schedules_by_id[teacher_id]['schedule'][day].append(
+            {'time': time_slot, 'subject': subject, 'type': activity_type})
+    return schedules_data
+
+def load_teacher_names(conn):
+    """
+    Returns the sorted, distinct names of the teachers with a stored schedule.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        list: Teacher names.
+    """
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT name FROM teachers WHERE name IS NOT NULL AND name != '' ORDER BY name")]
+
+def find_available_teachers(conn, target_day_of_week, target_time_slot):
+    """
+    Finds the teachers on 'refuerzo' or 'guardia' for a time slot using the (day, slot, type) index.
+
+    Returns the same names, in the same order, as substitution_logic.find_available_teachers.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        target_day_of_week (str): The day to check (e.g., "Lunes").
+        target_time_slot (str): The time slot to check (e.g., "08:00-09:00").
+
+    Returns:
+        list: A list of teacher names who are available.
+    """
+    placeholders = ", ".join("?" for _ in AVAILABLE_ACTIVITY_TYPES)
+    return [row[0] for row in conn.execute(
+        "SELECT t.name FROM activities a JOIN teachers t ON t.id = a.teacher_id "
+        f"WHERE a.day = ? AND a.time_slot = ? AND a.type_key IN ({placeholders}) "
+        "AND t.name IS NOT NULL AND t.name != '' "
+        "GROUP BY t.id ORDER BY t.position",
+        (target_day_of_week, target_time_slot, *AVAILABLE_ACTIVITY_TYPES))]
+
+def load_substitution_counts(conn):
+    """
+    Returns the substitution count of every teacher.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        dict: Teacher names and their substitution counts.
+    """
+    return dict(conn.execute("SELECT teacher_name, count FROM substitution_counts ORDER BY rowid"))
+
+def load_substitution_counts_at_log_offset(conn):
+    """
+    Returns the substitution counts and the end of the event log they include, from one read transaction.
+
+    In WAL mode the reads see a single committed state without blocking writers, so
+    both values come from the same increment_substitution_counts.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        tuple: (teacher names and their substitution counts, log offset in bytes or None
+               if no offset was stored with the counts yet).
+    """
+    conn.execute("BEGIN")
+    try:
+        counts = load_substitution_counts(conn)
+        row = conn.execute("SELECT log_offset FROM counted_log WHERE id = 1").fetchone()
+    finally:
+        conn.commit()
+    return counts, row[0] if row else None
+
+def _set_counted_log_offset(conn, log_offset):
+    """Records the end of the event log the counts include. Call inside a transaction."""
+    conn.execute("INSERT INTO counted_log (id, log_offset) VALUES (1, ?) "
+                 "ON CONFLICT (id) DO UPDATE SET log_offset = excluded.log_offset", (log_offset,))
+
+def save_substitution_counts(conn, counts_data, log_offset=None):
+    """
+    Replaces all stored substitution counts in a single transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        counts_data (dict): Teacher names and their substitution counts.
+        log_offset (int, optional): End of the event log that counts_data includes.
+    """
+    with conn:
+        conn.execute("DELETE FROM substitution_counts")
+        conn.executemany("INSERT INTO substitution_counts (teacher_name, count) VALUES (?, ?)",
+                         counts_data.items())
+        if log_offset is not None:
+            _set_counted_log_offset(conn, log_offset)
+
+def increment_substitution_counts(conn, increments, log_offset=None):
+    """
+    Atomically adds to the substitution counts of one or more teachers.
+
+    Each teacher is updated with a single UPSERT statement, and all of them are
+    committed together, so concurrent confirmations never lose increments.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        increments (dict): Teacher names and the amount to add to their counts.
+        log_offset (int, optional): End of the event log once the substitutions
+            behind increments were appended to it, stored in the same transaction.
+    """
+    with conn:
+        conn.executemany(
+            "INSERT INTO substitution_counts (teacher_name, count) VALUES (?, ?) "
+            "ON CONFLICT (teacher_name) DO UPDATE SET count = count + excluded.count",
+            increments.items())
+        if log_offset is not None:
+            _set_counted_log_offset(conn, log_offset)
+
+def migrate_from_json(conn, schedules_data, counts_data, log_offset=None):
+    """
+    Copies schedules and counts loaded from the JSON files into the database, replacing its contents.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        schedules_data (list): A list of teacher schedules.
+        counts_data (dict): Teacher names and their substitution counts.
+        log_offset (int, optional): End of the event log that counts_data includes.
+    """
+    save_schedules(conn, schedules_data)
+    save_substitution_counts(conn, counts_data, log_offset)
+
+if __name__ == "__main__":
+    import os
+    import sys
+    from . import data_manager
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python -m sustituciones_app.sqlite_store migrate")
+        print(f"Copies the JSON schedules and counts in {data_manager.DATA_DIR} into {data_manager.DB_FILE_NAME}.")
+        sys.exit(1)
+
+    schedules, counts = data_manager.migrate_json_to_sqlite()
+    print(f"Migrated {schedules} schedules and {counts} substitution counts to "
+          f"{os.path.join(data_manager.DATA_DIR, data_manager.DB_FILE_NAME)}.")
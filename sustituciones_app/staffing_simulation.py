@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .coverage import CODE_CLASS, CODE_OTHER, ACTIVITY_CODES, build_coverage_matrix
+from .substitution_logic import AVAILABLE_ACTIVITY_TYPES
+
+DEFAULT_ABSENCE_PROBABILITY = 0.05 # Chance that a teacher misses a given school day
+# Weeks simulated per task. Fixed, so a seed gives the same results whatever the number of workers.
+CHUNK_WEEKS = 2000
+
+class StaffingModel:
+    """
+    The timetable and absence rates in the array form the simulation works on.
+
+    Teachers are sorted by name, so the lowest index among equal counts is the teacher
+    select_teacher_for_substitution would pick.
+
+    Attributes:
+        teachers (list): Teacher names, sorted.
+        days (list): Day names.
+        slots (list): Time slots, sorted.
+        available (numpy.ndarray): bool array (teachers, days, slots): on refuerzo/guardia.
+        needs_cover (numpy.ndarray): bool array (teachers, days, slots): a class (or any other
+            activity that isn't refuerzo/guardia) that needs a substitute if the teacher is absent.
+        probabilities (numpy.ndarray): Daily absence probability of each teacher.
+        baseline_counts (numpy.ndarray): Substitution counts each simulated week starts from.
+    """
+
+    def __init__(self, schedules_data, absence_probabilities=None,
+                 default_probability=DEFAULT_ABSENCE_PROBABILITY, substitution_counts=None):
+        absence_probabilities = absence_probabilities or {}
+        substitution_counts = substitution_counts or {}
+        matrix = build_coverage_matrix(schedules_data)
+        order = sorted(range(len(matrix.teachers)), key=lambda i: matrix.teachers[i])
+        codes = matrix.codes[order]
+        self.teachers = [matrix.teachers[i] for i in order]
+        self.days = matrix.days
+        self.slots = matrix.slots
+        self.available = np.isin(codes, [ACTIVITY_CODES[t] for t in AVAILABLE_ACTIVITY_TYPES])
+        self.needs_cover = (codes == CODE_CLASS) | (codes == CODE_OTHER)
+        self.probabilities = np.array([absence_probabilities.get(name, default_probability)
+                                       for name in self.teachers], dtype=np.float64)
+        if ((self.probabilities < 0) | (self.probabilities > 1)).any():
+            raise ValueError("Absence probabilities must be between 0 and 1.")
+        self.baseline_counts = np.array([substitution_counts.get(name, 0) for name in self.teachers],
+                                        dtype=np.int64)
+
+def _simulate(model, absent_on_day, weeks):
+    """
+    Runs the assignment policy of the app over a batch of weeks at once.
+
+    In every slot of every day, each class of an absent teacher gets, in turn, the
+    teacher on refuerzo/guardia there with the fewest substitutions so far (stored
+    count plus those of this week, then name), as find_available_teachers and
+    select_teacher_for_substitution do, leaving out absent teachers and substitutes
+    already covering a class in that slot. Since a chosen teacher can't be chosen
+    again in the same slot, the n classes of a slot go to the n lowest (count, name)
+    teachers, which is what is computed, for all weeks together.
+
+    Args:
+        model (StaffingModel): The timetable.
+        absent_on_day (callable): absent_on_day(day index) -> bool array (teachers, weeks).
+        weeks (int): Number of weeks in the batch.
+
+    Returns:
+        dict: Sums over the batch (see _merge_totals).
+    """
+    teacher_count = len(model.teachers)
+    shape = (len(model.days), len(model.slots))
+    # Substitutions done this week. One row per teacher, so a slot's guards are a block of rows.
+    loads = np.zeros((teacher_count, weeks), dtype=np.int64)
+    classes = np.zeros(shape, dtype=np.int64)
+    uncovered_classes = np.zeros(shape, dtype=np.int64)
+    uncovered_weeks = np.zeros(shape, dtype=np.int64)
+    unused = np.iinfo(np.int64).max
+    for d in range(len(model.days)):
+        absent = absent_on_day(d)
+        # Classes to cover in every slot of the day, for all weeks: one matrix product
+        needed_today = (model.needs_cover[:, d, :].T.astype(np.float32) @ absent.astype(np.float32)).astype(np.int64)
+        for s in range(len(model.slots)):
+            needed = needed_today[s]
+            if not needed.any():
+                continue
+            classes[d, s] = needed.sum()
+            guards = np.flatnonzero(model.available[:, d, s])
+            free = ~absent[guards]
+            assigned = np.minimum(needed, free.sum(axis=0))
+            if guards.size:
+                # (count, name) as one integer per teacher; absent teachers sort last
+                keys = np.where(free, (model.baseline_counts[guards, None] + loads[guards]) * teacher_count
+                                + guards[:, None], unused)
+                # Keys are unique, so the teachers up to the assigned-th smallest key are the chosen ones
+                threshold = np.sort(keys, axis=0)[np.maximum(assigned - 1, 0), np.arange(weeks)]
+                loads[guards] += (keys <= threshold) & free & (assigned > 0)
+            short = needed - assigned
+            uncovered_classes[d, s] = short.sum()
+            uncovered_weeks[d, s] = np.count_nonzero(short)
+
+    can_cover = model.available.any(axis=(1, 2))
+    spread = 0
+    if can_cover.any():
+        covering_loads = loads[can_cover]
+        spread = int((covering_loads.max(axis=0) - covering_loads.min(axis=0)).sum())
+    return {
+        'weeks': weeks,
+        'classes': classes,
+        'uncovered_classes': uncovered_classes,
+        'uncovered_weeks': uncovered_weeks,
+        'load_sum': loads.sum(axis=1),
+        'load_square_sum': (loads * loads).sum(axis=1),
+        'spread_sum': spread,
+    }
+
+def _simulate_chunk(model, weeks, seed_sequence):
+    """Samples the absences of a batch of weeks and simulates them. Runs inside a worker process."""
+    rng = np.random.default_rng(seed_sequence)
+
+    def absent_on_day(d):
+        return rng.random((len(model.teachers), weeks), dtype=np.float32) < model.probabilities[:, None]
+
+    return _simulate(model, absent_on_day, weeks)
+
+def _merge_totals(totals, chunk_totals):
+    """Adds the sums of one batch of weeks to the running totals."""
+    if totals is None:
+        return dict(chunk_totals)
+    return {key: totals[key] + value for key, value in chunk_totals.items()}
+
+def simulate_staffing(schedules_data, absence_probabilities=None, weeks=10000, seed=None,
+                      default_probability=DEFAULT_ABSENCE_PROBABILITY, substitution_counts=None, workers=None):
+    """
+    Estimates how well the refuerzo/guardia rota covers absences, by simulating school weeks.
+
+    Each teacher misses each day independently with their absence probability, and the
+    classes they miss are assigned as the app would assign them (see _simulate).
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+        absence_probabilities (dict, optional): Teacher names and their daily absence probability.
+        weeks (int, optional): Weeks to simulate. Defaults to 10000.
+        seed (int, optional): Seed of the random absences; the same seed and weeks give the same
+            results, with or without workers. None picks one (reported in the results).
+        default_probability (float, optional): Probability of teachers not in absence_probabilities.
+        substitution_counts (dict, optional): Counts every week starts from, e.g. the stored ones.
+        workers (int, optional): Worker processes sharing the weeks. None or 1 runs in this process.
+
+    Returns:
+        dict: 'weeks', 'seed', 'slots' (per day and slot with classes: 'day', 'time',
+            'uncovered_probability' (share of weeks with a class left without substitute),
+            'expected_classes' and 'expected_uncovered' (per week)), 'teachers' (per teacher who
+            can cover: 'teacher_name', 'mean_substitutions' and 'std_substitutions' per week) and
+            'mean_load_spread' (average, per week, of the difference between the most and the
+            least loaded of those teachers).
+
+    Raises:
+        ValueError: If a probability is not between 0 and 1, or weeks is not positive.
+    """
+    if weeks <= 0:
+        raise ValueError("The number of weeks must be positive.")
+    model = StaffingModel(schedules_data, absence_probabilities, default_probability, substitution_counts)
+    seed_sequence = np.random.SeedSequence(seed)
+    chunk_sizes = [min(CHUNK_WEEKS, weeks - start) for start in range(0, weeks, CHUNK_WEEKS)]
+    chunk_seeds = seed_sequence.spawn(len(chunk_sizes))
+
+    totals = None
+    if workers and workers > 1 and len(chunk_sizes) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunk_sizes))) as executor:
+                for chunk_totals in executor.map(_simulate_chunk, [model] * len(chunk_sizes), chunk_sizes,
+                                                 chunk_seeds):
+                    totals = _merge_totals(totals, chunk_totals)
+        except (OSError, BrokenProcessPool) as e:
+            print(f"Parallel simulation unavailable ({e}). Simulating serially.")
+            totals = None
+    if totals is None:
+        for chunk_size, chunk_seed in zip(chunk_sizes, chunk_seeds):
+            totals = _merge_totals(totals, _simulate_chunk(model, chunk_size, chunk_seed))
+    return _summarize(model, totals, seed_sequence.entropy)
+
+def _summarize(model, totals, seed):
+    """Turns the sums of the simulated weeks into per-week figures."""
+    weeks = totals['weeks']
+    slots = []
+    for d, day in enumerate(model.days):
+        for s, time_slot in enumerate(model.slots):
+            if not model.needs_cover[:, d, s].any():
+                continue
+            slots.append({
+                'day': day,
+                'time': time_slot,
+                'uncovered_probability': totals['uncovered_weeks'][d, s] / weeks,
+                'expected_classes': totals['classes'][d, s] / weeks,
+                'expected_uncovered': totals['uncovered_classes'][d, s] / weeks,
+            })
+    mean = totals['load_sum'] / weeks
+    std = np.sqrt(np.maximum(totals['load_square_sum'] / weeks - mean * mean, 0))
+    can_cover = model.available.any(axis=(1, 2))
+    teachers = [{'teacher_name': name, 'mean_substitutions': float(mean[i]), 'std_substitutions': float(std[i])}
+                for i, name in enumerate(model.teachers) if can_cover[i]]
+    return {
+        'weeks': weeks,
+        'seed': seed,
+        'slots': slots,
+        'teachers': teachers,
+        'mean_load_spread': totals['spread_sum'] / weeks,
+    }
+
+def format_results(results, top=10):
+    """Returns simulation results as text: the riskiest slots and the load of each teacher."""
+    lines = [f"{results['weeks']} weeks simulated (seed {results['seed']})", "Slots most often left uncovered:"]
+    for slot in sorted(results['slots'], key=lambda slot: -slot['uncovered_probability'])[:top]:
+        lines.append(f"  {slot['day']:<10} {slot['time']:<12} {slot['uncovered_probability']:6.1%} of weeks, "
+                     f"{slot['expected_uncovered']:.2f} of {slot['expected_classes']:.2f} classes per week")
+    lines.append(f"Substitutions per week (spread between most and least loaded: {results['mean_load_spread']:.2f}):")
+    for teacher in sorted(results['teachers'], key=lambda teacher: -teacher['mean_substitutions']):
+        lines.append(f"  {teacher['teacher_name']:<30} {teacher['mean_substitutions']:.2f} "
+                     f"± {teacher['std_substitutions']:.2f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    from . import data_manager
+
+    parser = argparse.ArgumentParser(description="Simulates school weeks of absences against the stored schedules.")
+    parser.add_argument('--weeks', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--probability', type=float, default=DEFAULT_ABSENCE_PROBABILITY,
+                        help="Daily absence probability of every teacher.")
+    parser.add_argument('--probabilities', default=None,
+                        help="JSON file of teacher names and their own daily absence probability.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--conjunto', default=None, help="Schedule set ('school/term'); the default data if omitted.")
+    args = parser.parse_args(argv)
+
+    absence_probabilities = None
+    if args.probabilities:
+        with open(args.probabilities, 'r', encoding='utf-8') as f:
+            absence_probabilities = json.load(f)
+    with data_manager.schedule_set(args.conjunto):
+        schedules = data_manager.load_schedules()
+        counts = data_manager.load_substitution_counts()
+    results = simulate_staffing(schedules, absence_probabilities, args.weeks, args.seed, args.probability,
+                                counts, args.workers)
+    print(format_results(results))
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:]:
+        # python -m sustituciones_app.staffing_simulation --weeks 100000 --seed 1 ...
+        main()
+        sys.exit(0)
+
+    from .substitution_logic import find_available_teachers, select_teacher_for_substitution
+
+    print("Testing staffing_simulation.py...")
+    sample_schedules_data = [
+        {'teacher_name': 'Profesora Elena', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'Historia', 'type': 'clase'},
+                      {'time': '09:00-10:00', 'subject': 'GUARDIA', 'type': 'guardia'}]}},
+        {'teacher_name': 'Profesor Davila', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'Matemáticas', 'type': 'clase'},
+                      {'time': '09:00-10:00', 'subject': 'Lengua', 'type': 'clase'}]}},
+        {'teacher_name': 'Profesora Sofia', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'GUARDIA', 'type': 'guardia'},
+                      {'time': '09:00-10:00', 'subject': 'REFUERZO', 'type': 'refuerzo'}]}},
+        {'teacher_name': 'Profesor Bruno', 'schedule': {
+            'Lunes': [{'time': '08:00-09:00', 'subject': 'REFUERZO', 'type': 'refuerzo'},
+                      {'time': '09:00-10:00', 'subject': 'Física', 'type': 'clase'}]}},
+    ]
+    counts = {'Profesor Bruno': 1}
+    model = StaffingModel(sample_schedules_data, substitution_counts=counts)
+    assert model.teachers == sorted(t['teacher_name'] for t in sample_schedules_data)
+
+    # Same assignments as the app's policy, week by week, for random absences
+    rng = np.random.default_rng(7)
+    weeks = 300
+    absent = rng.random((weeks, len(model.days), len(model.teachers))) < 0.4
+    totals = _simulate(model, lambda d: absent[:, d, :].T, weeks)
+    expected_loads = np.zeros((weeks, len(model.teachers)), dtype=np.int64)
+    expected_uncovered = np.zeros((len(model.days), len(model.slots)), dtype=np.int64)
+    for week in range(weeks):
+        week_counts = dict(counts)
+        for d, day in enumerate(model.days):
+            absent_today = {name for i, name in enumerate(model.teachers) if absent[week, d, i]}
+            for s, time_slot in enumerate(model.slots):
+                booked = set()
+                for i, name in enumerate(model.teachers):
+                    if name not in absent_today or not model.needs_cover[i, d, s]:
+                        continue
+                    candidates = [t for t in find_available_teachers(sample_schedules_data, day, time_slot)
+                                  if t not in absent_today and t not in booked]
+                    substitute = select_teacher_for_substitution(candidates, week_counts)
+                    if substitute is None:
+                        expected_uncovered[d, s] += 1
+                        continue
+                    booked.add(substitute)
+                    week_counts[substitute] = week_counts.get(substitute, 0) + 1
+                    expected_loads[week, model.teachers.index(substitute)] += 1
+    assert (totals['uncovered_classes'] == expected_uncovered).all()
+    assert (totals['load_sum'] == expected_loads.sum(axis=0)).all()
+    assert (totals['load_square_sum'] == (expected_loads ** 2).sum(axis=0)).all()
+
+    # Reproducible with a seed, with or without worker processes
+    results = simulate_staffing(sample_schedules_data, {'Profesor Davila': 0.2}, weeks=5000, seed=11,
+                                default_probability=0.1)
+    print(format_results(results))
+    assert results == simulate_staffing(sample_schedules_data, {'Profesor Davila': 0.2}, weeks=5000, seed=11,
+                                        default_probability=0.1, workers=2)
+    lunes_8 = next(slot for slot in results['slots'] if (slot['day'], slot['time']) == ('Lunes', '08:00-09:00'))
+    # Elena and Davila teach at 8:00; both covers (Sofia, Bruno) would have to be absent too
+    assert 0 < lunes_8['uncovered_probability'] < 0.1
+    assert abs(lunes_8['expected_classes'] - 0.3) < 0.02
+    try:
+        simulate_staffing(sample_schedules_data, {'Profesor Davila': 1.5})
+        raise AssertionError("Invalid probability accepted")
+    except ValueError:
+        pass
+    print("\nStaffing simulation tests completed.")
@@ -0,0 +1,88 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+# Libraries that create_app() must not load; they are imported by the first request that needs them
+LAZY_MODULES = ('fitz', 'pymupdf', 'numpy')
+
+_IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)$')
+
+def measure_imports(module="sustituciones_app.app"):
+    """
+    Measures the import cost of a module, in a fresh interpreter (python -X importtime).
+
+    Args:
+        module (str, optional): The module to import. Defaults to the app.
+
+    Returns:
+        dict: Seconds spent importing each package (each of our modules on its own), counting
+            only the module's own code, not what it imports in turn. 'total' is the whole import.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    seconds = {'total': 0.0}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, name = match.groups()
+        # Our modules are listed one by one; libraries are grouped by top-level package
+        group = name if name.startswith('sustituciones_app.') else name.split('.')[0]
+        seconds[group] = seconds.get(group, 0.0) + int(self_us) / 1e6
+        if name == module:
+            seconds['total'] = int(cumulative_us) / 1e6
+    return seconds
+
+def startup_report(config=None):
+    """
+    Measures what starting a worker costs: importing the app, then each step of create_app().
+
+    Args:
+        config (dict, optional): Settings passed to create_app (e.g. {'PREWARM_CACHES': True}).
+
+    Returns:
+        dict: 'imports' (see measure_imports), 'init' (seconds of each create_app step, see
+            app.config['STARTUP_SECONDS']) and 'loaded_lazy_modules' (any of LAZY_MODULES that
+            importing and creating the app loaded anyway; it should be empty).
+    """
+    imports = measure_imports()
+    from .app import create_app
+    started = time.perf_counter()
+    app = create_app(config)
+    init = dict(app.config['STARTUP_SECONDS'], total=time.perf_counter() - started)
+    return {
+        'imports': imports,
+        'init': init,
+        'loaded_lazy_modules': [name for name in LAZY_MODULES if name in sys.modules],
+    }
+
+def format_report(report, top=15):
+    """Returns a startup report as text, with the top most expensive imports."""
+    imports = dict(report['imports'])
+    total = imports.pop('total')
+    lines = [f"Import of the app: {total * 1000:.1f} ms"]
+    ranked = sorted(imports.items(), key=lambda item: -item[1])
+    for name, seconds in ranked[:top]:
+        lines.append(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    if len(ranked) > top:
+        lines.append(f"  {f'({len(ranked) - top} more)':<40} {sum(s for _, s in ranked[top:]) * 1000:8.1f} ms")
+    init = dict(report['init'])
+    lines.append(f"create_app(): {init.pop('total') * 1000:.1f} ms")
+    for step, seconds in init.items():
+        lines.append(f"  {step:<40} {seconds * 1000:8.1f} ms")
+    loaded = report['loaded_lazy_modules']
+    lines.append("Loaded on first use: " + ", ".join(LAZY_MODULES) if not loaded
+                 else "Loaded at startup although only needed later: " + ", ".join(loaded))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports the import and initialization cost of a worker.")
+    parser.add_argument('--prewarm', action='store_true', help="Also load the data caches, as PREWARM_CACHES does.")
+    parser.add_argument('--top', type=int, default=15, help="Imports listed one by one.")
+    args = parser.parse_args(argv)
+    print(format_report(startup_report({'PREWARM_CACHES': True} if args.prewarm else None), args.top))
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,43 @@
 # For now, the main functions will receive data as arguments.
 # from .data_manager import load_schedules, load_substitution_counts
 
-def find_available_teachers(schedules_data, target_day_of_week, target_time_slot):
+AVAILABLE_ACTIVITY_TYPES = ('refuerzo', 'guardia')
+
+def build_availability_index(schedules_data):
+    """
+    Builds a lookup of available teachers for every (day, time slot) pair.
+
+    The index contains the same teachers, in the same order, that
+    find_available_teachers would return for each pair, so a lookup replaces
+    a full scan of the schedules.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+
+    Returns:
+        dict: Nested dict {day: {time_slot: [teacher names]}}.
+    """
+    availability_index = {}
+    for teacher_info in schedules_data:
+        teacher_name = teacher_info.get('teacher_name')
+        schedule = teacher_info.get('schedule')
+        if not teacher_name or not schedule:
+            continue
+
+        for day, day_schedule in schedule.items():
+            if not day_schedule:
+                continue
+            seen_slots = set() # A teacher is listed once per slot, as in the full scan
+            for activity in day_schedule:
+                time_slot = activity.get('time')
+                if time_slot is None or time_slot in seen_slots:
+                    continue
+                if activity.get('type', '').lower() in AVAILABLE_ACTIVITY_TYPES:
+                    seen_slots.add(time_slot)
+                    availability_index.setdefault(day, {}).setdefault(time_slot, []).append(teacher_name)
+    return availability_index
+
+def find_available_teachers(schedules_data, target_day_of_week, target_time_slot, availability_index=None):
     """
     Finds teachers who are available (e.g., on 'refuerzo' or 'guardia') for a specific time slot.
 
@@ -10,10 +46,15 @@ def find_available_teachers(schedules_data, target_day_of_week, target_time_slot
         schedules_data (list): List of teacher schedule dictionaries.
         target_day_of_week (str): The day to check (e.g., "Lunes").
         target_time_slot (str): The time slot to check (e.g., "08:00-09:00").
+        availability_index (dict, optional): An index built by build_availability_index.
+            When given, the answer is looked up instead of scanning schedules_data.
 
     Returns:
         list: A list of teacher names who are available.
     """
+    if availability_index is not None:
+        return list(availability_index.get(target_day_of_week, {}).get(target_time_slot, []))
+
     available_teachers = []
     for teacher_info in schedules_data:
         teacher_name = teacher_info.get('teacher_name')
@@ -63,6 +104,56 @@ def select_teacher_for_substitution(available_teachers, substitution_counts):
 
     return selected_teacher
 
+def answer_availability_queries(schedules_data, queries, substitution_counts, select_teacher=None):
+    """
+    Answers many availability queries with a single pass over the schedules.
+
+    Only the (day, time slot) pairs asked for are collected, each with the same
+    teachers, in the same order, that find_available_teachers would return.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+        queries (list): (day, time slot, absent teacher or None) tuples.
+        substitution_counts (dict): Teacher names and their substitution counts.
+        select_teacher (callable, optional): Picks the suggestion from a list of names.
+            Defaults to select_teacher_for_substitution with substitution_counts.
+
+    Yields:
+        dict: One answer per query, in order: 'day', 'time', 'absent', 'available'
+            (list of {'name', 'count'} dicts, without the absent teacher) and 'suggested'.
+    """
+    wanted_slots = {}
+    for day, time_slot, _ in queries:
+        wanted_slots.setdefault(day, set()).add(time_slot)
+
+    available_by_slot = {}
+    for teacher_info in schedules_data:
+        teacher_name = teacher_info.get('teacher_name')
+        schedule = teacher_info.get('schedule')
+        if not teacher_name or not schedule:
+            continue
+        for day, time_slots in wanted_slots.items():
+            seen_slots = set()
+            for activity in schedule.get(day) or []:
+                time_slot = activity.get('time')
+                if time_slot not in time_slots or time_slot in seen_slots:
+                    continue
+                if activity.get('type', '').lower() in AVAILABLE_ACTIVITY_TYPES:
+                    seen_slots.add(time_slot)
+                    available_by_slot.setdefault((day, time_slot), []).append(teacher_name)
+
+    if select_teacher is None:
+        select_teacher = lambda names: select_teacher_for_substitution(names, substitution_counts)
+    for day, time_slot, absent_teacher in queries:
+        names = [name for name in available_by_slot.get((day, time_slot), []) if name != absent_teacher]
+        yield {
+            'day': day,
+            'time': time_slot,
+            'absent': absent_teacher,
+            'available': [{'name': name, 'count': substitution_counts.get(name, 0)} for name in names],
+            'suggested': select_teacher(names),
+        }
+
 def record_substitution(teacher_name, substitution_counts):
     """
     Increments the substitution count for a given teacher.
@@ -144,6 +235,29 @@ if __name__ == "__main__":
     assert 'Profesora Sofia' in available
     assert 'Profesor Carlos' not in available # Carlos has class at that time
 
+    print("\n--- Test: Availability Index ---")
+    availability_index = build_availability_index(sample_schedules_data)
+    indexed = find_available_teachers(sample_schedules_data, target_day, target_time, availability_index)
+    print(f"Available teachers (indexed): {indexed}")
+    assert indexed == available, "Index lookup differs from full scan"
+    assert find_available_teachers([], 'Martes', '12:00-13:00', availability_index) == ['Profesor Carlos']
+    assert find_available_teachers([], 'Domingo', '10:00-11:00', availability_index) == []
+
+    print("\n--- Test: Bulk Availability Queries ---")
+    queries = [('Martes', '10:00-11:00', 'Profesor Davila'), ('Martes', '12:00-13:00', None),
+               ('Lunes', '08:00-09:00', None), ('Martes', '10:00-11:00', None)]
+    answers = list(answer_availability_queries(sample_schedules_data, queries, sample_substitution_counts))
+    for answer in answers:
+        print(f"  {answer['day']} {answer['time']} (absent: {answer['absent']}): "
+              f"{[a['name'] for a in answer['available']]} -> {answer['suggested']}")
+    for (day, time_slot, absent_teacher), answer in zip(queries, answers):
+        expected = [name for name in find_available_teachers(sample_schedules_data, day, time_slot)
+                    if name != absent_teacher]
+        assert [a['name'] for a in answer['available']] == expected, (day, time_slot)
+        assert answer['suggested'] == select_teacher_for_substitution(expected, sample_substitution_counts)
+    assert answers[0]['suggested'] == 'Profesora Sofia' and answers[3]['suggested'] == 'Profesor Davila'
+    assert answers[2]['available'] == [] and answers[2]['suggested'] is None
+
     print("\n--- Test: Selecting Teacher for Substitution ---")
     # Expected: Profesor Davila (count 2), Profesora Sofia (count 2). Davila comes first alphabetically.
     # Profesora Elena has count 5.
@@ -0,0 +1,122 @@
+import bisect
+
+import fitz  # PyMuPDF
+
+# Slack, in points, when comparing word positions with the learned grid lines
+GRID_TOLERANCE = 1.0
+
+class TableLayout:
+    """
+    The position of a page's schedule table, learned from page.find_tables() on one page
+    and reused on later pages of the same document.
+
+    Timetable PDFs come from a single generator, so every page draws the same grid in the
+    same place. Once the grid is known, a page's table is read by sorting the words inside
+    it into cells, which skips table detection (character and line analysis of the whole
+    page). A page that doesn't fit the grid is detected and must be parsed normally:
+    extract() then returns None.
+
+    Attributes:
+        bbox (fitz.Rect): The table's bounding box.
+        xs (list): x coordinates of the column boundaries, left to right.
+        ys (list): y coordinates of the row boundaries, top to bottom.
+        header (list): Text of the header row of the page the layout was learned from.
+        merged (set): (row, column) of the grid positions covered by a merged cell.
+    """
+
+    def __init__(self, bbox, xs, ys, header, merged):
+        self.bbox = bbox
+        self.xs = xs
+        self.ys = ys
+        self.header = header
+        self.merged = merged
+
+    @classmethod
+    def learn(cls, table):
+        """
+        Learns the layout of a table found by page.find_tables().
+
+        Args:
+            table (fitz.table.Table): The schedule table.
+
+        Returns:
+            TableLayout: The layout, or None if the table isn't a plain grid.
+        """
+        rows = [row.cells for row in table.rows]
+        xs = sorted({round(cell[x], 2) for row in rows for cell in row if cell for x in (0, 2)})
+        ys = sorted({round(cell[y], 2) for row in rows for cell in row if cell for y in (1, 3)})
+        if len(xs) != table.col_count + 1 or len(ys) != table.row_count + 1:
+            return None # Cells don't line up on a single grid
+        merged = {(row_number, column) for row_number, row in enumerate(rows)
+                  for column, cell in enumerate(row) if cell is None}
+        header = table.extract()[0]
+        return cls(fitz.Rect(xs[0], ys[0], xs[-1], ys[-1]), xs, ys, header, merged)
+
+    def extract(self, page):
+        """
+        Reads the table of a page through the learned grid.
+
+        Args:
+            page (fitz.Page): A page of the document the layout was learned from.
+
+        Returns:
+            list: Rows of cell texts, as fitz.table.Table.extract() returns them, or None if
+                the page doesn't fit the layout (different header, text crossing the grid,
+                or text just below the table, which suggests extra rows).
+        """
+        row_height = self.ys[-1] - self.ys[-2]
+        search_rect = fitz.Rect(self.bbox.x0, self.bbox.y0, self.bbox.x1, self.bbox.y1 + row_height)
+        cells = {}
+        for x0, y0, x1, y1, text, block, line, word in page.get_text("words", clip=search_rect):
+            if (x0 < self.bbox.x0 - GRID_TOLERANCE or x1 > self.bbox.x1 + GRID_TOLERANCE
+                    or y1 > self.bbox.y1 + GRID_TOLERANCE):
+                return None
+            column = bisect.bisect_right(self.xs, (x0 + x1) / 2) - 1
+            row = bisect.bisect_right(self.ys, (y0 + y1) / 2) - 1
+            # A word must sit inside its cell, not across a grid line
+            if x0 < self.xs[column] - GRID_TOLERANCE or x1 > self.xs[column + 1] + GRID_TOLERANCE:
+                return None
+            if (row, column) in self.merged:
+                return None
+            cells.setdefault((row, column), []).append((block, line, word, text))
+
+        table = []
+        for row in range(len(self.ys) - 1):
+            texts = []
+            for column in range(len(self.xs) - 1):
+                if (row, column) in self.merged:
+                    texts.append(None)
+                    continue
+                lines = {}
+                for block, line, word, text in sorted(cells.get((row, column), [])):
+                    lines.setdefault((block, line), []).append(text)
+                texts.append("\n".join(" ".join(words) for words in lines.values()))
+            table.append(texts)
+        if table[0] != self.header:
+            return None
+        return table
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    from benchmarks.synthetic import generate_schedules, write_schedule_pdf
+
+    print("Testing table_layout.py...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "horarios.pdf")
+        write_schedule_pdf(generate_schedules(5, seed=3), pdf_path)
+        doc = fitz.open(pdf_path)
+        layout = TableLayout.learn(doc[0].find_tables()[0])
+        assert layout is not None and len(layout.xs) == 7 and len(layout.ys) == 8
+        # Same cells as full table detection, on every page
+        for page in doc:
+            assert layout.extract(page) == page.find_tables()[0].extract(), page.number
+
+        # A page with an extra row, or without the table, doesn't fit
+        page = doc.new_page()
+        assert layout.extract(page) is None
+        page = doc[1]
+        page.insert_text((layout.bbox.x0 + 3, layout.bbox.y1 + 15), "14:00-15:00", fontsize=9)
+        assert layout.extract(page) is None
+        doc.close()
+    print("\nTable layout tests completed.")
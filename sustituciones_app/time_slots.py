@@ -0,0 +1,195 @@
+import re
+import sys
+import threading
+
+# The school's timetable grid. Slots read from the PDFs are mapped onto these.
+FRANJAS_HORARIAS = ["08:00-09:00", "09:00-10:00", "10:00-11:00", "11:00-12:00", "12:00-13:00", "13:00-14:00", "14:00-15:00"] # Extended example
+
+MAX_MEMO_ENTRIES = 4096 # Distinct cell texts remembered; PDFs from one generator use a handful
+
+# "8:00 - 9:00", "08.00-09.00", "8h-9h", "8:00 a 9:00", "8:00–9:00"...
+_TIME_RANGE = re.compile(r'(\d{1,2})(?:[:.h](\d{2}))?h?\s*(?:-|–|—|a)\s*(\d{1,2})(?:[:.h](\d{2}))?')
+
+def parse_time_range(text):
+    """
+    Reads a time range from a table cell.
+
+    Args:
+        text (str): The cell text (e.g. "8:00 - 9:00\\n").
+
+    Returns:
+        tuple: (start, end) in minutes since midnight, or None if the text holds no valid range.
+    """
+    match = _TIME_RANGE.search(text or "")
+    if match is None:
+        return None
+    start_hour, start_minute, end_hour, end_minute = match.groups()
+    start = int(start_hour) * 60 + int(start_minute or 0)
+    end = int(end_hour) * 60 + int(end_minute or 0)
+    if not (0 <= start < end <= 24 * 60) or int(start_minute or 0) >= 60 or int(end_minute or 0) >= 60:
+        return None
+    return start, end
+
+def format_slot(start, end):
+    """Returns the canonical, interned "HH:MM-HH:MM" form of a range in minutes."""
+    return sys.intern(f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}")
+
+class SlotCatalog:
+    """
+    Maps time ranges onto a grid of canonical slots and gives every slot an integer id.
+
+    Canonical slot strings are interned, so equal slots are the same object and
+    comparing them is a pointer check. Ids follow the order of the grid; slots
+    outside the grid get the next free ids as they are seen.
+    """
+
+    def __init__(self, slots=FRANJAS_HORARIAS):
+        self._lock = threading.Lock()
+        self._ranges = [] # (start, end, canonical slot) of the grid, by start time
+        self._ids = {}
+        self._slots = []
+        for slot in slots:
+            time_range = parse_time_range(slot)
+            if time_range is None:
+                raise ValueError(f"Invalid time slot '{slot}'")
+            canonical = format_slot(*time_range)
+            self.slot_id(canonical)
+            self._ranges.append((time_range[0], time_range[1], canonical))
+        self._ranges.sort()
+        self._memo = {} # raw cell text -> canonical slots
+
+    def slot_id(self, slot):
+        """Returns the integer id of a canonical slot, assigning the next one if it is new."""
+        with self._lock:
+            slot_id = self._ids.get(slot)
+            if slot_id is None:
+                slot_id = self._ids[slot] = len(self._slots)
+                self._slots.append(sys.intern(slot))
+            return slot_id
+
+    def slot_for_id(self, slot_id):
+        """Returns the canonical slot with the given id."""
+        return self._slots[slot_id]
+
+    def _map_range(self, start, end):
+        grid_slots = [slot for slot_start, slot_end, slot in self._ranges if start <= slot_start and slot_end <= end]
+        if grid_slots:
+            # Exact match, or a cell spanning several grid slots (e.g. a two-hour class): one per slot
+            return grid_slots
+        best_overlap, best_slot = 0, None
+        for slot_start, slot_end, slot in self._ranges:
+            overlap = min(end, slot_end) - max(start, slot_start)
+            if overlap > best_overlap:
+                best_overlap, best_slot = overlap, slot
+        if best_slot is not None and best_overlap * 2 >= end - start:
+            # Mostly inside one grid slot (e.g. "08:05-09:00"): that slot; ties go to the earlier one
+            return [best_slot]
+        return [format_slot(start, end)] # Outside the grid: kept as its own slot
+
+    def canonicalize(self, text):
+        """
+        Maps a table cell onto canonical slots.
+
+        Args:
+            text (str): The time cell (e.g. "8:00 - 9:00\\n" or "08:00-10:00").
+
+        Returns:
+            list: Canonical slots: one for a cell matching (or mostly overlapping) a grid slot,
+                several for a cell spanning several grid slots, or the stripped text itself if
+                it holds no time range (None stays None).
+        """
+        slots = self._memo.get(text)
+        if slots is None:
+            time_range = parse_time_range(text)
+            if time_range is not None:
+                slots = self._map_range(*time_range)
+            else:
+                slots = [sys.intern(text.strip())] if isinstance(text, str) else [text]
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            self._memo[text] = slots
+        return list(slots)
+
+_catalog = SlotCatalog()
+
+def canonicalize_slot(text):
+    """Maps a table cell onto the canonical slots of FRANJAS_HORARIAS. See SlotCatalog.canonicalize."""
+    return _catalog.canonicalize(text)
+
+def canonical_time(text):
+    """
+    Returns the canonical form of a single requested slot (e.g. "8:00 - 9:00" -> "08:00-09:00").
+
+    Text that maps onto several slots, or none, is returned stripped but otherwise unchanged.
+    """
+    slots = _catalog.canonicalize(text)
+    return slots[0] if len(slots) == 1 else text.strip()
+
+def slot_id(slot):
+    """Returns the integer id of a canonical slot (the index in FRANJAS_HORARIAS for grid slots)."""
+    return _catalog.slot_id(slot)
+
+def normalize_schedules(schedules_data):
+    """
+    Rewrites the activity times of schedules (e.g. parsed by older versions) in canonical form.
+
+    Activities spanning several slots are split into one activity per slot.
+
+    Args:
+        schedules_data (list): List of teacher schedule dictionaries.
+
+    Returns:
+        tuple: (normalized copy of the schedules, number of activities whose time changed).
+    """
+    changed = 0
+    normalized = []
+    for teacher_info in schedules_data:
+        schedule = {}
+        for day, day_schedule in (teacher_info.get('schedule') or {}).items():
+            activities = []
+            for activity in day_schedule or []:
+                slots = canonicalize_slot(activity.get('time'))
+                if slots != [activity.get('time')]:
+                    changed += 1
+                activities.extend(dict(activity, time=slot) for slot in slots)
+            schedule[day] = activities
+        normalized.append(dict(teacher_info, schedule=schedule))
+    return normalized, changed
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['normalize']:
+        # python -m sustituciones_app.time_slots normalize: rewrites the stored schedules in canonical form
+        from . import data_manager
+        normalized, changed = normalize_schedules(data_manager.load_schedules())
+        if changed:
+            data_manager.save_schedules(normalized)
+        print(f"{changed} activities normalized.")
+        sys.exit(0)
+
+    print("Testing time_slots.py...")
+    assert parse_time_range("8:00 - 9:00\n") == (480, 540)
+    assert parse_time_range("08.30–09.15") == (510, 555)
+    assert parse_time_range("9h a 10h") == (540, 600)
+    assert parse_time_range("Recreo") is None and parse_time_range("10:00-09:00") is None
+
+    catalog = SlotCatalog(["08:00-09:00", "09:00-10:00", "10:00-11:00"])
+    assert catalog.canonicalize("8:00 - 9:00\n") == ["08:00-09:00"]
+    assert catalog.canonicalize("08:00-10:00") == ["08:00-09:00", "09:00-10:00"] # Split
+    assert catalog.canonicalize("08:05-09:00") == ["08:00-09:00"]                # Mostly inside one slot
+    assert catalog.canonicalize("08:30-09:30") == ["08:00-09:00"]                # Tie: earlier slot
+    assert catalog.canonicalize("15:00-16:00") == ["15:00-16:00"]                # Outside the grid
+    assert catalog.canonicalize(" Recreo ") == ["Recreo"]
+    # Interned: canonical slots from different cells are the same object
+    assert catalog.canonicalize("9:00-10:00")[0] is catalog.canonicalize("09:00 - 10:00")[0]
+    assert [catalog.slot_id(slot) for slot in ("08:00-09:00", "09:00-10:00", "10:00-11:00")] == [0, 1, 2]
+    assert catalog.slot_for_id(catalog.slot_id("15:00-16:00")) == "15:00-16:00"
+
+    legacy = [{'teacher_name': 'Profesora Elena', 'schedule': {'Lunes': [
+        {'time': '8:00 - 10:00', 'subject': 'Lengua', 'type': 'clase'},
+        {'time': '10:00-11:00', 'subject': 'GUARDIA', 'type': 'refuerzo'}]}}]
+    normalized, changed = normalize_schedules(legacy)
+    print(f"Normalized: {normalized}")
+    assert changed == 1
+    assert [a['time'] for a in normalized[0]['schedule']['Lunes']] == ["08:00-09:00", "09:00-10:00", "10:00-11:00"]
+    assert legacy[0]['schedule']['Lunes'][0]['time'] == '8:00 - 10:00' # The input is not modified
+    print("\nTime slot tests completed.")